@@ -0,0 +1,11 @@
+"""Benchmarks of the grade computations, views and imports.
+
+Run them from the project directory with:
+
+    python -m benchmarks --students 1000 --output report.json
+
+They use a database of their own (see benchmarks/settings.py), filled with
+a deterministic synthetic gradebook. A report can be compared against a
+stored baseline with --baseline, failing if any benchmark got slower by
+more than the threshold.
+"""
@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+
+import django
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark grade computations, views and imports on a '
+                    'synthetic gradebook.',
+    )
+    parser.add_argument(
+        '--students', type=int, default=1000,
+        help='Number of students in the gradebook (default: 1000)',
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Seed of the gradebook and the samples taken from it',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='Number of times each benchmark is run (default: 5)',
+    )
+    parser.add_argument(
+        '--sample-size', type=int, default=50,
+        help='Number of students the per-student benchmarks work on',
+    )
+    parser.add_argument(
+        '--only', nargs='+', metavar='NAME',
+        help='Run only these benchmarks',
+    )
+    parser.add_argument(
+        '--reuse-db', action='store_true',
+        help='Keep the gradebook of the previous run instead of generating '
+             'it again (it must have been made with the same arguments)',
+    )
+    parser.add_argument(
+        '--output', '-o',
+        help='File to write the JSON report to',
+    )
+    parser.add_argument(
+        '--baseline',
+        help='Report to compare against, failing on regressions',
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.25,
+        help='Slowdown from the baseline counted as a regression, as a '
+             'fraction (default: 0.25)',
+    )
+    parser.add_argument(
+        '--list', action='store_true',
+        help='List the benchmarks and exit',
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+    from . import generator, report, suite
+
+    if args.list:
+        print('\n'.join(suite.BENCHMARKS))
+        return 0
+    unknown = set(args.only or ()) - set(suite.BENCHMARKS)
+    if unknown:
+        print(f'Unknown benchmarks: {", ".join(sorted(unknown))}',
+              file=sys.stderr)
+        return 2
+
+    parameters = {
+        'students': args.students,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'sample_size': args.sample_size,
+    }
+    stats = generator.prepare_database(args.students, args.seed,
+                                       args.reuse_db)
+    if stats:
+        parameters['rows'] = stats['rows']
+        print(f'Generated {args.students} students ({stats["rows"]} rows) '
+              f'in {stats["elapsed"]:.1f}s', file=sys.stderr)
+
+    context = suite.Context(args.sample_size, args.seed)
+    results = {}
+    for name in args.only or suite.BENCHMARKS:
+        results[name] = result = suite.run(name, context, args.repeat)
+        print(f'{name:28} {result.median * 1000:10.3f} ms/op '
+              f'(best {result.min * 1000:.3f}) '
+              f'{result.queries:6} queries/{result.operations} ops',
+              file=sys.stderr)
+
+    current = report.build(results, parameters)
+    if args.output:
+        report.save(current, args.output)
+    if args.baseline:
+        regressions = report.compare(report.load(args.baseline), current,
+                                     args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Deterministic synthetic gradebooks.
+
+The same arguments always give the same rows, so benchmark runs on
+different machines or commits work on identical data.
+"""
+import os
+import random
+import time
+from decimal import Decimal
+from typing import Iterator, List
+
+from django.conf import settings
+from django.core.management import call_command
+
+from core import analytics, models, transcripts
+
+COURSES = (
+    ('CSE115', Decimal('3.0')), ('CSE115L', Decimal('1.0')),
+    ('CSE173', Decimal('3.0')), ('CSE215', Decimal('3.0')),
+    ('CSE215L', Decimal('1.0')), ('CSE225', Decimal('3.0')),
+    ('CSE231', Decimal('3.0')), ('CSE311', Decimal('3.0')),
+    ('CSE323', Decimal('3.0')), ('CSE327', Decimal('3.0')),
+    ('CSE331', Decimal('3.0')), ('CSE373', Decimal('3.0')),
+    ('ENG102', Decimal('3.0')), ('ENG103', Decimal('3.0')),
+    ('MAT116', Decimal('3.0')), ('MAT120', Decimal('3.0')),
+    ('MAT125', Decimal('3.0')), ('MAT130', Decimal('3.0')),
+    ('PHY107', Decimal('3.0')), ('PHY107L', Decimal('1.0')),
+    ('PHY108', Decimal('3.0')), ('CHE101', Decimal('3.0')),
+    ('BIO103', Decimal('3.0')), ('ECO101', Decimal('3.0')),
+    ('HIS103', Decimal('3.0')), ('POL101', Decimal('3.0')),
+    ('BEN205', Decimal('1.5')), ('EEE141', Decimal('3.0')),
+    ('EEE141L', Decimal('1.0')), ('ETE211', Decimal('3.0')),
+)
+
+# Grades roughly as often as they are given
+GRADES = ('A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'F', 'W',
+          'I')
+GRADE_WEIGHTS = (12, 12, 12, 12, 10, 9, 8, 6, 5, 4, 6, 3, 1)
+
+# Retaken by those who got them
+RETAKEN_GRADES = ('F', 'W', 'I', 'D', 'D+', 'C-')
+
+FIRST_YEAR = 10
+LAST_YEAR = 18
+
+
+def trimester_codes(first: int, count: int) -> List[int]:
+    """Codes of count consecutive trimesters from the first one."""
+    codes = []
+    year, number = divmod(first, 10)
+    for _ in range(count):
+        codes.append(year * 10 + number)
+        year, number = (year + 1, 1) if number == 3 else (year, number + 1)
+    return codes
+
+
+def generate(students: int, seed: int = 0,
+             first: int = 0) -> Iterator[transcripts.TranscriptRow]:
+    """Yield the transcript rows of the given number of students, numbered
+    from first.
+
+    Students are spread across the programs and take up to twelve
+    consecutive trimesters of three to five courses. Some courses with low
+    grades are retaken in a later trimester.
+    """
+    rng = random.Random(seed)
+    programs = [program for program, _ in models.Student.PROGRAM_CHOICES]
+    for i in range(first, first + students):
+        nsuid = f'{1000000 + i:07d}'
+        program = programs[i % len(programs)]
+        start = rng.randint(FIRST_YEAR, LAST_YEAR - 4) * 10 + rng.randint(1, 3)
+        codes = trimester_codes(start, rng.randint(1, 12))
+        remaining = list(COURSES)
+        rng.shuffle(remaining)
+        to_retake = []
+        for code in codes:
+            taken = []
+            while to_retake and rng.random() < 0.7 and len(taken) < 2:
+                taken.append(to_retake.pop())
+            for _ in range(rng.randint(3, 5) - len(taken)):
+                if remaining:
+                    taken.append(remaining.pop())
+            for course, credits in taken:
+                grade = rng.choices(GRADES, GRADE_WEIGHTS)[0]
+                if grade in RETAKEN_GRADES and rng.random() < 0.6:
+                    to_retake.insert(0, (course, credits))
+                yield transcripts.TranscriptRow(
+                    nsuid, program, code, course, credits, grade)
+
+
+def populate(students: int, seed: int = 0, batch_size: int = 2000) -> dict:
+    """Write a synthetic gradebook to the database, returning the import
+    statistics."""
+    importer = transcripts.TranscriptImporter(batch_size)
+    for row in generate(students, seed):
+        importer.add(row)
+    importer.flush()
+    analytics.refresh_stale()
+    return dict(importer.stats)
+
+
+def prepare_database(students: int, seed: int = 0,
+                     reuse: bool = False) -> dict:
+    """Create the benchmark database and fill it with a gradebook.
+
+    With reuse, the database of a previous run is kept as it is. Returns
+    the import statistics, and the time the import took.
+    """
+    database = settings.DATABASES['default']['NAME']
+    if not reuse and os.path.exists(database):
+        os.remove(database)
+    call_command('migrate', verbosity=0)
+    if reuse:
+        return {}
+    start = time.perf_counter()
+    stats = populate(students, seed)
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
@@ -0,0 +1,399 @@
+"""End-to-end load test of the web views.
+
+The WSGI application of gradeutils/wsgi.py is served on a local threaded
+server, and a pool of client threads sends it a weighted mix of requests
+over HTTP for a fixed time, each client waiting for its response before
+sending the next request:
+
+    python -m benchmarks.load --clients 8 --mix list=6 detail=3 create=1
+
+The endpoints are StudentList (list), StudentDetail (detail) and
+TrimesterCreate (create), which adds the next trimester of a student. The
+report gives the throughput, latency percentiles and errors of each
+endpoint. Errors raised by the views, such as SQLite's "database is locked",
+are told apart by the server in an X-Load-Error header of the 500 response.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+
+ENDPOINTS = ('list', 'detail', 'create')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.load',
+        description='Load test the web views over HTTP with concurrent '
+                    'clients.',
+    )
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--clients', type=int, default=8,
+        help='Number of concurrent clients (default: 8)',
+    )
+    parser.add_argument(
+        '--seconds', type=float, default=10,
+        help='How long the clients send requests (default: 10)',
+    )
+    parser.add_argument(
+        '--mix', nargs='+', default=['list=6', 'detail=3', 'create=1'],
+        metavar='ENDPOINT=WEIGHT',
+        help='Relative weights of the endpoints in the requests sent '
+             '(default: list=6 detail=3 create=1)',
+    )
+    parser.add_argument(
+        '--profile',
+        help='SQLite profile to run with (default: the one of the settings)',
+    )
+    parser.add_argument(
+        '--port', type=int, default=0,
+        help='Port of the server (default: any free port)',
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=30,
+        help='Seconds before a request is given up on (default: 30)',
+    )
+    parser.add_argument('--reuse-db', action='store_true')
+    parser.add_argument('--output', '-o',
+                        help='File to write the JSON report to')
+    return parser.parse_args(argv)
+
+
+def parse_mix(mix: List[str]) -> Dict[str, float]:
+    weights = {}
+    for item in mix:
+        name, _, weight = item.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f'Unknown endpoint: {name}')
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise ValueError(f'Invalid weight of {name}: {weight}')
+        if weights[name] < 0:
+            raise ValueError(f'Invalid weight of {name}: {weight}')
+    if not any(weights.values()):
+        raise ValueError('No endpoint has a weight')
+    return weights
+
+
+# Exception raised by the view of the request being handled by the thread
+_failure = threading.local()
+
+
+def _record_exception(sender, **kwargs):
+    _failure.exception = sys.exc_info()[1]
+
+
+def error_kind(exception: BaseException) -> str:
+    if 'database is locked' in str(exception):
+        return 'database is locked'
+    return type(exception).__name__
+
+
+def instrumented(application: Callable) -> Callable:
+    """The WSGI application, adding the kind of the exception raised by the
+    view, if any, to the response."""
+    from django.core.signals import got_request_exception
+    got_request_exception.connect(_record_exception)
+
+    def load_test_application(environ, start_response):
+        _failure.exception = None
+
+        def start(status, headers, exc_info=None):
+            if _failure.exception is not None:
+                headers.append(('X-Load-Error',
+                                error_kind(_failure.exception)))
+            return start_response(status, headers, exc_info)
+        return application(environ, start)
+    return load_test_application
+
+
+class Server(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # Room for a connection from every client
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Gradebook:
+    """Students the clients pick from, and the next trimester of each.
+
+    Trimesters are handed out one at a time, so that no two clients add the
+    same one, and a student whose next trimester would not be a valid code
+    is no longer written to.
+    """
+
+    def __init__(self):
+        from django.db.models import Max
+
+        from core import models
+        self.slugs = list(models.Student.objects.order_by('slug')
+                          .values_list('slug', flat=True))
+        self.last = dict(
+            models.Student.objects
+            .annotate(last=Max('trimester__code'))
+            .values_list('slug', 'last'))
+        self.writable = [slug for slug in self.slugs
+                         if self.last[slug] is not None]
+        self.lock = threading.Lock()
+
+    def next_trimester(self, rng: random.Random) -> Optional[Tuple[str, int]]:
+        from django.core.exceptions import ValidationError
+
+        from core import models
+        with self.lock:
+            while self.writable:
+                i = rng.randrange(len(self.writable))
+                slug = self.writable[i]
+                code = models.Trimester.next_code(self.last[slug])
+                try:
+                    models.validate_trimester_code(code)
+                except ValidationError:
+                    self.writable[i] = self.writable[-1]
+                    self.writable.pop()
+                    continue
+                self.last[slug] = code
+                return slug, code
+        return None
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    body: Optional[str] = None
+
+
+def make_request(endpoint: str, gradebook: Gradebook,
+                 rng: random.Random) -> Optional[Request]:
+    if endpoint == 'list':
+        # The first page by CGPA, or a page by NSU ID from anywhere
+        if rng.random() < 0.5:
+            return Request('GET', '/students/?sort=cgpa')
+        query = urlencode({'after': rng.choice(gradebook.slugs)})
+        return Request('GET', f'/students/?{query}')
+    if endpoint == 'detail':
+        return Request('GET', f'/students/{rng.choice(gradebook.slugs)}/')
+    trimester = gradebook.next_trimester(rng)
+    if trimester is None:
+        return None
+    slug, code = trimester
+    return Request('POST', f'/students/{slug}/new-trimester/', urlencode({
+        'student': slug,
+        'code': code,
+        'action-type': 'add-next-trimester',
+    }))
+
+
+class Client(threading.Thread):
+
+    def __init__(self, address: Tuple[str, int], gradebook: Gradebook,
+                 weights: Dict[str, float], seed: int, deadline: float,
+                 timeout: float):
+        super().__init__()
+        self.address = address
+        self.gradebook = gradebook
+        self.endpoints = list(weights)
+        self.weights = list(weights.values())
+        self.rng = random.Random(seed)
+        self.deadline = deadline
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = {
+            endpoint: [] for endpoint in self.endpoints}
+        self.errors: Dict[str, Counter] = {
+            endpoint: Counter() for endpoint in self.endpoints}
+        # The cookie and token a browser would have from the page of the
+        # form; any matching pair passes the CSRF check
+        from django.utils.crypto import get_random_string
+        self.csrf_token = get_random_string(64)
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            request = make_request(endpoint, self.gradebook, self.rng)
+            if request is None:
+                # No trimester is left to add
+                i = self.endpoints.index(endpoint)
+                del self.endpoints[i], self.weights[i]
+                if not any(self.weights):
+                    break
+                continue
+            start = time.perf_counter()
+            error = self.send(request)
+            self.latencies[endpoint].append(time.perf_counter() - start)
+            if error:
+                self.errors[endpoint][error] += 1
+
+    def send(self, request: Request) -> Optional[str]:
+        """Send the request, returning the kind of error it met if any."""
+        headers = {
+            'Cookie': f'csrftoken={self.csrf_token}',
+            'X-CSRFToken': self.csrf_token,
+        }
+        if request.body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection = http.client.HTTPConnection(*self.address,
+                                                timeout=self.timeout)
+        try:
+            connection.request(request.method, request.path, request.body,
+                               headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as error:
+            return type(error).__name__
+        finally:
+            connection.close()
+        if response.status >= 400:
+            return (response.getheader('X-Load-Error')
+                    or f'HTTP {response.status}')
+        return None
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1,
+                      max(0, round(fraction * len(values) + 0.5) - 1))]
+
+
+def summarize(latencies: List[float], errors: Counter,
+              elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    failed = sum(errors.values())
+    return {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_ms': {
+            'mean': (sum(latencies) / len(latencies) * 1000
+                     if latencies else 0.0),
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        'errors': dict(errors),
+        'error_rate': failed / len(latencies) if latencies else 0.0,
+    }
+
+
+def run(args, weights: Dict[str, float]) -> dict:
+    from django.db import connection
+
+    from gradeutils.wsgi import application
+
+    gradebook = Gradebook()
+    connection.close()
+    server = make_server('127.0.0.1', args.port, instrumented(application),
+                         server_class=Server, handler_class=QuietHandler)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    try:
+        start = time.perf_counter()
+        clients = [
+            Client(server.server_address, gradebook, weights, args.seed + i,
+                   start + args.seconds, args.timeout)
+            for i in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    results = {
+        endpoint: summarize(
+            [latency for client in clients
+             for latency in client.latencies[endpoint]],
+            sum((client.errors[endpoint] for client in clients), Counter()),
+            elapsed,
+        )
+        for endpoint in weights
+    }
+    results['total'] = summarize(
+        [latency for client in clients
+         for latencies in client.latencies.values()
+         for latency in latencies],
+        sum((errors for client in clients
+             for errors in client.errors.values()), Counter()),
+        elapsed,
+    )
+    return {'seconds': elapsed, 'endpoints': results}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connections
+
+    from gradeutils import sqlite
+
+    from . import generator
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    if args.profile is not None:
+        if args.profile not in sqlite.PROFILES:
+            print(f'Unknown profile: {args.profile}', file=sys.stderr)
+            return 2
+        settings.GRADEUTILS_SQLITE_PROFILE = args.profile
+        connections.databases['default']['CONN_MAX_AGE'] = (
+            sqlite.conn_max_age(args.profile))
+
+    generator.prepare_database(args.students, args.seed, args.reuse_db)
+    result = run(args, weights)
+    for endpoint, summary in result['endpoints'].items():
+        latency = summary['latency_ms']
+        print(f'{endpoint:8} {summary["requests_per_second"]:8.1f} req/s '
+              f'p50 {latency["p50"]:8.1f} ms p95 {latency["p95"]:8.1f} ms '
+              f'p99 {latency["p99"]:8.1f} ms '
+              f'{summary["error_rate"]:7.2%} errors', file=sys.stderr)
+        for kind, count in sorted(summary['errors'].items()):
+            print(f'{"":8} {count:8} {kind}', file=sys.stderr)
+
+    report = {
+        'parameters': {
+            'students': args.students,
+            'seed': args.seed,
+            'clients': args.clients,
+            'seconds': args.seconds,
+            'mix': weights,
+            'profile': getattr(settings, 'GRADEUTILS_SQLITE_PROFILE', None),
+        },
+        'results': result,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""JSON reports of benchmark runs, and their comparison with a baseline."""
+import datetime as dt
+import json
+import platform
+from typing import Dict, List, NamedTuple
+
+import django
+
+from .suite import Result
+
+VERSION = 1
+
+
+def build(results: Dict[str, Result], parameters: dict) -> dict:
+    """Report of the results of a run with the given parameters."""
+    return {
+        'version': VERSION,
+        'created': dt.datetime.now(dt.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'parameters': parameters,
+        'results': {name: result.as_dict()
+                    for name, result in results.items()},
+    }
+
+
+def load(path: str) -> dict:
+    with open(path, encoding='utf-8') as stream:
+        report = json.load(stream)
+    if report.get('version') != VERSION:
+        raise ValueError(f'{path} is not a version {VERSION} report')
+    return report
+
+
+def save(report: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(report, stream, indent=2, sort_keys=True)
+        stream.write('\n')
+
+
+class Regression(NamedTuple):
+    name: str
+    metric: str
+    baseline: float
+    current: float
+    limit: float
+
+    def __str__(self):
+        return (f'{self.name}: {self.metric} {self.current:.6g} exceeds '
+                f'{self.limit:.6g} (baseline {self.baseline:.6g})')
+
+
+def compare(baseline: dict, report: dict,
+            threshold: float = 0.25) -> List[Regression]:
+    """Regressions of a report from a baseline.
+
+    A benchmark regresses if its best time per operation is more than
+    threshold (a fraction) above the baseline's, or if it runs more queries
+    per run. The best time is compared as it is the least affected by other
+    load on the machine. A baseline may set the threshold of single
+    benchmarks in a `thresholds` mapping. Benchmarks missing from either
+    report are skipped.
+    """
+    thresholds = baseline.get('thresholds', {})
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        limit = base['min'] * (1 + thresholds.get(name, threshold))
+        if result['min'] > limit:
+            regressions.append(Regression(
+                name, 'min', base['min'], result['min'], limit))
+        if result['queries'] > base['queries']:
+            regressions.append(Regression(
+                name, 'queries', base['queries'], result['queries'],
+                base['queries']))
+    return regressions
@@ -0,0 +1,24 @@
+"""Settings for running the benchmarks against a database of their own."""
+import os
+import tempfile
+
+from gradeutils import sqlite
+from gradeutils.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'GRADEUTILS_BENCHMARK_DB',
+            os.path.join(tempfile.gettempdir(),
+                         'gradeutils-benchmark.sqlite3'),
+        ),
+        'CONN_MAX_AGE': sqlite.conn_max_age(
+            GRADEUTILS_SQLITE_PROFILE),  # noqa: F405
+    }
+}
+
+DEBUG = False
+
+# The test client, and the local server of benchmarks.load
+ALLOWED_HOSTS = ['testserver', '127.0.0.1']
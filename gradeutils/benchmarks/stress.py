@@ -0,0 +1,169 @@
+"""Concurrent read/write stress test of the SQLite profiles.
+
+Reader threads load student timelines while writer threads save courses,
+each operation standing for a request (connections are closed or kept
+between them as CONN_MAX_AGE says). Each profile is run in turn on the same
+gradebook:
+
+    python -m benchmarks.stress --profiles development production
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import django
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.stress',
+        description='Compare the read/write throughput of SQLite profiles.',
+    )
+    parser.add_argument(
+        '--profiles', nargs='+', default=['development', 'production'],
+        help='Profiles to run (default: development production)',
+    )
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument(
+        '--seconds', type=float, default=10,
+        help='How long each profile is run (default: 10)',
+    )
+    parser.add_argument('--reuse-db', action='store_true')
+    parser.add_argument('--output', '-o',
+                        help='File to write the JSON report to')
+    return parser.parse_args(argv)
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, operation, slugs, seed: int, stop: threading.Event):
+        super().__init__()
+        self.operation = operation
+        self.slugs = slugs
+        self.rng = random.Random(seed)
+        self.stop = stop
+        self.operations = 0
+        self.errors = 0
+
+    def run(self):
+        from django.db import DatabaseError, close_old_connections, connection
+        try:
+            while not self.stop.is_set():
+                # As around each request
+                close_old_connections()
+                try:
+                    self.operation(self.rng.choice(self.slugs), self.rng)
+                    self.operations += 1
+                except DatabaseError:
+                    self.errors += 1
+                close_old_connections()
+        finally:
+            connection.close()
+
+
+def read(slug: str, rng: random.Random):
+    from core import models
+    models.Student.objects.get(slug=slug).timeline()
+
+
+def write(slug: str, rng: random.Random):
+    from core import models
+    course = (models.Course.objects
+              .filter(trimester__student__slug=slug).order_by('?').first())
+    if course is not None:
+        course.grade = rng.choice(('A', 'B', 'C', 'D', 'F'))
+        course.save()
+
+
+def run_profile(profile: str, slugs, args) -> dict:
+    from django.conf import settings
+    from django.db import connection, connections
+
+    from gradeutils import sqlite
+
+    # New connections, including the ones of the worker threads, pick up the
+    # profile
+    connection.close()
+    settings.GRADEUTILS_SQLITE_PROFILE = profile
+    connections.databases['default']['CONN_MAX_AGE'] = sqlite.conn_max_age(
+        profile)
+    connection.ensure_connection()
+    connection.close()
+
+    stop = threading.Event()
+    workers = (
+        [Worker(read, slugs, args.seed + i, stop)
+         for i in range(args.readers)]
+        + [Worker(write, slugs, args.seed + args.readers + i, stop)
+           for i in range(args.writers)]
+    )
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    readers, writers = workers[:args.readers], workers[args.readers:]
+    return {
+        'reads_per_second': sum(w.operations for w in readers) / elapsed,
+        'writes_per_second': sum(w.operations for w in writers) / elapsed,
+        'errors': sum(w.errors for w in workers),
+        'seconds': elapsed,
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+    from core import models
+    from gradeutils import sqlite
+
+    from . import generator
+
+    unknown = set(args.profiles) - set(sqlite.PROFILES)
+    if unknown:
+        print(f'Unknown profiles: {", ".join(sorted(unknown))}',
+              file=sys.stderr)
+        return 2
+
+    generator.prepare_database(args.students, args.seed, args.reuse_db)
+    slugs = list(models.Student.objects.values_list('slug', flat=True))
+
+    results = {}
+    for profile in args.profiles:
+        results[profile] = result = run_profile(profile, slugs, args)
+        print(f'{profile:12} {result["reads_per_second"]:10.1f} reads/s '
+              f'{result["writes_per_second"]:8.1f} writes/s '
+              f'{result["errors"]:5} errors', file=sys.stderr)
+
+    report = {
+        'parameters': {
+            'students': args.students,
+            'seed': args.seed,
+            'readers': args.readers,
+            'writers': args.writers,
+            'seconds': args.seconds,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
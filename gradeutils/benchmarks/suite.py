@@ -0,0 +1,285 @@
+"""The benchmarks, and the runner timing them.
+
+A benchmark is a function registered with @benchmark. It is given the
+Context and does its setup, then returns the function to be timed, which
+returns the number of operations it performed.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from core import cache, cohort, models, snapshot, transcripts
+from gradeutils import grading
+
+from . import generator
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    """Register a benchmark under a name."""
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class Context:
+    """What the benchmarks work on: the database and a sample of it."""
+
+    def __init__(self, sample_size: int = 50, seed: int = 0):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        slugs = list(models.Student.objects.order_by('slug')
+                     .values_list('slug', flat=True))
+        self.students = len(slugs)
+        self.slugs = self.rng.sample(slugs, min(sample_size, len(slugs)))
+        self.client = Client()
+
+
+class Result(NamedTuple):
+    """Timings of a benchmark, in seconds per operation."""
+
+    median: float
+    min: float
+    max: float
+    operations: int  # per run
+    queries: int  # per run
+    repeat: int
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run(name: str, context: Context, repeat: int = 5) -> Result:
+    """Time a benchmark, repeat times."""
+    timed = BENCHMARKS[name](context)
+    timings = []
+    for _ in range(repeat):
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            start = time.perf_counter()
+            operations = timed() or 1
+            timings.append((time.perf_counter() - start) / operations)
+    return Result(
+        median=statistics.median(timings),
+        min=min(timings),
+        max=max(timings),
+        operations=operations,
+        queries=queries.count,
+        repeat=repeat,
+    )
+
+
+def run_all(context: Context, names: List[str] = None,
+            repeat: int = 5) -> Dict[str, Result]:
+    return {name: run(name, context, repeat) for name in names or BENCHMARKS}
+
+
+@benchmark('cgpa.annotation')
+def cgpa_annotation(context: Context):
+    def timed():
+        return len(list(models.Student.objects.with_cgpa()
+                        .values_list('cgpa_value', flat=True)))
+    return timed
+
+
+@benchmark('gpa.annotation')
+def gpa_annotation(context: Context):
+    def timed():
+        return len(list(models.Trimester.objects.with_gpa()
+                        .values_list('gpa_value', flat=True)))
+    return timed
+
+
+@benchmark('cgpa.rebuild')
+def cgpa_rebuild(context: Context):
+    def timed():
+        models.rebuild_grade_totals(commit=False)
+        return models.Student.objects.count()
+    return timed
+
+
+@benchmark('cgpa.cohort')
+def cgpa_cohort(context: Context):
+    def timed():
+        return len(cohort.compute())
+    return timed
+
+
+@benchmark('cgpa.timeline')
+def cgpa_timeline(context: Context):
+    students = list(models.Student.objects.filter(slug__in=context.slugs))
+
+    def timed():
+        for student in students:
+            student.timeline()
+        return len(students)
+    return timed
+
+
+@benchmark('cgpa.grading')
+def cgpa_grading(context: Context):
+    takes = {}
+    for student_id, trimester, code, credits, grade in (
+            models.Course.objects
+            .filter(trimester__student__slug__in=context.slugs)
+            .values_list('trimester__student_id', 'trimester__code', 'code',
+                         'credits', 'grade')):
+        takes.setdefault(student_id, []).append(grading.Take(
+            trimester, code, grading.scale_credits(credits), grade))
+
+    def timed():
+        for student_takes in takes.values():
+            grading.cumulative_grade_point_average(student_takes)
+        return len(takes)
+    return timed
+
+
+@benchmark('course.save')
+def course_save(context: Context):
+    courses = list(models.Course.objects.filter(
+        trimester__student__slug__in=context.slugs))
+    courses = context.rng.sample(courses, min(50, len(courses)))
+
+    def timed():
+        # Rolled back, so that every run saves the same changes
+        with transaction.atomic():
+            for course in courses:
+                course.grade = 'A' if course.grade != 'A' else 'F'
+                course.save()
+            transaction.set_rollback(True)
+        return len(courses)
+    return timed
+
+
+@benchmark('course.save_retake')
+def course_save_retake(context: Context):
+    # A course of each student taken again in their last trimester
+    retakes = []
+    for student in models.Student.objects.filter(slug__in=context.slugs):
+        trimesters = list(student.trimesters.order_by('code'))
+        if len(trimesters) < 2:
+            continue
+        taken = set(trimesters[-1].courses.values_list('code', flat=True))
+        earlier = (models.Course.objects
+                   .filter(trimester__in=trimesters[:-1])
+                   .exclude(code__in=taken).first())
+        if earlier is not None:
+            retakes.append((trimesters[-1], earlier))
+
+    def timed():
+        with transaction.atomic():
+            for trimester, earlier in retakes:
+                models.Course(trimester=trimester, code=earlier.code,
+                              credits=earlier.credits, grade='A').save()
+            transaction.set_rollback(True)
+        return len(retakes)
+    return timed
+
+
+def _get(context: Context, urls: List[str], cached: bool):
+    def timed():
+        for url in urls:
+            if not cached:
+                cache.bump_all()
+            response = context.client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return len(urls)
+    return timed
+
+
+@benchmark('view.student_detail')
+def student_detail(context: Context):
+    return _get(context, [reverse('student-detail', args=[slug])
+                          for slug in context.slugs], cached=False)
+
+
+@benchmark('view.student_detail.cached')
+def student_detail_cached(context: Context):
+    return _get(context, [reverse('student-detail', args=[slug])
+                          for slug in context.slugs], cached=True)
+
+
+@benchmark('view.student_list')
+def student_list(context: Context):
+    url = reverse('student-list')
+    urls = [url, f'{url}?sort=cgpa', f'{url}?program=CSE']
+    urls += [f'{url}?after={slug}' for slug in context.slugs[:10]]
+    urls += [f'{url}?q={slug[:4]}' for slug in context.slugs[:10]]
+    return _get(context, urls, cached=False)
+
+
+@benchmark('api.transcript')
+def api_transcript(context: Context):
+    return _get(context, [reverse('api-student-transcript', args=[slug])
+                          for slug in context.slugs], cached=False)
+
+
+def _snapshot_path(context: Context) -> str:
+    return os.path.join(tempfile.gettempdir(),
+                        f'gradeutils-benchmark-{context.seed}.snapshot')
+
+
+@benchmark('snapshot.build')
+def snapshot_build(context: Context):
+    def timed():
+        return snapshot.build(_snapshot_path(context)).students
+    return timed
+
+
+@benchmark('snapshot.transcript')
+def snapshot_transcript(context: Context):
+    snapshot.build(_snapshot_path(context))
+    gradebook = snapshot.Snapshot(_snapshot_path(context))
+
+    def timed():
+        for slug in context.slugs:
+            gradebook.transcript(slug)
+        return len(context.slugs)
+    return timed
+
+
+def _import(rows: list):
+    def timed():
+        # Rolled back, so that every run imports into the same database
+        with transaction.atomic():
+            importer = transcripts.TranscriptImporter(2000)
+            for row in rows:
+                importer.add(row)
+            importer.flush()
+            transaction.set_rollback(True)
+        return len(rows)
+    return timed
+
+
+@benchmark('import.new')
+def import_new(context: Context):
+    return _import(list(generator.generate(
+        200, seed=context.seed + 1, first=context.students)))
+
+
+@benchmark('import.unchanged')
+def import_unchanged(context: Context):
+    return _import([
+        row for row in generator.generate(context.students, context.seed)
+        if models.Student.make_slug(row.nsuid, row.program) in context.slugs
+    ])
@@ -1,30 +1,166 @@
 import nested_admin
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Prefetch
 
-from . import models
+from gradeutils import grading
+
+from . import analytics, cache, models
 
 admin.site.site_header = 'NSU Grade Utils - Admin'
 admin.site.site_title = 'NSU Grade Utils'
 admin.site.index_title = 'Admin'
 
 
+class FormSetObjectField(forms.ModelChoiceField):
+    """Primary key field of the forms of a model formset, looking objects
+    up among those of the formset rather than with a query each time."""
+
+    def __init__(self, formset, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.formset = formset
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            pk = self.queryset.model._meta.pk.to_python(value)
+        except ValidationError:
+            pk = None
+        obj = self.formset._existing_object(pk)
+        if obj is None:
+            raise ValidationError(self.error_messages['invalid_choice'],
+                                  code='invalid_choice')
+        return obj
+
+
+class InlineFormSet(nested_admin.NestedInlineFormSet):
+    """Nested inline formset looking the objects of submitted forms up once,
+    in the inline's queryset.
+
+    nested_admin looks them up anywhere, and again for every form saved, so
+    that objects dragged from one parent to another can be saved. Neither
+    trimesters nor courses can be.
+    """
+
+    def get_queryset(self):
+        # The queryset of the inline, its prefetches included, filtered by
+        # parent
+        return super(nested_admin.formsets.NestedInlineFormSetMixin,
+                     self).get_queryset()
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        name = self._pk_field.name
+        field = form.fields[name]
+        form.fields[name] = FormSetObjectField(
+            self, field.queryset, initial=field.initial, required=False,
+            widget=field.widget)
+
+    def save_existing_objects(self, initial_forms=None, commit=True):
+        # As BaseModelFormSet does, with the objects found on validation
+        saved = []
+        for form in initial_forms or []:
+            obj = form.instance
+            if obj.pk is None:
+                continue
+            if form in self.deleted_forms:
+                self.deleted_objects.append(obj)
+                self.delete_existing(obj, commit=commit)
+            elif form.has_changed():
+                self.changed_objects.append((obj, form.changed_data))
+                saved.append(self.save_existing(form, obj, commit=commit))
+                if not commit:
+                    self.saved_forms.append(form)
+        return saved
+
+
+class CourseFormSet(InlineFormSet):
+
+    def get_queryset(self):
+        # Use the courses prefetched along with the trimesters, rather than
+        # a query per trimester
+        prefetched = getattr(self.instance, '_prefetched_objects_cache', {})
+        if 'courses' not in prefetched:
+            return super().get_queryset()
+        return prefetched['courses']
+
+
 class CourseInline(nested_admin.NestedTabularInline):
     model = models.Course
+    formset = CourseFormSet
     fields = ['code', 'credits', 'grade']
     extra = 0
 
 
 class TrimesterInline(nested_admin.NestedStackedInline):
     model = models.Trimester
+    formset = InlineFormSet
     inlines = [CourseInline]
     fields = ['code']
     sortable_field_name = 'code'
+    classes = ['collapse']
     extra = 0
 
+    def get_queryset(self, request):
+        return (
+            super().get_queryset(request)
+            .select_related('student')
+            .prefetch_related(Prefetch(
+                'courses', queryset=models.Course.objects.order_by('pk')))
+        )
+
 
 class StudentAdmin(nested_admin.NestedModelAdmin):
     fields = ['nsuid', 'program']
     inlines = [TrimesterInline]
+    list_display = ['nsuid', 'program', 'stored_cgpa', 'credits',
+                    'trimester_count']
+    list_filter = ['program']
+    search_fields = ['nsuid']
+    # Counting every student for the "Show all" link is not worth a query
+    show_full_result_count = False
+    actions = ['recompute_grade_totals']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            trimester_count=Count('trimester'))
+
+    def credits(self, student):
+        return grading.to_credits(student.counted_credits)
+    credits.admin_order_field = 'counted_credits'
+
+    def trimester_count(self, student):
+        return student.trimester_count
+    trimester_count.admin_order_field = 'trimester_count'
+    trimester_count.short_description = 'trimesters'
+
+    def save_related(self, request, form, formsets, change):
+        # The courses are saved without updating the stored totals, retakes
+        # and cached pages one by one; those are brought up to date in a
+        # single pass
+        with models.deferred_grade_totals([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
+    def recompute_grade_totals(self, request, queryset):
+        students = models.Student.objects.filter(
+            pk__in=list(queryset.values_list('pk', flat=True)))
+        with transaction.atomic():
+            changed = models.resolve_retakes(students, adjust_totals=False)
+            stale = models.rebuild_grade_totals(students)
+        if changed or stale:
+            cache.bump_students(*students.values_list('slug', flat=True))
+            analytics.mark_stale(
+                set(students.values_list('program', flat=True)))
+        self.message_user(
+            request,
+            f'Grade totals recomputed for {students.count()} students '
+            f'({changed} courses changed, {len(stale)} totals rebuilt)',
+        )
+    recompute_grade_totals.short_description = (
+        'Recompute grade totals of selected students')
 
 
 admin.site.register(models.Student, StudentAdmin)
@@ -0,0 +1,275 @@
+"""Program-wide CGPA distributions, percentile ranks and top-N lists.
+
+Ranks are computed with SQL window functions over the stored CGPAs of a
+program's students, and kept in the StudentRank and ProgramSummary tables.
+When grades change, the students concerned are re-ranked once the change is
+committed, or by the recompute worker when recomputes are queued (see
+core/jobs.py). A student whose CGPA changed is moved among the others of
+their program, which only changes the ranks and percentiles of the students
+between their old and new CGPAs. A program is recomputed as a whole when
+the number of its ranked students changes, since that changes every
+percentile, or when it was marked stale by a bulk change. Reads never
+recompute a program that was computed before, so reading the rank of a
+student is a single indexed read.
+
+Students without graded credits are not ranked.
+"""
+from decimal import Decimal
+from typing import Iterable, List, NamedTuple, Optional
+
+from django.db import transaction
+from django.db.models import (Case, Count, DecimalField, F, IntegerField,
+                              Value, When, Window)
+from django.db.models.functions import Cast, PercentRank, Rank
+from django.utils import timezone
+
+from gradeutils import grading
+
+from . import models
+
+# Histogram buckets, in grade points
+BUCKET_WIDTH = Decimal('0.25')
+BUCKETS = int(4 / BUCKET_WIDTH)
+
+
+class Bucket(NamedTuple):
+    """Number of students with a CGPA from low to below high (or up to 4)."""
+
+    low: Decimal
+    high: Decimal
+    students: int
+
+
+def mark_stale(programs: Iterable[str] = None, refresh: bool = True):
+    """Mark the summaries of the programs (or all of them) stale.
+
+    Unless refresh is False, or recomputes are queued for the worker, the
+    programs are then recomputed once the current transaction commits.
+    """
+    programs = None if programs is None else set(programs)
+    summaries = models.ProgramSummary.objects.all()
+    if programs is not None:
+        summaries = summaries.filter(program__in=programs)
+    summaries.filter(stale=False).update(stale=True)
+    if refresh and not models.recompute_queued():
+        transaction.on_commit(lambda: refresh_stale(programs))
+
+
+def _percentile(lower: int, students: int) -> Decimal:
+    """Percentage of the other students with a lower CGPA, as PercentRank
+    gives it."""
+    fraction = lower / (students - 1) if students > 1 else 0
+    return Decimal(fraction * 100).quantize(Decimal('0.01'))
+
+
+def _mean(cgpa_total: int, students: int) -> Decimal:
+    return grading.to_decimal(
+        round(Decimal(cgpa_total) / students) if students else 0)
+
+
+@transaction.atomic
+def refresh(program: str) -> models.ProgramSummary:
+    """Recompute the ranks and summary of a program."""
+    students = (
+        models.Student.objects
+        .filter(program=program, counted_credits__gt=0)
+        .annotate(
+            # Not named after the reverse relation to StudentRank
+            cgpa_rank=Window(Rank(), order_by=F('stored_cgpa').desc()),
+            cgpa_percentile=Window(PercentRank(),
+                                   order_by=F('stored_cgpa').asc()),
+        )
+        .values_list('pk', 'stored_cgpa', 'cgpa_rank', 'cgpa_percentile')
+    )
+    summary, _ = models.ProgramSummary.objects.get_or_create(program=program)
+    ranks = [
+        models.StudentRank(
+            student_id=pk,
+            program=summary,
+            cgpa=cgpa,
+            rank=rank,
+            percentile=Decimal(percentile * 100).quantize(Decimal('0.01')),
+        )
+        for pk, cgpa, rank, percentile in students
+    ]
+    models.StudentRank.objects.filter(program=summary).delete()
+    models.StudentRank.objects.bulk_create(ranks, batch_size=500)
+
+    summary.students = len(ranks)
+    summary.cgpa_total = sum(int(rank.cgpa * 100) for rank in ranks)
+    summary.mean_cgpa = _mean(summary.cgpa_total, summary.students)
+    summary.stale = False
+    summary.refreshed = timezone.now()
+    summary.save()
+    return summary
+
+
+def update_ranks(students: Iterable[int]):
+    """Re-rank the students (primary keys) once the current transaction
+    commits (see rerank)."""
+    students = set(students)
+    transaction.on_commit(lambda: rerank(students))
+
+
+@transaction.atomic
+def rerank(students: Iterable[int]) -> List[str]:
+    """Bring the ranks of the students (primary keys) up to date with their
+    stored CGPAs, returning the programs recomputed as a whole.
+
+    Students whose CGPA changed are moved among the others of their
+    program. The programs students joined or left the ranks of, by their
+    first graded course or a change of program, are recomputed as a whole,
+    as are the programs marked stale. Programs never computed are left to
+    be computed when first read.
+    """
+    students = set(students)
+    current = {
+        pk: (program, cgpa) for pk, program, cgpa in
+        models.Student.objects.filter(pk__in=students, counted_credits__gt=0)
+        .values_list('pk', 'program', 'stored_cgpa')
+    }
+    ranked = {
+        pk: (program, cgpa) for pk, program, cgpa in
+        models.StudentRank.objects.filter(student__in=students)
+        .values_list('student_id', 'program_id', 'cgpa')
+    }
+    summaries = models.ProgramSummary.objects.in_bulk(
+        {program for program, _ in (*current.values(), *ranked.values())})
+
+    whole, left, moves = set(), set(), []
+    for pk in students:
+        new, old = current.get(pk), ranked.get(pk)
+        if new == old:
+            continue
+        if old is None or new is None or old[0] != new[0]:
+            whole.update(ranks[0] for ranks in (old, new) if ranks)
+            if old is not None:
+                left.add(pk)
+        else:
+            moves.append((pk, new[0], old[1], new[1]))
+    whole.update(program for program, summary in summaries.items()
+                 if summary.stale)
+    whole &= set(summaries)
+
+    # Left first, so that refreshing the program joined does not clash with
+    # the rank kept in the program left
+    models.StudentRank.objects.filter(student__in=left).delete()
+    for program in sorted(whole):
+        refresh(program)
+    moved = set()
+    for pk, program, old, new in moves:
+        if program in summaries and program not in whole:
+            _move(summaries[program], pk, old, new)
+            moved.add(program)
+    for program in moved:
+        summaries[program].save(update_fields=['cgpa_total', 'mean_cgpa'])
+    return sorted(whole)
+
+
+def _move(summary: models.ProgramSummary, student: int, old: Decimal,
+          new: Decimal):
+    """Move a ranked student of the program from their old CGPA to the new
+    one, updating the summary in memory."""
+    ranks = models.StudentRank.objects.filter(program=summary)
+    others = ranks.exclude(student=student)
+    # The students between the two CGPAs take the place the student left,
+    # or give up theirs to the student
+    if new > old:
+        others.filter(cgpa__gte=old, cgpa__lt=new).update(
+            rank=F('rank') + 1)
+    else:
+        others.filter(cgpa__gte=new, cgpa__lt=old).update(
+            rank=F('rank') - 1)
+    ranks.filter(student=student).update(
+        cgpa=new, rank=others.filter(cgpa__gt=new).count() + 1)
+
+    # Only the percentiles of the CGPAs in between change, the student's
+    # own included
+    low, high = min(old, new), max(old, new)
+    between = ranks.filter(cgpa__gte=low, cgpa__lte=high)
+    lower = ranks.filter(cgpa__lt=low).count()
+    percentiles = []
+    for cgpa, count in (between.values('cgpa').annotate(count=Count('pk'))
+                        .values_list('cgpa', 'count').order_by('cgpa')):
+        percentiles.append(When(
+            cgpa=cgpa, then=Value(_percentile(lower, summary.students))))
+        lower += count
+    between.update(percentile=Case(
+        *percentiles, default=F('percentile'),
+        output_field=DecimalField(max_digits=5, decimal_places=2)))
+
+    summary.cgpa_total += int((new - old) * 100)
+    summary.mean_cgpa = _mean(summary.cgpa_total, summary.students)
+
+
+def refresh_stale(programs: Iterable[str] = None) -> List[str]:
+    """Recompute the programs (or all of them) that are stale or were never
+    computed, returning their names."""
+    programs = set(programs if programs is not None
+                   else dict(models.Student.PROGRAM_CHOICES))
+    fresh = set(models.ProgramSummary.objects
+                .filter(program__in=programs, stale=False)
+                .values_list('program', flat=True))
+    stale = sorted(programs - fresh)
+    for program in stale:
+        refresh(program)
+    return stale
+
+
+def refresh_missing(programs: Iterable[str] = None) -> List[str]:
+    """Compute the programs (or all of them) that were never computed,
+    returning their names."""
+    programs = set(programs if programs is not None
+                   else dict(models.Student.PROGRAM_CHOICES))
+    computed = set(models.ProgramSummary.objects
+                   .filter(program__in=programs)
+                   .values_list('program', flat=True))
+    missing = sorted(programs - computed)
+    for program in missing:
+        refresh(program)
+    return missing
+
+
+def summary(program: str) -> models.ProgramSummary:
+    """Summary of a program."""
+    refresh_missing([program])
+    return models.ProgramSummary.objects.get(program=program)
+
+
+def student_rank(student: models.Student) -> Optional[models.StudentRank]:
+    """Rank of a student, or None if they are not ranked."""
+    ranks = models.StudentRank.objects.select_related('student', 'program')
+    rank = ranks.filter(student=student).first()
+    if rank is None and refresh_missing([student.program]):
+        rank = ranks.filter(student=student).first()
+    return rank
+
+
+def histogram(program: str) -> List[Bucket]:
+    """Number of the program's ranked students in each CGPA bucket."""
+    refresh_missing([program])
+    counts = dict(
+        models.StudentRank.objects
+        .filter(program=program)
+        .annotate(bucket=Cast(F('cgpa') / BUCKET_WIDTH, IntegerField()))
+        .values('bucket')
+        .annotate(students=Count('pk'))
+        .values_list('bucket', 'students')
+    )
+    # A CGPA of 4.00 goes in the last bucket
+    counts[BUCKETS - 1] = counts.get(BUCKETS - 1, 0) + counts.pop(BUCKETS, 0)
+    return [
+        Bucket(i * BUCKET_WIDTH, (i + 1) * BUCKET_WIDTH, counts.get(i, 0))
+        for i in range(BUCKETS)
+    ]
+
+
+def top(program: str, n: int = 10) -> List[models.StudentRank]:
+    """Ranks of the n students of the program with the highest CGPAs."""
+    refresh_missing([program])
+    return list(
+        models.StudentRank.objects
+        .filter(program=program)
+        .select_related('student')
+        .order_by('rank', 'student__slug')[:n]
+    )
@@ -0,0 +1,353 @@
+"""JSON API for student grade summaries and transcripts.
+
+Responses carry an ETag built from the cache version counters (see
+core/cache.py), so clients polling unchanged data get a 304 without any
+query being run.
+"""
+import hashlib
+import json
+from typing import List
+
+from django import http
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, Q
+from django.utils.decorators import method_decorator
+from django.views import generic
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+
+from gradeutils import grading, planner
+
+from . import analytics, cache, forms, models
+
+DEFAULT_MAX_BATCH = 100
+
+
+def max_batch_size() -> int:
+    return getattr(settings, 'GRADEUTILS_API_MAX_BATCH', DEFAULT_MAX_BATCH)
+
+
+def _student_list_etag(request, *args, **kwargs):
+    if request.method != 'GET':
+        return None
+    return hashlib.md5(
+        f'{cache.versioned_key("api-students", cache.STUDENT_LIST)}'
+        f':{request.get_full_path()}'.encode()
+    ).hexdigest()
+
+
+def _transcript_etag(request, slug, *args, **kwargs):
+    return hashlib.md5(cache.versioned_key(
+        f'api-transcript:{slug}', cache.student_version(slug),
+    ).encode()).hexdigest()
+
+
+def student_summary(student: models.Student) -> dict:
+    """Grade summary of a student whose trimesters are prefetched."""
+    return {
+        'slug': student.slug,
+        'nsuid': student.nsuid,
+        'program': student.program,
+        'cgpa': student.cgpa,
+        'credits': grading.to_credits(student.counted_credits),
+        'trimesters': [
+            {
+                'code': trimester.code,
+                'gpa': trimester.gpa,
+                'credits': grading.to_credits(trimester.counted_credits),
+            }
+            for trimester in student.trimesters.all()
+        ],
+    }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(condition(etag_func=_student_list_etag), name='dispatch')
+class StudentSummaries(cache.CachedResponseMixin, generic.View):
+    """Return the grade summaries of many students at once.
+
+    Students are given by slug or NSU ID, either comma-separated in the
+    `ids` parameter of a GET request, or as a JSON list in the `students`
+    member of a POST request body. Summaries are built from two queries
+    however many students there are.
+    """
+
+    http_method_names = ['get', 'post']
+
+    def cache_key(self):
+        identifiers = hashlib.md5(
+            self.request.GET.get('ids', '').encode()).hexdigest()
+        return cache.versioned_key(f'api-students:{identifiers}',
+                                   cache.STUDENT_LIST)
+
+    def get(self, request, **kwargs):
+        identifiers = [identifier.strip()
+                       for identifier in request.GET.get('ids', '').split(',')
+                       if identifier.strip()]
+        return self.summaries(identifiers)
+
+    def post(self, request, **kwargs):
+        try:
+            identifiers = json.loads(request.body.decode())['students']
+        except (ValueError, KeyError, TypeError):
+            return self.error('Expected a JSON object with a "students" list')
+        if (not isinstance(identifiers, list)
+                or not all(isinstance(i, str) for i in identifiers)):
+            return self.error('"students" should be a list of strings')
+        return self.summaries(identifiers)
+
+    @staticmethod
+    def error(message: str, status: int = 400) -> http.JsonResponse:
+        return http.JsonResponse({'error': message}, status=status)
+
+    def summaries(self, identifiers):
+        identifiers = list(dict.fromkeys(identifiers))
+        if not identifiers:
+            return self.error('No students given')
+        if len(identifiers) > max_batch_size():
+            return self.error(
+                f'At most {max_batch_size()} students can be requested')
+
+        students = (
+            models.Student.objects
+            .filter(Q(slug__in=identifiers) | Q(nsuid__in=identifiers))
+            .prefetch_related(Prefetch(
+                'trimesters',
+                queryset=models.Trimester.objects.order_by('code'),
+            ))
+        )
+        summaries = [student_summary(student) for student in students]
+        found = ({summary['slug'] for summary in summaries}
+                 | {summary['nsuid'] for summary in summaries})
+        return http.JsonResponse({
+            'students': summaries,
+            'missing': [identifier for identifier in identifiers
+                        if identifier not in found],
+        })
+
+
+@method_decorator(condition(etag_func=_transcript_etag), name='dispatch')
+class StudentTranscript(cache.CachedResponseMixin,
+                        generic.detail.SingleObjectMixin, generic.View):
+    """Return the full transcript of a Student."""
+
+    model = models.Student
+
+    def cache_key(self):
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        return cache.versioned_key(f'api-transcript:{slug}',
+                                   cache.student_version(slug))
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related(
+            Prefetch(
+                'trimesters',
+                queryset=models.Trimester.objects.order_by('code'),
+            ),
+            Prefetch(
+                'trimesters__courses',
+                queryset=models.Course.objects.order_by('code'),
+            ),
+        )
+
+    def get(self, request, **kwargs):
+        student = self.get_object()
+        transcript = student_summary(student)
+        for trimester, summary in zip(student.trimesters.all(),
+                                      transcript['trimesters']):
+            summary['courses'] = [
+                {
+                    'code': course.code,
+                    'credits': course.credits,
+                    'grade': course.grade,
+                    'retaken': course.retaken,
+                }
+                for course in trimester.courses.all()
+            ]
+        return http.JsonResponse(transcript)
+
+
+@method_decorator(condition(etag_func=_student_list_etag), name='dispatch')
+class ProgramDistribution(cache.CachedResponseMixin, generic.View):
+    """Return the CGPA histogram and top students of a program."""
+
+    def cache_key(self):
+        top = self.request.GET.get('top', '')
+        return cache.versioned_key(
+            f'api-program:{self.kwargs["program"]}:{top}', cache.STUDENT_LIST)
+
+    def get(self, request, program, **kwargs):
+        if program not in dict(models.Student.PROGRAM_CHOICES):
+            raise http.Http404(f'No program {program}')
+        try:
+            n = max(1, min(int(request.GET.get('top', 10)), max_batch_size()))
+        except ValueError:
+            return StudentSummaries.error('"top" should be a number')
+        summary = analytics.summary(program)
+        return http.JsonResponse({
+            'program': program,
+            'students': summary.students,
+            'mean_cgpa': summary.mean_cgpa,
+            'histogram': [bucket._asdict()
+                          for bucket in analytics.histogram(program)],
+            'top': [rank_summary(rank) for rank in analytics.top(program, n)],
+        })
+
+
+@method_decorator(condition(etag_func=_student_list_etag), name='dispatch')
+class StudentRankDetail(cache.CachedResponseMixin,
+                        generic.detail.SingleObjectMixin, generic.View):
+    """Return the rank of a Student within their program."""
+
+    model = models.Student
+
+    def cache_key(self):
+        # Ranks change with the grades of any student of the program
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        return cache.versioned_key(f'api-rank:{slug}', cache.STUDENT_LIST)
+
+    def get(self, request, **kwargs):
+        student = self.get_object()
+        rank = analytics.student_rank(student)
+        if rank is None:
+            raise http.Http404(f'{student} is not ranked')
+        return http.JsonResponse(rank_summary(rank))
+
+
+class TrimesterEntry(generic.detail.SingleObjectMixin, generic.View):
+    """Enter a whole trimester of a Student at once, all its courses
+    included, and return the GPA and CGPA it leaves them with.
+
+    The POST request body is a JSON object with the trimester `code` and a
+    `courses` list of objects with a `code`, `credits` and `grade`. Nothing
+    is written unless all of them are valid. Being a write, the request
+    must pass the CSRF check like any form.
+    """
+
+    model = models.Student
+    http_method_names = ['post']
+
+    def post(self, request, **kwargs):
+        student = self.get_object()
+        try:
+            body = json.loads(request.body.decode())
+            trimester_form = forms.TrimesterEntryForm(
+                {'code': body['code']}, student=student)
+            course_formset = forms.CourseEntryFormSet(
+                forms.course_entry_data(body['courses']))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return StudentSummaries.error(
+                'Expected a JSON object with a trimester "code" and a '
+                '"courses" list of objects with a "code", "credits" and '
+                '"grade"')
+        if not (trimester_form.is_valid() and course_formset.is_valid()):
+            return self.invalid(trimester_form, course_formset)
+
+        try:
+            trimester = models.enter_trimester(
+                student, trimester_form.cleaned_data['code'],
+                course_formset.courses)
+        except ValidationError as error:
+            trimester_form.add_error(None, error)
+            return self.invalid(trimester_form, course_formset)
+        timeline = student.timeline()
+        return http.JsonResponse({
+            'slug': student.slug,
+            'trimester': next(entry for entry in timeline
+                              if entry.trimester == trimester.code)._asdict(),
+            'cgpa': timeline[-1].cgpa,
+        }, status=201)
+
+    @staticmethod
+    def invalid(trimester_form, course_formset) -> http.JsonResponse:
+        return http.JsonResponse({
+            'error': 'Invalid trimester or courses',
+            'trimester': form_errors(trimester_form.errors),
+            'courses': [form_errors(errors)
+                        for errors in course_formset.errors],
+            'course_errors': list(course_formset.non_form_errors()),
+        }, status=400)
+
+
+def form_errors(errors) -> dict:
+    """Messages of the errors of a form, by field."""
+    return {field: list(messages) for field, messages in errors.items()}
+
+
+def rank_summary(rank: models.StudentRank) -> dict:
+    return {
+        'slug': rank.student.slug,
+        'program': rank.program_id,
+        'cgpa': rank.cgpa,
+        'rank': rank.rank,
+        'percentile': rank.percentile,
+    }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StudentPlan(generic.detail.SingleObjectMixin, generic.View):
+    """Return the outcome of, or the grades needed to reach a target CGPA
+    with, the courses a Student plans for their next trimester.
+
+    The POST request body is a JSON object with a `courses` list of objects
+    with a `code`, `credits` and optional `grade`, and optionally a `target`
+    CGPA and a `limit` on the number of combinations of grades returned.
+    Nothing is written.
+    """
+
+    model = models.Student
+    http_method_names = ['post']
+
+    def post(self, request, **kwargs):
+        student = self.get_object()
+        try:
+            body = json.loads(request.body.decode())
+            courses = [
+                forms.planned_course(str(course['code']),
+                                     str(course['credits']),
+                                     course.get('grade'))
+                for course in body['courses']
+            ]
+            target = body.get('target')
+            if target is not None:
+                target = forms.PlannerForm.base_fields['target'].clean(
+                    str(target))
+            limit = min(int(body.get('limit', 10)), max_batch_size())
+        except ValidationError as error:
+            return StudentSummaries.error(' '.join(error.messages))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return StudentSummaries.error(
+                'Expected a JSON object with a "courses" list of objects with '
+                'a "code" and "credits"')
+        if not courses:
+            return StudentSummaries.error('No courses given')
+        try:
+            plan = student.plan(courses, target, max(limit, 1))
+        except ValueError as error:
+            return StudentSummaries.error(str(error))
+        return http.JsonResponse(plan_summary(student, courses, plan))
+
+
+def plan_summary(student: models.Student,
+                 courses: List[planner.PlannedCourse],
+                 plan: planner.Plan) -> dict:
+    open_courses = [course.code for course in courses if course.grade is None]
+    return {
+        'slug': student.slug,
+        'trimester': plan.trimester,
+        'cgpa': plan.cgpa,
+        'lowest_cgpa': plan.lowest_cgpa,
+        'highest_cgpa': plan.highest_cgpa,
+        'target': plan.target,
+        'reachable': plan.reachable,
+        'complete': plan.complete,
+        'combinations': [
+            {
+                'grades': dict(zip(open_courses, combination.grades)),
+                'gpa': combination.gpa,
+                'cgpa': combination.cgpa,
+            }
+            for combination in plan.combinations
+        ],
+    }
@@ -0,0 +1,174 @@
+"""Versioned caching of student pages and data.
+
+Cached entries are keyed on version counters: one per student, one for the
+student list and a global one. Bumping a counter makes every entry built
+from the old version unreachable, so nothing has to be deleted; stale
+entries are dropped by the cache backend's TTL and size bounds.
+
+The cache alias and TTL are read from the GRADEUTILS_CACHE setting. Size
+bounds are those of the backend (eg. MAX_ENTRIES in its OPTIONS).
+
+Whatever is cached is read from the primary database rather than a replica
+(see core/routers.py): a replica lagging behind a write would otherwise
+have its stale data cached under the version the write bumped.
+"""
+import time
+from typing import Any, Callable, Dict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from . import routers
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'KEY_PREFIX': 'gradeutils',
+}
+
+GLOBAL = 'global'
+STUDENT_LIST = 'student-list'
+
+
+def get_setting(name: str) -> Any:
+    return getattr(settings, 'GRADEUTILS_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting('ALIAS')]
+
+
+def _key(*parts) -> str:
+    return ':'.join(str(part) for part in (get_setting('KEY_PREFIX'),) + parts)
+
+
+def version(name: str) -> int:
+    """Current value of a version counter."""
+    cache = get_cache()
+    key = _key('version', name)
+    value = cache.get(key)
+    if value is None:
+        # Start evicted or new counters from the clock, so they do not
+        # return to a value that stale entries were keyed on
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump(*names: str):
+    """Increment version counters, invalidating what was cached with them."""
+    cache = get_cache()
+    for name in names:
+        key = _key('version', name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def student_version(slug: str) -> str:
+    return f'student:{slug}'
+
+
+def bump_students(*slugs: str):
+    """Invalidate what was cached for the students, and the student list."""
+    bump(STUDENT_LIST, *(student_version(slug) for slug in slugs))
+
+
+def bump_all():
+    """Invalidate everything cached, eg. after bulk changes."""
+    bump(GLOBAL)
+
+
+def versioned_key(name: str, *versions: str) -> str:
+    """Cache key of an entry depending on the given version counters."""
+    return _key(name, version(GLOBAL),
+                *(version(counter) for counter in versions))
+
+
+def _count(outcome: str):
+    cache = get_cache()
+    key = _key('stats', outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_or_set(key: str, compute: Callable[[], Any]) -> Any:
+    """Cached value of the key, computing and caching it on a miss."""
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    with routers.reading_from_primary():
+        value = compute()
+    cache.set(key, value, get_setting('TIMEOUT'))
+    return value
+
+
+def stats() -> Dict[str, int]:
+    """Hit and miss counts of the cache lookups."""
+    cache = get_cache()
+    counts = cache.get_many([_key('stats', 'hits'), _key('stats', 'misses')])
+    return {
+        'hits': counts.get(_key('stats', 'hits'), 0),
+        'misses': counts.get(_key('stats', 'misses'), 0),
+    }
+
+
+class CachedResponseMixin:
+    """Cache the successful GET responses of a view.
+
+    Views define cache_key() to return a key built with versioned_key().
+    Responses are shared by every client, so requests with flash messages
+    pending, which the page would show, neither use nor fill the cache. A
+    response filling the cache is built from the primary database.
+    """
+
+    def cache_key(self) -> str:
+        raise NotImplementedError
+
+    @staticmethod
+    def has_messages(request) -> bool:
+        """Whether flash messages are pending for the request (without
+        marking them as shown)."""
+        storage = getattr(request, '_messages', None)
+        return storage is not None and (storage.used or len(storage) > 0)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or self.has_messages(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            _count('hits')
+            status, content_type, content = cached
+            response = HttpResponse(content, content_type=content_type,
+                                    status=status)
+            response['X-Cache'] = 'hit'
+            return response
+        _count('misses')
+        # The page may be rendered after dispatch returns, so the rest of
+        # the request reads from the primary
+        routers.pin_to_primary()
+
+        def store(response):
+            # Messages added while rendering are in the page too
+            if response.status_code == 200 and not self.has_messages(request):
+                cache.set(key, (response.status_code, response['Content-Type'],
+                                response.content), get_setting('TIMEOUT'))
+
+        response = super().dispatch(request, *args, **kwargs)
+        response['X-Cache'] = 'miss'
+        if hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
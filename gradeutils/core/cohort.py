@@ -0,0 +1,161 @@
+"""Cohort-wide GPA computations over columnar arrays.
+
+The courses of a whole cohort are loaded with a single query into NumPy
+arrays, sorted by student and trimester, and every average is computed with
+grouped reductions. The integer scaling of gradeutils.grading is kept
+throughout, so the results agree exactly with the per-object properties.
+"""
+from decimal import Decimal
+from typing import NamedTuple
+
+import numpy as np
+from django.db.models import QuerySet
+
+from gradeutils import grading
+
+from . import models
+
+
+class CohortResult(NamedTuple):
+    """Averages of a cohort, in hundredths.
+
+    The first three arrays have one entry per student (with at least one
+    course), sorted by id. The other four have one entry per trimester of
+    those students, sorted by student id and trimester code.
+    """
+
+    student_ids: np.ndarray
+    cgpa: np.ndarray
+    counted_credits: np.ndarray  # in tenths
+    trimester_student_ids: np.ndarray
+    trimester_codes: np.ndarray
+    gpa: np.ndarray
+    running_cgpa: np.ndarray  # CGPA as of the end of the trimester
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def student_cgpa(self, student_id: int) -> Decimal:
+        """CGPA of a student of the cohort."""
+        i = np.searchsorted(self.student_ids, student_id)
+        if i == len(self.student_ids) or self.student_ids[i] != student_id:
+            return grading.to_decimal(0)
+        return grading.to_decimal(int(self.cgpa[i]))
+
+
+def _average_hundredths(quality_points: np.ndarray,
+                        credits: np.ndarray) -> np.ndarray:
+    """Vectorized grading.average_hundredths."""
+    safe_credits = np.where(credits == 0, 1, credits)
+    quotient, remainder = np.divmod(quality_points, safe_credits)
+    round_up = ((remainder * 2 > safe_credits)
+                | (remainder * 2 == safe_credits) & (quotient % 2 == 1))
+    return np.where(credits == 0, 0, quotient + round_up)
+
+
+def _group_starts(*keys: np.ndarray) -> np.ndarray:
+    """Start indices of the runs of equal keys in sorted arrays."""
+    changed = np.zeros(len(keys[0]), dtype=bool)
+    changed[:1] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(changed)
+
+
+def compute(courses: QuerySet = None) -> CohortResult:
+    """Compute the averages of the students of the given courses.
+
+    courses defaults to every course; filter it down to a cohort first, eg.
+    with cohort_courses.
+    """
+    if courses is None:
+        courses = models.Course.objects.all()
+    rows = list(courses.order_by('trimester__student_id', 'trimester__code')
+                .values_list('trimester__student_id', 'trimester__code',
+                             'code', 'credits', 'grade', 'retaken'))
+    empty = np.zeros(0, dtype=np.int64)
+    if not rows:
+        return CohortResult(*[empty] * 7)
+
+    student_ids, codes, course_codes, credits, grades, retaken = zip(*rows)
+    student_ids = np.array(student_ids, dtype=np.int64)
+    codes = np.array(codes, dtype=np.int64)
+    # Credits have a single decimal place, so rounding the float tenths is
+    # exact
+    credits = np.rint(np.array(credits, dtype=np.float64) * 10).astype(
+        np.int64)
+    grade_values, grades = np.unique(np.array(grades), return_inverse=True)
+    grade_points = [grading.grade_point(grade) for grade in grade_values]
+    counted = np.array([point is not None
+                        for point in grade_points])[grades]
+    points = np.array([point or 0 for point in grade_points],
+                      dtype=np.int64)[grades]
+    retaken = np.array(retaken, dtype=bool)
+    _, course_codes = np.unique(np.array(course_codes), return_inverse=True)
+
+    counted_credits = np.where(counted, credits, 0)
+    quality_points = counted_credits * points
+
+    # Per trimester
+    trimester_starts = _group_starts(student_ids, codes)
+    trimester_credits = np.add.reduceat(counted_credits, trimester_starts)
+    trimester_points = np.add.reduceat(quality_points, trimester_starts)
+    trimester_student_ids = student_ids[trimester_starts]
+    trimester_codes = codes[trimester_starts]
+
+    # Per student, leaving out retaken courses
+    student_starts = _group_starts(student_ids)
+    kept = ~retaken
+    student_credits = np.add.reduceat(counted_credits * kept, student_starts)
+    student_points = np.add.reduceat(quality_points * kept, student_starts)
+
+    # Running totals: a course counts from its own trimester until the
+    # trimester of its next take by the same student
+    trimester_index = np.repeat(
+        np.arange(len(trimester_starts)),
+        np.diff(np.append(trimester_starts, len(codes))),
+    )
+    by_course = np.lexsort((codes, course_codes, student_ids))
+    next_take = np.full(len(codes), -1, dtype=np.int64)
+    same_course = ((student_ids[by_course][1:] == student_ids[by_course][:-1])
+                   & (course_codes[by_course][1:]
+                      == course_codes[by_course][:-1]))
+    next_take[by_course[:-1][same_course]] = by_course[1:][same_course]
+    superseded = next_take >= 0
+    credit_deltas = trimester_credits.copy()
+    point_deltas = trimester_points.copy()
+    np.subtract.at(credit_deltas, trimester_index[next_take[superseded]],
+                   counted_credits[superseded])
+    np.subtract.at(point_deltas, trimester_index[next_take[superseded]],
+                   quality_points[superseded])
+    trimester_counts = np.diff(
+        np.append(_group_starts(trimester_student_ids),
+                  len(trimester_starts)))
+    running_credits = _cumsum_by_group(credit_deltas, trimester_counts)
+    running_points = _cumsum_by_group(point_deltas, trimester_counts)
+
+    return CohortResult(
+        student_ids=student_ids[student_starts],
+        cgpa=_average_hundredths(student_points, student_credits),
+        counted_credits=student_credits,
+        trimester_student_ids=trimester_student_ids,
+        trimester_codes=trimester_codes,
+        gpa=_average_hundredths(trimester_points, trimester_credits),
+        running_cgpa=_average_hundredths(running_points, running_credits),
+    )
+
+
+def _cumsum_by_group(values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Cumulative sums restarting at each group of the given sizes."""
+    totals = np.cumsum(values)
+    offsets = np.repeat(np.append(0, totals[np.cumsum(counts)[:-1] - 1]),
+                        counts)
+    return totals - offsets
+
+
+def cohort_courses(program: str = None) -> QuerySet:
+    """Courses of the students in a program, or of all students."""
+    courses = models.Course.objects.all()
+    if program is not None:
+        courses = courses.filter(trimester__student__program=program)
+    return courses
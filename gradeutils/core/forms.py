@@ -1,4 +1,11 @@
+from decimal import Decimal, InvalidOperation
+from typing import List
+
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator
+
+from gradeutils import grading, planner
 
 from . import models
 
@@ -15,3 +22,148 @@ class TrimesterCreateForm(forms.ModelForm):
     class Meta:
         model = models.Trimester
         fields = ['student', 'code']
+
+
+class TrimesterEntryForm(forms.Form):
+    """A trimester entered along with its courses (see CourseEntryFormSet)."""
+
+    code = models.Trimester._meta.get_field('code').formfield()
+
+    def __init__(self, *args, student: models.Student, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.student = student
+
+    def clean_code(self):
+        code = self.cleaned_data['code']
+        if self.student.trimesters.filter(code=code).exists():
+            raise ValidationError(f'Trimester {code} is already entered')
+        return code
+
+
+class CourseEntryForm(forms.ModelForm):
+
+    class Meta:
+        model = models.Course
+        fields = ['code', 'credits', 'grade']
+
+
+class BaseCourseEntryFormSet(forms.BaseFormSet):
+
+    def clean(self):
+        if any(self.errors):
+            return
+        codes = [form.cleaned_data['code'] for form in self.forms
+                 if form.cleaned_data]
+        duplicates = sorted({code for code in codes if codes.count(code) > 1})
+        if duplicates:
+            raise ValidationError(
+                f'Courses entered more than once: {", ".join(duplicates)}')
+
+    @property
+    def courses(self):
+        """Unsaved courses of the filled in forms."""
+        return [form.instance for form in self.forms if form.cleaned_data]
+
+
+CourseEntryFormSet = forms.formset_factory(
+    CourseEntryForm,
+    formset=BaseCourseEntryFormSet,
+    extra=5,
+    min_num=1,
+    validate_min=True,
+)
+
+
+def course_entry_data(courses: List[dict], prefix: str = 'form') -> dict:
+    """Bound data of a CourseEntryFormSet holding the given courses."""
+    data = {
+        f'{prefix}-TOTAL_FORMS': len(courses),
+        f'{prefix}-INITIAL_FORMS': 0,
+    }
+    for i, course in enumerate(courses):
+        for field in CourseEntryForm._meta.fields:
+            if course.get(field) is not None:
+                data[f'{prefix}-{i}-{field}'] = str(course[field])
+    return data
+
+
+class StudentFilterForm(forms.Form):
+    """Search, filtering and sorting options of the student list."""
+
+    SORT_CHOICES = (
+        ('nsuid', 'NSU ID'),
+        ('cgpa', 'CGPA'),
+    )
+
+    q = forms.CharField(
+        label='NSU ID',
+        max_length=7,
+        required=False,
+        validators=[
+            RegexValidator(r'^\d*$', message='Should be digits only'),
+        ],
+    )
+    program = forms.ChoiceField(
+        choices=(('', 'All programs'),) + models.Student.PROGRAM_CHOICES,
+        required=False,
+    )
+    sort = forms.ChoiceField(
+        choices=SORT_CHOICES,
+        required=False,
+    )
+
+
+def planned_course(code: str, credits: str,
+                   grade: str = None) -> planner.PlannedCourse:
+    """Validated course of a plan, with its credits in tenths."""
+    code = code.upper()
+    try:
+        models.Course._meta.get_field('code').run_validators(code)
+    except ValidationError:
+        raise ValidationError(f'Invalid course code: {code}')
+    try:
+        scaled = grading.scale_credits(Decimal(credits))
+    except (InvalidOperation, ValueError):
+        raise ValidationError(f'Invalid credits for {code}: {credits}')
+    if not 0 <= scaled <= 99:
+        raise ValidationError(f'Invalid credits for {code}: {credits}')
+    if grade is not None:
+        grade = grade.upper()
+        if grade not in grading.GRADE_POINTS:
+            raise ValidationError(f'Invalid grade for {code}: {grade}')
+    return planner.PlannedCourse(code, scaled, grade)
+
+
+class PlannerForm(forms.Form):
+    """Courses planned for the next trimester, and the CGPA aimed for."""
+
+    courses = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 6}),
+        help_text='<em>One course per line: its code, credits and grade if '
+                  'known (eg. "MAT116 3.0" or "CSE115 3.0 B+"). A course '
+                  'taken before is a retake</em>',
+    )
+    target = forms.DecimalField(
+        label='Target CGPA',
+        max_digits=3,
+        decimal_places=2,
+        min_value=0,
+        max_value=4,
+        required=False,
+    )
+
+    def clean_courses(self):
+        courses = []
+        for line in self.cleaned_data['courses'].splitlines():
+            fields = line.replace(',', ' ').split()
+            if not fields:
+                continue
+            if len(fields) not in (2, 3):
+                raise ValidationError(f'Invalid course: {line}')
+            courses.append(planned_course(*fields))
+        if not courses:
+            raise ValidationError('Plan at least one course')
+        codes = [course.code for course in courses]
+        if len(set(codes)) != len(codes):
+            raise ValidationError('A course is planned more than once')
+        return courses
@@ -0,0 +1,180 @@
+"""Parallel ingestion of many transcript files.
+
+Files are parsed and validated in a pool of spawned worker processes. Their
+rows are passed through a bounded queue to a single writer thread, which is
+the only one writing to the database. The main thread stops handing files
+to the pool while the queue is full, so memory use is bounded by the queue
+size however many files there are.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent import futures
+from typing import Iterable, List, NamedTuple, Optional
+
+import django
+from django.db import connection
+
+from . import analytics, transcripts
+
+
+class ParsedFile(NamedTuple):
+    """The validated rows of a transcript file, and its errors."""
+
+    path: str
+    rows: List[transcripts.TranscriptRow]
+    errors: List[str]
+    invalid_rows: int
+    failed: bool = False
+
+
+class FileReport(NamedTuple):
+    """The outcome of ingesting a transcript file."""
+
+    path: str
+    status: str  # 'ok', 'partial' (some rows invalid) or 'failed'
+    rows: int
+    invalid_rows: int
+    errors: List[str]
+
+
+def guess_format(path: str) -> Optional[str]:
+    """Transcript format of a file going by its extension."""
+    fmt = os.path.splitext(path)[1][1:].lower()
+    return fmt if fmt in transcripts.FORMATS else None
+
+
+def parse_file(path: str, fmt: str = None) -> ParsedFile:
+    """Read and validate all rows of a transcript file.
+
+    Invalid rows are reported and skipped. If the file cannot be read at
+    all, or reading it raises any other error, it is reported as failed, so
+    that one bad file does not stop the others from being ingested.
+    """
+    rows, errors = [], []
+    try:
+        fmt = fmt or guess_format(path)
+        if fmt is None:
+            raise ValueError('Unknown transcript format')
+        with open(path, newline='', encoding='utf-8') as stream:
+            for number, row, error in transcripts.parse_rows(stream, fmt):
+                if error is not None:
+                    errors.append(
+                        f'{number}: {transcripts.format_error(error)}')
+                else:
+                    rows.append(row)
+    except (OSError, ValueError) as error:
+        # ValueError includes JSON and Unicode decoding errors
+        return ParsedFile(path, [], errors + [str(error)], len(errors),
+                          failed=True)
+    except Exception as error:
+        return ParsedFile(path, [],
+                          errors + [f'{type(error).__name__}: {error}'],
+                          len(errors), failed=True)
+    return ParsedFile(path, rows, errors, len(errors))
+
+
+class IngestionPipeline:
+    """Parse files in worker processes and write them from one thread."""
+
+    def __init__(self, workers: int = None, queue_size: int = 16,
+                 batch_size: int = 1000, fmt: str = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.fmt = fmt
+        self.reports: List[FileReport] = []
+        self.stats = {}
+        self.elapsed = 0.0
+
+    def run(self, paths: Iterable[str]) -> List[FileReport]:
+        """Ingest the files, returning one report per file."""
+        start = time.perf_counter()
+        parsed = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self._write, args=(parsed,))
+        writer.start()
+        try:
+            # Workers are spawned rather than forked: forking now would copy
+            # the state of the writer thread, its database connection
+            # included, into every worker. They set Django up before
+            # importing this module to parse files.
+            with futures.ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup) as executor:
+                self._parse(executor, paths, parsed)
+        finally:
+            parsed.put(None)
+            writer.join()
+        self.elapsed = time.perf_counter() - start
+        return self.reports
+
+    def _parse(self, executor: futures.Executor, paths: Iterable[str],
+               parsed: queue.Queue):
+        pending, submitted = set(), {}
+        paths = iter(paths)
+        exhausted = False
+        while pending or not exhausted:
+            # Keep the workers busy, without parsing far ahead of the writer
+            while not exhausted and len(pending) < self.workers * 2:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                else:
+                    future = executor.submit(parse_file, path, self.fmt)
+                    submitted[future] = path
+                    pending.add(future)
+            if not pending:
+                break
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                path = submitted.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    # The worker itself failed, eg. it was killed
+                    result = ParsedFile(
+                        path, [], [f'{type(error).__name__}: {error}'], 0,
+                        failed=True)
+                # Blocks while the queue is full
+                parsed.put(result)
+
+    def _write(self, parsed: queue.Queue):
+        importer = transcripts.TranscriptImporter(self.batch_size)
+        try:
+            while True:
+                result = parsed.get()
+                if result is None:
+                    break
+                self.reports.append(self._write_file(importer, result))
+            analytics.refresh_stale()
+        finally:
+            self.stats = dict(importer.stats)
+            connection.close()
+
+    @staticmethod
+    def _write_file(importer: transcripts.TranscriptImporter,
+                    result: ParsedFile) -> FileReport:
+        errors = list(result.errors)
+        failed = result.failed
+        if not failed:
+            try:
+                for row in result.rows:
+                    importer.add(row)
+                importer.flush()
+            except Exception as error:
+                # Students flushed before the error stay written
+                importer.pending, importer.pending_count = {}, 0
+                errors.append(f'{type(error).__name__}: {error}')
+                failed = True
+        if failed:
+            status = 'failed'
+        elif result.invalid_rows:
+            status = 'partial'
+        else:
+            status = 'ok'
+        return FileReport(result.path, status, len(result.rows),
+                          result.invalid_rows, errors)
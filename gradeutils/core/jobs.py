@@ -0,0 +1,153 @@
+"""A database-backed queue of recomputes of derived grade data.
+
+With GRADEUTILS_RECOMPUTE['ASYNC'] on, saving or deleting a course only
+writes the course and queues its student, rather than resolving retakes and
+updating stored totals on the request thread. The recompute_worker command
+then runs the queued students in batches: it resolves their retakes,
+rebuilds their stored totals, invalidates their cached pages and refreshes
+the ranks of their programs. Until then, their stored totals are out of
+date.
+
+Jobs are queued with RecomputeJob.objects.enqueue. There is at most one
+RecomputeJob per student, so requests for a student that is already queued
+are coalesced into its pending job. A job that fails is retried later, with
+an exponential backoff, up to MAX_ATTEMPTS times. Jobs are leased to a
+worker while it runs them, so that several workers may share the queue and
+jobs of a worker that died are run again.
+"""
+import datetime as dt
+import logging
+import traceback
+from typing import Any, Iterable, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from . import analytics, cache, models
+
+logger = logging.getLogger('core.jobs')
+
+# ASYNC, which models.recompute_queued reads, is off by default
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    # Seconds before the first retry of a failed job, doubled every attempt
+    'RETRY_DELAY': 10,
+    # Seconds after which jobs claimed by a worker that did not finish them
+    # may be claimed again
+    'LEASE_SECONDS': 300,
+}
+
+
+def get_setting(name: str) -> Any:
+    return getattr(settings, 'GRADEUTILS_RECOMPUTE',
+                   {}).get(name, DEFAULTS[name])
+
+
+def recompute(students: Iterable[int]):
+    """Bring the derived grade data of the students up to date."""
+    students = models.Student.objects.filter(pk__in=list(students))
+    with transaction.atomic():
+        models.resolve_retakes(students, adjust_totals=False)
+        models.rebuild_grade_totals(students)
+    cache.bump_students(*students.values_list('slug', flat=True))
+    analytics.rerank(students.values_list('pk', flat=True))
+
+
+def claim(batch_size: int = None) -> List[models.RecomputeJob]:
+    """Lease up to batch_size of the jobs that are due, oldest first."""
+    now = timezone.now()
+    lease = now + dt.timedelta(seconds=get_setting('LEASE_SECONDS'))
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    due = list(
+        models.RecomputeJob.objects
+        .filter(available__lte=now, attempts__lt=get_setting('MAX_ATTEMPTS'))
+        .order_by('available')
+        .values_list('pk', flat=True)[:batch_size]
+    )
+    # Jobs leased by another worker in the meantime are no longer due
+    models.RecomputeJob.objects.filter(
+        pk__in=due, available__lte=now).update(available=lease)
+    return list(models.RecomputeJob.objects.filter(pk__in=due,
+                                                   available=lease))
+
+
+def _complete(job: models.RecomputeJob):
+    # Requests made while the job ran need another run
+    if not models.RecomputeJob.objects.filter(
+            pk=job.pk, requests=job.requests).delete()[0]:
+        models.RecomputeJob.objects.filter(pk=job.pk).update(
+            available=timezone.now(), attempts=0, last_error='')
+
+
+def _fail(job: models.RecomputeJob, error: str):
+    delay = get_setting('RETRY_DELAY') * 2 ** job.attempts
+    models.RecomputeJob.objects.filter(pk=job.pk).update(
+        attempts=F('attempts') + 1,
+        available=timezone.now() + dt.timedelta(seconds=delay),
+        last_error=error,
+    )
+    logger.warning('Recompute of student %s failed (attempt %s): %s',
+                   job.pk, job.attempts + 1, error.strip().splitlines()[-1])
+
+
+def run_batch(batch_size: int = None) -> int:
+    """Run a batch of due jobs, returning how many were run.
+
+    The batch is recomputed at once; if that fails, its jobs are run one by
+    one so that only the failing ones are retried.
+    """
+    jobs = claim(batch_size)
+    if not jobs:
+        return 0
+    try:
+        recompute(job.pk for job in jobs)
+    except Exception:
+        if len(jobs) == 1:
+            _fail(jobs[0], traceback.format_exc())
+            return 1
+        for job in jobs:
+            try:
+                recompute([job.pk])
+            except Exception:
+                _fail(job, traceback.format_exc())
+            else:
+                _complete(job)
+        return len(jobs)
+    for job in jobs:
+        _complete(job)
+    return len(jobs)
+
+
+def retry_failed() -> int:
+    """Make the jobs that ran out of attempts due again."""
+    return (models.RecomputeJob.objects
+            .filter(attempts__gte=get_setting('MAX_ATTEMPTS'))
+            .update(attempts=0, available=timezone.now()))
+
+
+def metrics() -> dict:
+    """Depth and lag of the queue.
+
+    ``lag_seconds`` is the age of the oldest pending request, and
+    ``coalesced`` the number of requests absorbed into pending jobs.
+    """
+    now = timezone.now()
+    jobs = models.RecomputeJob.objects
+    max_attempts = get_setting('MAX_ATTEMPTS')
+    totals = jobs.aggregate(requests=Sum('requests'),
+                            oldest=Min('requested'))
+    depth = jobs.count()
+    return {
+        'depth': depth,
+        'due': jobs.filter(available__lte=now,
+                           attempts__lt=max_attempts).count(),
+        'retrying': jobs.filter(attempts__gt=0,
+                                attempts__lt=max_attempts).count(),
+        'failed': jobs.filter(attempts__gte=max_attempts).count(),
+        'coalesced': (totals['requests'] or 0) - depth,
+        'lag_seconds': round((now - totals['oldest']).total_seconds(), 3)
+        if totals['oldest'] else 0,
+    }
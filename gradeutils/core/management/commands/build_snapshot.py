@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import snapshot
+
+
+class Command(BaseCommand):
+    help = ('Write a read-only binary snapshot of the gradebook, replacing '
+            'the previous one (see core/snapshot.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write the snapshot to (default: '
+                 'GRADEUTILS_SNAPSHOT["PATH"])',
+        )
+
+    def handle(self, *args, **options):
+        path = options['output'] or snapshot.get_setting('PATH')
+        stats = snapshot.build(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshot of {stats.students} students, {stats.trimesters} '
+            f'trimesters and {stats.courses} courses written to {path} '
+            f'({stats.size / 1024:.1f} KiB in {stats.elapsed:.2f}s)'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import queryplans
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN QUERY PLAN on the hot queries of the models and '
+            'views, failing if any of them reads a whole table.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans can only be checked on SQLite')
+
+        plans = queryplans.hot_query_plans()
+        failures = [plan for plan in plans if plan.full_scans]
+        for plan in plans:
+            if plan.full_scans or options['verbosity'] > 1:
+                self.stdout.write(f'{plan.scenario}: {plan.sql}')
+                for line in plan.plan:
+                    self.stdout.write(f'    {line}')
+        if failures:
+            raise CommandError(
+                f'{len(failures)} of {len(plans)} hot queries scan a whole '
+                f'table: ' + ', '.join(sorted({
+                    f'{table} ({plan.scenario})'
+                    for plan in failures for table in plan.full_scans})))
+        self.stdout.write(self.style.SUCCESS(
+            f'None of the {len(plans)} hot queries scans a whole table'))
@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core import models, transcripts
+
+
+class Command(BaseCommand):
+    help = ('Export transcript rows to CSV or JSON (one object per line), '
+            'in the format read by import_transcripts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=transcripts.FORMATS,
+            default='csv',
+            help='Format of the export (default: csv)',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            default='-',
+            help='File to write to, or - for standard output (the default)',
+        )
+        parser.add_argument(
+            '--averages',
+            action='store_true',
+            help='Add the trimester GPA and CGPA to each row',
+        )
+        parser.add_argument(
+            '--program',
+            help='Export the students of this program only',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of courses fetched from the database at a time',
+        )
+
+    def handle(self, *args, **options):
+        courses = models.Course.objects.all()
+        if options['program']:
+            courses = courses.filter(
+                trimester__student__program=options['program'])
+        lines = transcripts.format_rows(
+            transcripts.export_rows(courses, averages=options['averages'],
+                                    chunk_size=options['chunk_size']),
+            options['format'],
+            transcripts.export_fields(options['averages']),
+        )
+
+        path = options['output']
+        stream = (sys.stdout if path == '-'
+                  else open(path, 'w', newline='', encoding='utf-8'))
+        try:
+            stream.writelines(lines)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import analytics, transcripts
+
+
+class Command(BaseCommand):
+    help = ('Import transcript rows from CSV or JSON files, creating or '
+            'updating students, trimesters and courses.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='+',
+            metavar='file',
+            help='Transcript files to import, or - for standard input',
+        )
+        parser.add_argument(
+            '--format',
+            choices=transcripts.FORMATS,
+            help='Format of the files (default: guessed from the extension)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows buffered before they are written',
+        )
+
+    def handle(self, *args, **options):
+        importer = transcripts.TranscriptImporter(options['batch_size'])
+        invalid = 0
+        start = time.perf_counter()
+
+        for path in options['files']:
+            fmt = options['format'] or os.path.splitext(path)[1][1:].lower()
+            if fmt not in transcripts.FORMATS:
+                raise CommandError(f'Cannot guess the format of {path}')
+            if path == '-':
+                invalid += self.import_rows(importer, path, sys.stdin, fmt)
+                continue
+            with open(path, newline='', encoding='utf-8') as stream:
+                invalid += self.import_rows(importer, path, stream, fmt)
+        importer.flush()
+        analytics.refresh_stale()
+
+        elapsed = time.perf_counter() - start
+        stats = importer.stats
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats["rows"]} rows in {elapsed:.2f}s '
+            f'({stats["rows"] / elapsed if elapsed else 0:.0f} rows/s): '
+            f'{stats["created"]} created, {stats["updated"]} updated, '
+            f'{stats["unchanged"]} unchanged'))
+        if invalid:
+            self.stdout.write(self.style.WARNING(
+                f'{invalid} invalid rows skipped'))
+
+    def import_rows(self, importer, path, stream, fmt) -> int:
+        """Add the valid rows of a file to the importer, returning the
+        number of invalid ones."""
+        invalid = 0
+        for number, row, error in transcripts.parse_rows(stream, fmt):
+            if error is not None:
+                invalid += 1
+                self.stderr.write(f'{path}:{number}: '
+                                  f'{transcripts.format_error(error)}')
+            else:
+                importer.add(row)
+        return invalid
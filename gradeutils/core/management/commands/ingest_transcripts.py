@@ -0,0 +1,87 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from core import ingest, transcripts
+
+
+class Command(BaseCommand):
+    help = ('Ingest many transcript files, parsing them in parallel worker '
+            'processes and writing them from a single writer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            metavar='path',
+            help='Transcript files, or directories containing them',
+        )
+        parser.add_argument(
+            '--format',
+            choices=transcripts.FORMATS,
+            help='Format of the files (default: guessed from the extension)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of parsing processes (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=16,
+            help='Number of parsed files waiting to be written at most',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows buffered before they are written',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write a JSON report of every file to this path',
+        )
+
+    def handle(self, *args, **options):
+        pipeline = ingest.IngestionPipeline(
+            workers=options['workers'],
+            queue_size=options['queue_size'],
+            batch_size=options['batch_size'],
+            fmt=options['format'],
+        )
+        reports = pipeline.run(self.find_files(options))
+
+        for report in reports:
+            for error in report.errors:
+                self.stderr.write(f'{report.path}: {error}')
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump({
+                    'elapsed': pipeline.elapsed,
+                    'stats': pipeline.stats,
+                    'files': [report._asdict() for report in reports],
+                }, f, indent=2)
+
+        statuses = [report.status for report in reports]
+        rows = pipeline.stats.get('rows', 0)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingested {len(reports)} files ({rows} rows) in '
+            f'{pipeline.elapsed:.2f}s '
+            f'({rows / pipeline.elapsed if pipeline.elapsed else 0:.0f} '
+            f'rows/s): {statuses.count("ok")} ok, '
+            f'{statuses.count("partial")} partial, '
+            f'{statuses.count("failed")} failed'))
+
+    @staticmethod
+    def find_files(options):
+        for path in options['paths']:
+            if not os.path.isdir(path):
+                yield path
+                continue
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    if options['format'] or ingest.guess_format(file_path):
+                        yield file_path
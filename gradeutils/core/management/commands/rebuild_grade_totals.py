@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import analytics, cache, models
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the stored credit, quality point and GPA/CGPA totals of '
+            'trimesters and students from their course rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'students',
+            nargs='*',
+            metavar='slug',
+            help='Slugs of the students to rebuild (default: all students)',
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report out-of-date totals, and fail if there are any',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of rows fetched and updated at a time',
+        )
+
+    def handle(self, *args, **options):
+        students = models.Student.objects.all()
+        if options['students']:
+            students = students.filter(slug__in=options['students'])
+
+        stale = models.rebuild_grade_totals(
+            students,
+            commit=not options['verify'],
+            batch_size=options['batch_size'],
+        )
+        if stale and not options['verify']:
+            cache.bump_all()
+            analytics.mark_stale()
+        for obj in stale:
+            self.stdout.write(self.style.WARNING(
+                f'{obj._meta.verbose_name.capitalize()} {obj} is out of date'))
+
+        if options['verify'] and stale:
+            raise CommandError(f'{len(stale)} stored totals are out of date')
+        verb = 'verified' if options['verify'] else 'rebuilt'
+        self.stdout.write(self.style.SUCCESS(
+            f'Grade totals {verb} ({len(stale)} out of date)'))
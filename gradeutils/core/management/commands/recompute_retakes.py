@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import analytics, cache, models
+
+
+class Command(BaseCommand):
+    help = ('Recompute the retaken flags of courses, and rebuild the stored '
+            'totals of the students affected.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'students',
+            nargs='*',
+            metavar='slug',
+            help='Slugs of the students to recompute (default: all students)',
+        )
+
+    def handle(self, *args, **options):
+        students = models.Student.objects.all()
+        if options['students']:
+            students = students.filter(slug__in=options['students'])
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            changed = models.resolve_retakes(
+                students if options['students'] else None,
+                adjust_totals=False,
+            )
+            stale = models.rebuild_grade_totals(students)
+        if changed or stale:
+            cache.bump_all()
+            analytics.mark_stale()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Retakes recomputed in {elapsed:.2f}s '
+            f'({changed} courses changed, {len(stale)} totals rebuilt)'))
@@ -0,0 +1,86 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import analytics, jobs
+
+
+class Command(BaseCommand):
+    help = ('Run the queued recomputes of retakes, stored totals and ranks '
+            '(see core/jobs.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of students recomputed at a time',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to wait for new jobs when the queue is empty',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no jobs are due, rather than wait for more',
+        )
+        parser.add_argument(
+            '--metrics-interval',
+            type=float,
+            default=60,
+            help='Seconds between reports of the queue metrics',
+        )
+        parser.add_argument(
+            '--metrics',
+            action='store_true',
+            help='Only print the queue metrics as JSON',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Make the jobs that ran out of attempts due again first',
+        )
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.stdout.write(json.dumps(jobs.metrics(), sort_keys=True))
+            return
+        if options['retry_failed']:
+            self.stdout.write(f'{jobs.retry_failed()} failed jobs made due')
+
+        run = 0
+        reported = time.monotonic()
+        try:
+            while True:
+                start = time.perf_counter()
+                count = jobs.run_batch(options['batch_size'])
+                if count:
+                    run += count
+                    self.stdout.write(
+                        f'Ran {count} jobs in '
+                        f'{time.perf_counter() - start:.2f}s')
+                if time.monotonic() - reported >= options['metrics_interval']:
+                    self.report()
+                    reported = time.monotonic()
+                if not count:
+                    # Programs marked stale other than by the jobs, eg. by
+                    # rebuild_grade_totals
+                    refreshed = analytics.refresh_stale()
+                    if refreshed:
+                        self.stdout.write(
+                            f'Refreshed the ranks of {", ".join(refreshed)}')
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.report()
+        self.stdout.write(self.style.SUCCESS(f'Ran {run} jobs'))
+
+    def report(self):
+        self.stdout.write(' '.join(
+            f'{name}={value}'
+            for name, value in sorted(jobs.metrics().items())))
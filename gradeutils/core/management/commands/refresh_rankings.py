@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import analytics, models
+
+
+class Command(BaseCommand):
+    help = ('Recompute the CGPA ranks and summaries of the programs that are '
+            'stale.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'programs',
+            nargs='*',
+            metavar='program',
+            help='Programs to consider (default: all of them)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute the programs even if they are up to date',
+        )
+
+    def handle(self, *args, **options):
+        programs = options['programs'] or list(
+            dict(models.Student.PROGRAM_CHOICES))
+        unknown = set(programs) - set(dict(models.Student.PROGRAM_CHOICES))
+        if unknown:
+            raise CommandError(
+                f'Unknown programs: {", ".join(sorted(unknown))}')
+
+        start = time.perf_counter()
+        if options['all']:
+            analytics.mark_stale(programs)
+        refreshed = analytics.refresh_stale(programs)
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(refreshed)} programs in '
+            f'{time.perf_counter() - start:.2f}s'
+            + (f' ({", ".join(refreshed)})' if refreshed else '')))
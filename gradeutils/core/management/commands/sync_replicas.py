@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import routers
+from gradeutils import sqlite
+
+
+class Command(BaseCommand):
+    help = ('Refresh the SQLite file copies standing in for replicas from '
+            'the primary database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'replicas',
+            nargs='*',
+            metavar='alias',
+            help='Replicas to refresh (default: all of them)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep refreshing them, every this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[routers.PRIMARY]
+        replicas = options['replicas'] or routers.get_setting('REPLICAS')
+        if not replicas:
+            raise CommandError('No replicas are configured')
+        for alias in replicas:
+            database = settings.DATABASES.get(alias)
+            if database is None:
+                raise CommandError(f'Unknown database: {alias}')
+            if not all(db['ENGINE'] == 'django.db.backends.sqlite3'
+                       for db in (primary, database)):
+                raise CommandError(f'{alias} is not an SQLite file copy')
+
+        while True:
+            for alias in replicas:
+                start = time.perf_counter()
+                sqlite.copy_database(
+                    sqlite.database_path(primary),
+                    sqlite.database_path(settings.DATABASES[alias]),
+                )
+                # Reconnect to the new copy
+                connections[alias].close()
+                self.stdout.write(
+                    f'Refreshed {alias} in '
+                    f'{time.perf_counter() - start:.2f}s')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,169 @@
+"""Per-request timing and SQL instrumentation.
+
+RequestInstrumentationMiddleware times every request and the queries it
+runs, and reports them in a Server-Timing header. Slow requests, and
+requests running the same query many times over (usually an N+1 pattern),
+are logged as JSON to the `core.requests` logger. A cProfile of a request
+can be asked for with a header or query parameter, if profiling is enabled.
+
+The body of a streaming response is produced after its headers are sent,
+so their Server-Timing only covers the request up to the streaming. The
+queries run while streaming are still recorded, and the request is logged
+once the stream is closed.
+
+Its settings are read from GRADEUTILS_INSTRUMENTATION.
+"""
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.requests')
+
+DEFAULTS = {
+    'SLOW_REQUEST_MS': 500,
+    # Times the same query may run in a request before it is flagged
+    'DUPLICATE_QUERY_THRESHOLD': 5,
+    'PROFILE': False,
+    'PROFILE_HEADER': 'X-Profile',
+    'PROFILE_PARAM': 'profile',
+    'PROFILE_DIR': os.path.join(settings.BASE_DIR, 'profiles'),
+}
+
+
+def get_setting(name: str) -> Any:
+    return getattr(settings, 'GRADEUTILS_INSTRUMENTATION',
+                   {}).get(name, DEFAULTS[name])
+
+
+class QueryRecorder:
+    """Database execute wrapper timing and counting queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            # Parameters are passed separately, so repeats of a query with
+            # different values have the same SQL
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold: int):
+        """(SQL, count) pairs of the queries run at least threshold times."""
+        return [(sql, count) for sql, count in self.statements.most_common()
+                if count >= threshold]
+
+
+class RequestInstrumentationMiddleware:
+    """Time requests and their queries, logging the slow and repetitive."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile() if self.profiling(request) else None
+        start = time.perf_counter()
+        with self.recording(recorder):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        duration = time.perf_counter() - start
+
+        streamed = ' before streaming' if response.streaming else ''
+        response['Server-Timing'] = (
+            f'total;dur={duration * 1000:.1f}, '
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries{streamed}"'
+        )
+        if profiler is not None:
+            response['X-Profile'] = self.save_profile(profiler, request)
+        if response.streaming:
+            response.streaming_content = self.record_stream(
+                request, response, response.streaming_content, start,
+                recorder)
+        else:
+            self.log(request, response, duration, recorder)
+        return response
+
+    @staticmethod
+    @contextlib.contextmanager
+    def recording(recorder: QueryRecorder):
+        """Record the queries run on every connection in the block."""
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            yield
+
+    def record_stream(self, request, response, content: Iterable[bytes],
+                      start: float, recorder: QueryRecorder):
+        """Stream the content of the response, recording the queries run to
+        produce it, and log the request once the stream is closed."""
+        content = iter(content)
+        try:
+            while True:
+                with self.recording(recorder):
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.log(request, response, time.perf_counter() - start,
+                     recorder)
+
+    @staticmethod
+    def profiling(request) -> bool:
+        return get_setting('PROFILE') and bool(
+            request.META.get('HTTP_' + get_setting('PROFILE_HEADER')
+                             .upper().replace('-', '_'))
+            or get_setting('PROFILE_PARAM') in request.GET
+        )
+
+    @staticmethod
+    def save_profile(profiler: cProfile.Profile, request) -> str:
+        """Save a profile to the profile directory, returning its name."""
+        directory = get_setting('PROFILE_DIR')
+        os.makedirs(directory, exist_ok=True)
+        path = request.path.strip('/').replace('/', '.') or 'index'
+        name = f'{time.time_ns() // 1000000}-{os.getpid()}-{path}.prof'
+        profiler.dump_stats(os.path.join(directory, name))
+        return name
+
+    @staticmethod
+    def log(request, response, duration: float, recorder: QueryRecorder):
+        slow = duration * 1000 >= get_setting('SLOW_REQUEST_MS')
+        duplicates = recorder.duplicates(
+            get_setting('DUPLICATE_QUERY_THRESHOLD'))
+        if not slow and not duplicates:
+            return
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': recorder.count,
+            'query_duration_ms': round(recorder.duration * 1000, 1),
+            'slow': slow,
+            'duplicate_queries': [{'sql': sql, 'count': count}
+                                  for sql, count in duplicates],
+        }
+        logger.warning(json.dumps(record), extra={'request_stats': record})
@@ -0,0 +1,106 @@
+# Generated by Django 2.2.1 on 2026-10-17 02:53
+
+from collections import defaultdict
+from decimal import Decimal
+
+import core.models
+from django.db import migrations, models
+
+
+GRADE_POINTS = {
+    'A': 400, 'A-': 370, 'B+': 330, 'B': 300, 'B-': 270, 'C+': 230,
+    'C': 200, 'C-': 170, 'D+': 130, 'D': 100, 'F': 0,
+}
+
+
+def average(quality_points, credits):
+    """Average in hundredths of the totals, rounded half to even, as a
+    Decimal to two places."""
+    if not credits:
+        return Decimal('0.00')
+    quotient, remainder = divmod(quality_points, credits)
+    if (remainder * 2 > credits
+            or remainder * 2 == credits and quotient % 2):
+        quotient += 1
+    return Decimal(quotient).scaleb(-2)
+
+
+def populate_grade_totals(apps, schema_editor):
+    Student = apps.get_model('core', 'Student')
+    Trimester = apps.get_model('core', 'Trimester')
+    Course = apps.get_model('core', 'Course')
+
+    trimester_totals = defaultdict(lambda: [0, 0])
+    student_totals = defaultdict(lambda: [0, 0])
+    courses = Course.objects.values_list(
+        'trimester_id', 'trimester__student_id', 'credits', 'grade', 'retaken')
+    for trimester_id, student_id, credits, grade, retaken in courses:
+        if grade not in GRADE_POINTS:
+            continue
+        credits = int(Decimal(credits).scaleb(1).to_integral_value())
+        quality_points = credits * GRADE_POINTS[grade]
+        totals = [trimester_totals[trimester_id]]
+        if not retaken:
+            totals.append(student_totals[student_id])
+        for total in totals:
+            total[0] += credits
+            total[1] += quality_points
+
+    for model, totals, average_field in (
+            (Trimester, trimester_totals, 'stored_gpa'),
+            (Student, student_totals, 'stored_cgpa')):
+        for pk, (credits, quality_points) in totals.items():
+            model.objects.filter(pk=pk).update(**{
+                'counted_credits': credits,
+                'quality_points': quality_points,
+                average_field: average(quality_points, credits),
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_student_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='counted_credits',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='<em>Credits counted towards the CGPA, in tenths</em>'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='quality_points',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='<em>Credit-weighted grade points counted towards the CGPA, in thousandths</em>'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='stored_cgpa',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='CGPA'),
+        ),
+        migrations.AddField(
+            model_name='trimester',
+            name='counted_credits',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='<em>Credits counted towards the GPA, in tenths</em>'),
+        ),
+        migrations.AddField(
+            model_name='trimester',
+            name='quality_points',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='<em>Credit-weighted grade points counted towards the GPA, in thousandths</em>'),
+        ),
+        migrations.AddField(
+            model_name='trimester',
+            name='stored_gpa',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='GPA'),
+        ),
+        migrations.AlterField(
+            model_name='trimester',
+            name='code',
+            field=models.PositiveSmallIntegerField(help_text='<em>The numerical code of the trimester (eg. 152 for the Summer 2015 trimester)</em>', validators=[core.models.validate_trimester_code]),
+        ),
+        migrations.RunPython(
+            populate_grade_totals,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.1 on 2026-10-17 03:10
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_grade_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='code',
+            field=models.CharField(help_text='<em>The course code (eg. MAT116)</em>', max_length=7, validators=[django.core.validators.RegexValidator('^[A-Z]{3}\\d{3}[ABILR]?$')]),
+        ),
+    ]
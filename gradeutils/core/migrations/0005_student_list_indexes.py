@@ -0,0 +1,25 @@
+# Generated by Django 2.2.1 on 2026-10-17 03:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_course_code_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['program', 'slug'], name='student_program_slug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['-stored_cgpa', 'slug'], name='student_cgpa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['program', '-stored_cgpa', 'slug'], name='student_program_cgpa_idx'),
+        ),
+    ]
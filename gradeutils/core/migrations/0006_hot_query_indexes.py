@@ -0,0 +1,28 @@
+# Generated by Django 2.2.1 on 2026-10-17 03:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_student_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='trimester',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='courses', related_query_name='course', to='core.Trimester'),
+        ),
+        migrations.AlterField(
+            model_name='trimester',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='trimesters', related_query_name='trimester', to='core.Student'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['trimester', 'code', 'retaken', 'credits', 'grade'], name='course_covering_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.1 on 2026-10-17 03:31
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramSummary',
+            fields=[
+                ('program', models.CharField(choices=[('CSE', 'Computer Science and Engineering'), ('EEE', 'Electrical and Electronic Engineering'), ('ETE', 'Electronics and Telecommunication Engineering'), ('BBT', 'Biochemistry & Biotechnology'), ('MIC', 'Microbiology')], max_length=5, primary_key=True, serialize=False)),
+                ('students', models.PositiveIntegerField(default=0, help_text='<em>Number of ranked students (with graded credits)</em>')),
+                ('mean_cgpa', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=3)),
+                ('stale', models.BooleanField(default=True)),
+                ('refreshed', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'program summaries',
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentRank',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rank', serialize=False, to='core.Student')),
+                ('cgpa', models.DecimalField(decimal_places=2, max_digits=3)),
+                ('rank', models.PositiveIntegerField(help_text='<em>1 for the highest CGPA, shared by equal CGPAs</em>')),
+                ('percentile', models.DecimalField(decimal_places=2, help_text='<em>Percentage of the other students of the program with a lower CGPA</em>', max_digits=5)),
+                ('program', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ranks', to='core.ProgramSummary')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='studentrank',
+            index=models.Index(fields=['program', 'rank'], name='student_rank_program_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.1 on 2026-10-17 03:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_program_rankings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecomputeJob',
+            fields=[
+                ('student', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='recompute_job', serialize=False, to='core.Student')),
+                ('requests', models.PositiveIntegerField(default=1, help_text='<em>Number of requests coalesced into the job</em>')),
+                ('requested', models.DateTimeField(help_text='<em>When the earliest of the requests was made</em>')),
+                ('available', models.DateTimeField(help_text='<em>When the job may next be run</em>')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='<em>Number of failed runs</em>')),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recomputejob',
+            index=models.Index(fields=['available'], name='recompute_job_available_idx'),
+        ),
+    ]
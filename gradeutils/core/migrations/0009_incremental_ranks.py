@@ -0,0 +1,28 @@
+# Generated by Django 2.2.1 on 2026-10-17 04:16
+
+from django.db import migrations, models
+
+
+def mark_summaries_stale(apps, schema_editor):
+    # Their CGPA totals are computed when they are next refreshed as a whole
+    apps.get_model('core', 'ProgramSummary').objects.update(stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recompute_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='programsummary',
+            name='cgpa_total',
+            field=models.PositiveIntegerField(default=0, help_text='<em>Sum of the CGPAs of the ranked students, in hundredths</em>'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrank',
+            index=models.Index(fields=['program', 'cgpa'], name='student_rank_cgpa_idx'),
+        ),
+        migrations.RunPython(mark_summaries_stale, migrations.RunPython.noop),
+    ]
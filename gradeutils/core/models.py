@@ -1,13 +1,24 @@
+import contextlib
 import datetime as dt
+import threading
+from collections import defaultdict
 from decimal import Decimal
-from typing import Iterable, Union
+from typing import Iterable, List, Set, Tuple, Union
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import (Case, Exists, F, OuterRef, Q, Sum, Value,
+                              When)
+from django.db.models.functions import Cast, Coalesce, Round
+from django.dispatch import Signal
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
+from gradeutils import grading, planner
+
 
 def qdecimal(value: Union[int, float, Decimal, str],
              exp: Decimal = Decimal('1.00')) -> Decimal:
@@ -16,6 +27,95 @@ def qdecimal(value: Union[int, float, Decimal, str],
     return Decimal(x).quantize(exp)
 
 
+def average(quality_points: int, credits: int) -> Decimal:
+    """Return the quantized average of scaled aggregate totals.
+
+    Credits are counted in tenths and quality points in thousandths (tenths of
+    a credit times hundredths of a grade point), as annotated by the querysets
+    below.
+    """
+    return grading.average(quality_points, credits)
+
+
+def _scaled_credits(prefix: str = '') -> Cast:
+    """SQL expression for a course's credits in tenths."""
+    return Cast(Round(F(f'{prefix}credits') * 10), models.IntegerField())
+
+
+def _scaled_grade_point(prefix: str = '') -> Case:
+    """SQL expression for a course's grade point in hundredths."""
+    return Case(
+        *[
+            When(**{f'{prefix}grade': grade}, then=Value(point))
+            for grade, point in grading.GRADE_POINTS.items()
+            if point is not None
+        ],
+        output_field=models.IntegerField(),
+    )
+
+
+def _aggregate_annotations(prefix: str, counted: Q, name: str) -> dict:
+    """Credit-weighted grade point aggregates over the counted courses."""
+    return {
+        f'{name}_credits': Coalesce(
+            Sum(_scaled_credits(prefix), filter=counted), 0),
+        f'{name}_quality_points': Coalesce(
+            Sum(_scaled_credits(prefix) * _scaled_grade_point(prefix),
+                filter=counted), 0),
+    }
+
+
+def _average_annotation(name: str) -> Case:
+    """Approximate (unquantized) average, for ordering and filtering."""
+    return Case(
+        When(**{f'{name}_credits': 0}, then=Value(0.0)),
+        default=(F(f'{name}_quality_points') * 1.0
+                 / (F(f'{name}_credits') * 100)),
+        output_field=models.FloatField(),
+    )
+
+
+class StudentQuerySet(models.QuerySet):
+
+    def with_nsuid_prefix(self, prefix: str) -> models.QuerySet:
+        """Students whose NSU ID starts with the given digits.
+
+        Slugs start with the NSU ID, so this is a range lookup on the slug
+        index.
+        """
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.filter(slug__gte=prefix, slug__lt=upper)
+
+    def with_cgpa(self) -> models.QuerySet:
+        """Annotate each student with CGPA aggregates computed in SQL.
+
+        Adds ``cgpa_credits``, ``cgpa_quality_points`` (scaled as described
+        in ``average``) and ``cgpa_value``, a float suitable for ordering and
+        filtering. Retaken, withdrawn and incomplete courses are excluded.
+        """
+        counted = (Q(trimester__course__retaken=False)
+                   & ~Q(trimester__course__grade__in=Course.UNGRADED))
+        return (self
+                .annotate(**_aggregate_annotations(
+                    'trimester__course__', counted, 'cgpa'))
+                .annotate(cgpa_value=_average_annotation('cgpa')))
+
+
+class TrimesterQuerySet(models.QuerySet):
+
+    def with_gpa(self) -> models.QuerySet:
+        """Annotate each trimester with GPA aggregates computed in SQL.
+
+        Adds ``gpa_credits``, ``gpa_quality_points`` and ``gpa_value``, like
+        ``StudentQuerySet.with_cgpa``. Withdrawn and incomplete courses are
+        excluded.
+        """
+        counted = ~Q(course__grade__in=Course.UNGRADED)
+        return (self
+                .annotate(**_aggregate_annotations('course__', counted, 'gpa'))
+                .annotate(gpa_value=_average_annotation('gpa')))
+
+
 class Student(models.Model):
     """A student enrolled in a particular program."""
 
@@ -44,9 +144,43 @@ class Student(models.Model):
         editable=False,
         unique=True,
     )
+    counted_credits = models.PositiveIntegerField(
+        help_text='<em>Credits counted towards the CGPA, in tenths</em>',
+        default=0,
+        editable=False,
+    )
+    quality_points = models.PositiveIntegerField(
+        help_text='<em>Credit-weighted grade points counted towards the '
+                  'CGPA, in thousandths</em>',
+        default=0,
+        editable=False,
+    )
+    stored_cgpa = models.DecimalField(
+        verbose_name='CGPA',
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        editable=False,
+    )
+
+    objects = StudentQuerySet.as_manager()
 
     class Meta:
         ordering = ['nsuid']
+        indexes = [
+            models.Index(
+                fields=['program', 'slug'],
+                name='student_program_slug_idx',
+            ),
+            models.Index(
+                fields=['-stored_cgpa', 'slug'],
+                name='student_cgpa_idx',
+            ),
+            models.Index(
+                fields=['program', '-stored_cgpa', 'slug'],
+                name='student_program_cgpa_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['nsuid', 'program'],
@@ -58,9 +192,14 @@ class Student(models.Model):
         return f'{self.nsuid} ({self.program})'
 
     def save(self, *args, **kwargs):
-        self.slug = self.slug or slugify(f'{self.nsuid} {self.program}')
+        self.slug = self.slug or self.make_slug(self.nsuid, self.program)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def make_slug(nsuid: str, program: str) -> str:
+        """Slug identifying the student enrolled in the program."""
+        return slugify(f'{nsuid} {program}')
+
     def get_absolute_url(self):
         return reverse('student-detail', kwargs={'slug': self.slug})
 
@@ -74,27 +213,55 @@ class Student(models.Model):
                     .filter(trimester__code__lte=max_trimester)
                     .order_by('trimester__code'))
 
+    def takes(self) -> Tuple[List[grading.Take], Set[int]]:
+        """Courses taken by the enrolled student, and the codes of all their
+        trimesters.
+
+        Uses prefetched trimesters and courses if there are any, or a single
+        query otherwise.
+        """
+        if 'trimesters' in getattr(self, '_prefetched_objects_cache', {}):
+            trimesters = {trimester.code
+                          for trimester in self.trimesters.all()}
+            rows = (
+                (trimester.code, course.code, course.credits, course.grade)
+                for trimester in self.trimesters.all()
+                for course in trimester.courses.all()
+            )
+        else:
+            rows = (Trimester.objects
+                    .filter(student=self)
+                    .order_by('code')
+                    .values_list('code', 'course__code', 'course__credits',
+                                 'course__grade'))
+            trimesters = set()
+        takes = []
+        for trimester, code, credits, grade in rows:
+            trimesters.add(trimester)
+            if code is not None:
+                takes.append(grading.Take(
+                    trimester, code, grading.scale_credits(credits), grade))
+        return takes, trimesters
+
+    def timeline(self) -> List[grading.TimelineEntry]:
+        """Term-by-term GPA, CGPA and credits of the enrolled student."""
+        return grading.timeline(*self.takes())
+
+    def plan(self, courses: Iterable[planner.PlannedCourse],
+             target: Decimal = None, limit: int = 10) -> planner.Plan:
+        """Outcome of, or grades needed to reach a target CGPA with, the
+        courses planned for the next trimester. Nothing is written."""
+        takes, trimesters = self.takes()
+        trimester = (Trimester.next_code(max(trimesters)) if trimesters
+                     else None)
+        return planner.plan(takes, courses, trimester, target, limit)
+
     @property
     def cumulative_grade_point_average(self) -> Decimal:
         """CGPA of the enrolled student (out of 4)."""
-        courses: Iterable[Course] = self.course_list()
-        cgpa_numerator = sum([
-            course.credits * course.grade_point
-            for course in courses
-            if not course.retaken
-            and course.grade_point
-        ], qdecimal(0))
-        cgpa_denominator = sum([
-            course.credits
-            for course in courses
-            if not course.retaken
-            and course.grade_point
-        ], qdecimal(0))
-        cgpa = (
-            0 if cgpa_denominator.is_zero()
-            else cgpa_numerator / cgpa_denominator
-        )
-        return qdecimal(cgpa)
+        if hasattr(self, 'cgpa_quality_points'):
+            return average(self.cgpa_quality_points, self.cgpa_credits)
+        return qdecimal(self.stored_cgpa)
 
     @property
     def cgpa(self) -> Decimal:
@@ -121,6 +288,7 @@ class Trimester(models.Model):
         related_name='trimesters',
         related_query_name='trimester',
         on_delete=models.CASCADE,
+        db_index=False,  # Indexed first by the unique constraint
     )
     code = models.PositiveSmallIntegerField(
         help_text='<em>The numerical code of the trimester '
@@ -129,6 +297,26 @@ class Trimester(models.Model):
             validate_trimester_code,
         ],
     )
+    counted_credits = models.PositiveIntegerField(
+        help_text='<em>Credits counted towards the GPA, in tenths</em>',
+        default=0,
+        editable=False,
+    )
+    quality_points = models.PositiveIntegerField(
+        help_text='<em>Credit-weighted grade points counted towards the '
+                  'GPA, in thousandths</em>',
+        default=0,
+        editable=False,
+    )
+    stored_gpa = models.DecimalField(
+        verbose_name='GPA',
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        editable=False,
+    )
+
+    objects = TrimesterQuerySet.as_manager()
 
     class Meta:
         order_with_respect_to = 'student'
@@ -142,24 +330,36 @@ class Trimester(models.Model):
     def __str__(self):
         return f'{self.code} ({self.student})'
 
+    def save(self, *args, **kwargs):
+        if self.pk is None or grade_totals_deferred():
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            previous = (Trimester.objects.filter(pk=self.pk)
+                        .values_list('student_id', 'code').first())
+            super().save(*args, **kwargs)
+            if previous in (None, (self.student_id, self.code)):
+                return
+            # Which takes of its courses are retaken depends on the
+            # trimester's code, and its totals count towards its student's
+            students = {previous[0], self.student_id}
+            if recompute_queued():
+                RecomputeJob.objects.enqueue(students)
+            else:
+                resolve_retakes(students, adjust_totals=False)
+                rebuild_grade_totals(Student.objects.filter(pk__in=students))
+
+    @staticmethod
+    def next_code(code: int) -> int:
+        """Code of the trimester following the one with the given code."""
+        return code + 1 if code % 10 < 3 else (code // 10 + 1) * 10 + 1
+
     @property
     def grade_point_average(self) -> Decimal:
         """Grade point average in the trimester."""
-        gpa_numerator = sum([
-            course.credits * course.grade_point
-            for course in self.courses
-            if course.grade_point
-        ], qdecimal(0))
-        gpa_denominator = sum([
-            course.credits
-            for course in self.courses
-            if course.grade_point
-        ], qdecimal(0))
-        gpa = (
-            0 if gpa_denominator.is_zero()
-            else gpa_numerator / gpa_denominator
-        )
-        return qdecimal(gpa)
+        if hasattr(self, 'gpa_quality_points'):
+            return average(self.gpa_quality_points, self.gpa_credits)
+        return qdecimal(self.stored_gpa)
 
     @property
     def gpa(self) -> Decimal:
@@ -186,14 +386,18 @@ class Course(models.Model):
         ('I', 'I'),
     )
 
+    # Grades that carry no grade point and are left out of GPA calculations
+    UNGRADED = grading.UNGRADED
+
     trimester = models.ForeignKey(
         Trimester,
         related_name='courses',
         related_query_name='course',
         on_delete=models.CASCADE,
+        db_index=False,  # Indexed first by the unique constraint
     )
     code = models.CharField(
-        max_length=4,
+        max_length=7,
         help_text='<em>The course code (eg. MAT116)</em>',
         validators=(RegexValidator(r'^[A-Z]{3}\d{3}[ABILR]?$'),),
     )
@@ -220,25 +424,111 @@ class Course(models.Model):
                 name='unique_course_per_trimester',
             ),
         ]
+        indexes = [
+            # Covers the retake lookups by trimester and code, and the
+            # per-student reads of credits, grades and retaken flags, so
+            # they need not read the table
+            models.Index(
+                fields=['trimester', 'code', 'retaken', 'credits', 'grade'],
+                name='course_covering_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.code}, {self.trimester}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the stored state around so that saves can update the
+        # aggregate totals by their difference
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
+        deferred = grade_totals_deferred()
+        if not deferred and recompute_queued():
+            # Queue the students of the course as saved and as it was
+            students = Q(trimester=self.trimester_id)
+            if self.pk is not None:
+                students |= Q(trimester__course=self.pk)
+            RecomputeJob.objects.enqueue(Student.objects.filter(students)
+                                         .values_list('pk', flat=True))
+            deferred = True
+        previous = None if deferred else self.stored_contribution(refresh=True)
+        if previous is not None:
+            # The retaken flag is derived data and may have changed in the
+            # database since this instance was loaded
+            self.retaken = previous[3]
         super().save(*args, **kwargs)
-
-        # Mark all previous takes of this course as retaken
-        takes: Iterable[Course] = Course.objects.filter(
-            trimester__student=self.trimester.student,
-            trimester__code__lt=self.trimester.code,
-            code=self.code,
-            retaken=False
+        self._loaded_values = {
+            'trimester_id': self.trimester_id,
+            'credits': self.credits,
+            'grade': self.grade,
+            'retaken': self.retaken,
+        }
+        if deferred:
+            # Brought up to date when the deferral ends
+            return
+
+        credits, quality_points = self.scaled_totals(self.credits, self.grade)
+        if previous is None:
+            adjust_grade_totals(self.trimester_id, credits, quality_points,
+                                student=not self.retaken)
+        elif previous[0] == self.trimester_id:
+            adjust_grade_totals(self.trimester_id,
+                                credits - previous[1],
+                                quality_points - previous[2],
+                                student=not self.retaken)
+        else:
+            adjust_grade_totals(previous[0], -previous[1], -previous[2],
+                                student=not previous[3])
+            adjust_grade_totals(self.trimester_id, credits, quality_points,
+                                student=not self.retaken)
+
+        # Re-resolve retakes for the student(s) whose courses changed
+        student_ids = {self.trimester.student_id}
+        if previous is not None and previous[0] != self.trimester_id:
+            student_ids.update(
+                Trimester.objects.filter(pk=previous[0])
+                .values_list('student_id', flat=True))
+        if resolve_retakes(student_ids):
+            self.retaken = self._loaded_values['retaken'] = (
+                Course.objects.filter(pk=self.pk)
+                .values_list('retaken', flat=True).get())
+
+    def stored_contribution(
+            self, refresh: bool = False,
+    ) -> Union[Tuple[int, int, int, bool], None]:
+        """Trimester, scaled totals and retaken flag as last saved.
+
+        The values are taken from the row this instance was loaded from,
+        unless refresh is True. Returns None if the course is not saved.
+        """
+        if self.pk is None:
+            return None
+        values = getattr(self, '_loaded_values', {})
+        fields = ('trimester_id', 'credits', 'grade', 'retaken')
+        if refresh or any(values.get(field, models.DEFERRED)
+                          is models.DEFERRED for field in fields):
+            try:
+                values = (Course.objects.filter(pk=self.pk)
+                          .values(*fields).get())
+            except Course.DoesNotExist:
+                return None
+        return (
+            values['trimester_id'],
+            *self.scaled_totals(values['credits'], values['grade']),
+            values['retaken'],
         )
-        for take in takes:
-            take.retaken = True
-            # Use the default save method instead of this (overridden) one in
-            # order to avoid recursive saving
-            super(Course, take).save(update_fields=['retaken'])
+
+    @classmethod
+    def scaled_totals(cls, credits: Union[Decimal, str],
+                      grade: str) -> Tuple[int, int]:
+        """Credits (in tenths) and quality points (in thousandths) counted
+        towards an average for a course with the given credits and grade."""
+        return grading.counted_totals(grading.scale_credits(credits), grade)
 
     @property
     def grade_point(self) -> Union[Decimal, None]:
@@ -253,19 +543,370 @@ class Course(models.Model):
     @staticmethod
     def map_grade_to_point(grade: str) -> Union[Decimal, None]:
         """Map a grade string to a numerical grade point."""
-        mapping = {
-            'A': qdecimal(4.00),
-            'A-': qdecimal(3.70),
-            'B+': qdecimal(3.30),
-            'B': qdecimal(3.00),
-            'B-': qdecimal(2.70),
-            'C+': qdecimal(2.30),
-            'C': qdecimal(2.00),
-            'C-': qdecimal(1.70),
-            'D+': qdecimal(1.30),
-            'D': qdecimal(1.00),
-            'F': qdecimal(0.00),
-            'W': None,
-            'I': None
-        }
-        return mapping.get(grade, None)
+        return _GRADE_POINTS.get(grade, None)
+
+
+class ProgramSummary(models.Model):
+    """Precomputed CGPA statistics of the students of a program.
+
+    Kept up to date by core.analytics, along with the program's
+    StudentRanks, when grades change.
+    """
+
+    program = models.CharField(
+        max_length=5,
+        choices=Student.PROGRAM_CHOICES,
+        primary_key=True,
+    )
+    students = models.PositiveIntegerField(
+        help_text='<em>Number of ranked students (with graded credits)</em>',
+        default=0,
+    )
+    mean_cgpa = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=Decimal('0.00'),
+    )
+    cgpa_total = models.PositiveIntegerField(
+        help_text='<em>Sum of the CGPAs of the ranked students, in '
+                  'hundredths</em>',
+        default=0,
+    )
+    stale = models.BooleanField(default=True)
+    refreshed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'program summaries'
+
+    def __str__(self):
+        return self.program
+
+
+class StudentRank(models.Model):
+    """Precomputed rank of a student by CGPA within their program."""
+
+    student = models.OneToOneField(
+        Student,
+        related_name='rank',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    program = models.ForeignKey(
+        ProgramSummary,
+        related_name='ranks',
+        on_delete=models.CASCADE,
+        db_index=False,  # Indexed first by student_rank_program_idx
+    )
+    cgpa = models.DecimalField(max_digits=3, decimal_places=2)
+    rank = models.PositiveIntegerField(
+        help_text='<em>1 for the highest CGPA, shared by equal CGPAs</em>',
+    )
+    percentile = models.DecimalField(
+        help_text='<em>Percentage of the other students of the program '
+                  'with a lower CGPA</em>',
+        max_digits=5,
+        decimal_places=2,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['program', 'rank'],
+                name='student_rank_program_idx',
+            ),
+            # Covers the re-ranking of the students between two CGPAs
+            models.Index(
+                fields=['program', 'cgpa'],
+                name='student_rank_cgpa_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.student}: {self.rank}'
+
+
+class RecomputeJobQuerySet(models.QuerySet):
+
+    def enqueue(self, students: Iterable[int]):
+        """Queue recomputes of the students (primary keys).
+
+        Students that are already queued have the request counted in their
+        pending job instead.
+        """
+        students = set(students)
+        if not students:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            self.filter(student__in=students).update(
+                requests=F('requests') + 1)
+            self.bulk_create(
+                [RecomputeJob(student_id=pk, requested=now, available=now)
+                 for pk in students],
+                ignore_conflicts=True,
+            )
+
+
+class RecomputeJob(models.Model):
+    """A pending recompute of a student's retakes, totals and rank.
+
+    There is at most one per student: further requests made before it runs
+    are coalesced into it (see core.jobs).
+    """
+
+    # Deleting a student deletes their courses first, queuing the student
+    # again; the job of a deleted student is dropped when it runs
+    student = models.OneToOneField(
+        Student,
+        related_name='recompute_job',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+    )
+    requests = models.PositiveIntegerField(
+        help_text='<em>Number of requests coalesced into the job</em>',
+        default=1,
+    )
+    requested = models.DateTimeField(
+        help_text='<em>When the earliest of the requests was made</em>',
+    )
+    available = models.DateTimeField(
+        help_text='<em>When the job may next be run</em>',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        help_text='<em>Number of failed runs</em>',
+        default=0,
+    )
+    last_error = models.TextField(blank=True)
+
+    objects = RecomputeJobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['available'],
+                name='recompute_job_available_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.student} ({self.requests} requests)'
+
+
+# Decimal forms of the grade points, for Course.map_grade_to_point
+_GRADE_POINTS = {
+    grade: None if point is None else grading.to_decimal(point)
+    for grade, point in grading.GRADE_POINTS.items()
+}
+
+
+def resolve_retakes(students: Iterable = None,
+                    adjust_totals: bool = True) -> int:
+    """Recompute the retaken flags of courses with a single UPDATE.
+
+    A course is retaken if the same student has taken a course with the same
+    code in a later trimester. Only the courses of the given students (a
+    queryset or iterable of primary keys) are considered, or every course if
+    students is None. Returns the number of courses whose flag changed.
+
+    The stored CGPA totals of the students are adjusted for those courses
+    unless adjust_totals is False, in which case they should be rebuilt.
+    """
+    courses = Course.objects.all()
+    if students is not None:
+        courses = courses.filter(trimester__student__in=students)
+    later_takes = Course.objects.filter(
+        trimester__student=OuterRef('trimester__student'),
+        trimester__code__gt=OuterRef('trimester__code'),
+        code=OuterRef('code'),
+    )
+    retaken = (courses
+               .annotate(has_later_take=Exists(later_takes))
+               .filter(has_later_take=True)
+               .values('pk'))
+    changed = courses.filter(Q(retaken=False, pk__in=retaken)
+                             | Q(retaken=True) & ~Q(pk__in=retaken))
+
+    with transaction.atomic():
+        deltas = defaultdict(lambda: [0, 0])
+        if adjust_totals:
+            rows = changed.values_list(
+                'trimester__student_id', 'credits', 'grade', 'retaken')
+            for student_id, credits, grade, was_retaken in rows:
+                sign = 1 if was_retaken else -1
+                delta = deltas[student_id]
+                for i, total in enumerate(
+                        Course.scaled_totals(credits, grade)):
+                    delta[i] += sign * total
+            if not deltas:
+                return 0
+
+        count = changed.update(retaken=Case(
+            When(pk__in=retaken, then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ))
+        for student_id, (credits, quality_points) in deltas.items():
+            if credits or quality_points:
+                _increment_totals(Student.objects.filter(pk=student_id),
+                                  'stored_cgpa', credits, quality_points)
+    return count
+
+
+def _increment_totals(queryset: models.QuerySet, average_field: str,
+                      credits: int, quality_points: int):
+    """Shift the stored totals of the queried rows and refresh the average."""
+    queryset.update(
+        counted_credits=F('counted_credits') + credits,
+        quality_points=F('quality_points') + quality_points,
+    )
+    for pk, counted_credits, total_points in queryset.values_list(
+            'pk', 'counted_credits', 'quality_points'):
+        queryset.model.objects.filter(pk=pk).update(
+            **{average_field: average(total_points, counted_credits)})
+
+
+def adjust_grade_totals(trimester_id: int, credits: int, quality_points: int,
+                        trimester: bool = True, student: bool = True):
+    """Apply a change in counted credits and quality points to the stored
+    totals of a trimester and/or its student."""
+    if not (credits or quality_points):
+        return
+    with transaction.atomic():
+        if trimester:
+            _increment_totals(Trimester.objects.filter(pk=trimester_id),
+                              'stored_gpa', credits, quality_points)
+        if student:
+            _increment_totals(Student.objects.filter(trimester=trimester_id),
+                              'stored_cgpa', credits, quality_points)
+
+
+def rebuild_grade_totals(students: models.QuerySet = None,
+                         commit: bool = True,
+                         batch_size: int = 500) -> list:
+    """Recompute the stored totals from the course rows.
+
+    Returns the trimesters and students whose stored totals were out of date.
+    Those are saved with the recomputed values unless commit is False.
+    """
+    if students is None:
+        students = Student.objects.all()
+    stale = []
+    querysets = (
+        (Trimester.objects.filter(student__in=students).with_gpa(),
+         'gpa', 'stored_gpa'),
+        (students.with_cgpa(), 'cgpa', 'stored_cgpa'),
+    )
+    for queryset, name, average_field in querysets:
+        fields = ['counted_credits', 'quality_points', average_field]
+        batch = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            credits = getattr(obj, f'{name}_credits')
+            total_points = getattr(obj, f'{name}_quality_points')
+            expected = (credits, total_points, average(total_points, credits))
+            if tuple(getattr(obj, field) for field in fields) == expected:
+                continue
+            for field, value in zip(fields, expected):
+                setattr(obj, field, value)
+            stale.append(obj)
+            batch.append(obj)
+            if commit and len(batch) >= batch_size:
+                queryset.model.objects.bulk_update(batch, fields)
+                batch = []
+        if commit and batch:
+            queryset.model.objects.bulk_update(batch, fields)
+    return stale
+
+
+_deferred = threading.local()
+
+# Sent with the primary keys of the students whose stored totals and
+# retaken flags were brought up to date (or queued to be) at the end of
+# deferred_grade_totals
+grade_totals_updated = Signal(providing_args=['students'])
+
+
+def recompute_queued() -> bool:
+    """Whether the upkeep of stored totals and retaken flags of course
+    changes is left to the recompute queue (see core.jobs)."""
+    return getattr(settings, 'GRADEUTILS_RECOMPUTE', {}).get('ASYNC', False)
+
+
+def grade_totals_deferred() -> bool:
+    """Whether the upkeep of stored totals and retaken flags is deferred in
+    the current thread (see deferred_grade_totals)."""
+    return getattr(_deferred, 'students', None) is not None
+
+
+@contextlib.contextmanager
+def deferred_grade_totals(students: Iterable):
+    """Defer the upkeep of stored totals and retaken flags of course changes
+    to the end of the block.
+
+    Saving or deleting a course normally adjusts the stored totals and
+    resolves the retakes of its student at once. Inside the block it only
+    writes the course; the retakes and totals of the given students (primary
+    keys), which should include every student whose courses change, are
+    recomputed in a single pass at the end, or queued if recomputes are
+    (see recompute_queued). Likewise, grade_totals_updated is sent once at
+    the end, to invalidate their cached data and program ranks, rather
+    than on every trimester and course saved. The whole block runs in one
+    transaction. Nested blocks add their students to the outermost one.
+    """
+    if grade_totals_deferred():
+        _deferred.students.update(students)
+        yield
+        return
+    _deferred.students = set(students)
+    try:
+        with transaction.atomic():
+            yield
+            students = _deferred.students
+            if recompute_queued():
+                RecomputeJob.objects.enqueue(students)
+            else:
+                resolve_retakes(students, adjust_totals=False)
+                rebuild_grade_totals(Student.objects.filter(pk__in=students))
+            grade_totals_updated.send(sender=Student, students=students)
+    finally:
+        _deferred.students = None
+
+
+def reorder_trimesters(student_id: int) -> List[Trimester]:
+    """Put the trimesters of the student in chronological order, returning
+    them in that order."""
+    trimesters = list(
+        Trimester.objects.filter(student_id=student_id).order_by('code'))
+    reordered = []
+    for order, trimester in enumerate(trimesters):
+        if trimester._order != order:
+            trimester._order = order
+            reordered.append(trimester)
+    Trimester.objects.bulk_update(reordered, ['_order'])
+    return trimesters
+
+
+def enter_trimester(student: Student, code: int,
+                    courses: Iterable[Course]) -> Trimester:
+    """Create a trimester of the student along with all its courses.
+
+    The courses are inserted at once, and the retakes and stored totals of
+    the student brought up to date in a single pass, all in one transaction.
+    Raises ValidationError if the student already has the trimester.
+    """
+    courses = list(courses)
+    with deferred_grade_totals([student.pk]):
+        try:
+            with transaction.atomic():
+                trimester = Trimester.objects.create(student=student,
+                                                     code=code)
+        except IntegrityError:
+            # Entered by another request since it was checked for
+            raise ValidationError(
+                {'code': f'Trimester {code} is already entered'})
+        # An earlier trimester may be entered late
+        reorder_trimesters(student.pk)
+        for course in courses:
+            course.trimester = trimester
+        Course.objects.bulk_create(courses)
+    return trimester
@@ -0,0 +1,171 @@
+"""Checking the query plans of the hot queries.
+
+The hot queries are the ones run for a single student or a single page:
+saving and deleting courses (with their retake resolution), the student
+views and the JSON API. They are captured by running those code paths on a
+sample student, in a transaction that is rolled back, and their plans are
+read with SQLite's EXPLAIN QUERY PLAN. The cache they use is a private
+in-memory one, so that checking the plans leaves the cached pages alone.
+
+Queries over whole tables on purpose, such as rebuilding every total or
+exporting every transcript, are not hot queries and are not checked.
+"""
+import re
+from decimal import Decimal
+from typing import Callable, List, NamedTuple, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+
+from . import analytics, cache, models
+
+CACHE_ALIAS = 'query-plans'
+
+# A SCAN without USING (COVERING) INDEX reads every row of the table
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?! USING)(?:$| )')
+
+
+class CapturedQuery(NamedTuple):
+    scenario: str
+    sql: str
+    params: tuple
+
+
+class QueryPlan(NamedTuple):
+    scenario: str
+    sql: str
+    plan: List[str]
+
+    @property
+    def full_scans(self) -> List[str]:
+        """Tables read in full by the query."""
+        return [match.group(1) for match in map(FULL_SCAN.match, self.plan)
+                if match]
+
+
+class _Recorder:
+
+    def __init__(self):
+        self.scenario = None
+        self.queries: List[CapturedQuery] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(
+                ('SELECT', 'UPDATE', 'DELETE')):
+            self.queries.append(
+                CapturedQuery(self.scenario, sql, tuple(params or ())))
+        return execute(sql, params, many, context)
+
+
+def _scenarios() -> List[Tuple[str, Callable[[], None]]]:
+    student = models.Student.objects.create(nsuid='0000000', program='CSE')
+    first = models.Trimester.objects.create(student=student, code=171)
+    second = models.Trimester.objects.create(student=student, code=172)
+    taken = models.Course.objects.create(
+        trimester=first, code='CSE115', credits=Decimal('3.0'), grade='F')
+
+    def get(name: str, *args, query: str = ''):
+        def request():
+            # Called without the middleware, which need a valid host
+            path = reverse(name, args=args)
+            cache.bump_all()
+            match = resolve(path)
+            response = match.func(RequestFactory().get(path + query),
+                                  *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            assert response.status_code == 200, (name, response.status_code)
+        return request
+
+    def save_course():
+        taken.grade = 'D'
+        taken.save()
+
+    def retake_course():
+        models.Course.objects.create(
+            trimester=second, code='CSE115', credits=Decimal('3.0'),
+            grade='B')
+
+    def rerank_course():
+        retake = models.Course.objects.get(trimester=second, code='CSE115')
+        retake.grade = 'A'
+        retake.save()
+        analytics.rerank([student.pk])
+
+    def delete_course():
+        models.Course.objects.get(trimester=second, code='CSE115').delete()
+
+    return [
+        ('Course.save', save_course),
+        ('Course.save (retake)', retake_course),
+        ('Student.timeline', lambda: models.Student.objects.get(
+            pk=student.pk).timeline()),
+        ('student-detail', get('student-detail', student.slug)),
+        ('student-timeline', get('student-timeline', student.slug)),
+        ('student-list', get('student-list')),
+        ('student-list (next page)',
+         get('student-list', query=f'?after={student.slug}')),
+        ('student-list (search)', get('student-list', query='?q=000')),
+        ('student-list (program)',
+         get('student-list', query='?program=CSE&sort=cgpa')),
+        ('student-list (cgpa)',
+         get('student-list', query=f'?sort=cgpa&after=2.00_{student.slug}')),
+        ('api-student-summaries', get(
+            'api-student-summaries',
+            query=f'?ids={student.slug},{student.nsuid}')),
+        ('api-student-transcript',
+         get('api-student-transcript', student.slug)),
+        # Run on commit of grade changes, which never comes here
+        ('analytics.refresh', lambda: analytics.refresh(student.program)),
+        ('analytics.rerank', rerank_course),
+        ('api-student-rank', get('api-student-rank', student.slug)),
+        ('program-detail', get('program-detail', student.program)),
+        ('Course.delete', delete_course),
+    ]
+
+
+def capture_hot_queries() -> List[CapturedQuery]:
+    """Run the hot code paths on a sample student, capturing their queries.
+
+    Nothing they write, to the database or the cache, is kept.
+    """
+    recorder = _Recorder()
+    private_cache = override_settings(
+        CACHES={**settings.CACHES, CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': CACHE_ALIAS,
+        }},
+        GRADEUTILS_CACHE={**getattr(settings, 'GRADEUTILS_CACHE', {}),
+                          'ALIAS': CACHE_ALIAS},
+    )
+    with private_cache, transaction.atomic():
+        scenarios = _scenarios()
+        with connection.execute_wrapper(recorder):
+            for name, scenario in scenarios:
+                recorder.scenario = name
+                scenario()
+        transaction.set_rollback(True)
+
+    unique, seen = [], set()
+    for query in recorder.queries:
+        if (query.scenario, query.sql) not in seen:
+            seen.add((query.scenario, query.sql))
+            unique.append(query)
+    return unique
+
+
+def explain(query: CapturedQuery) -> QueryPlan:
+    """The query plan of a captured query."""
+    if connection.vendor != 'sqlite':
+        raise NotImplementedError('Query plans are only read from SQLite')
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {query.sql}', query.params)
+        # Rows are (id, parent, notused, detail)
+        plan = [row[-1] for row in cursor.fetchall()]
+    return QueryPlan(query.scenario, query.sql, plan)
+
+
+def hot_query_plans() -> List[QueryPlan]:
+    return [explain(query) for query in capture_hot_queries()]
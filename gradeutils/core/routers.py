@@ -0,0 +1,152 @@
+"""Routing of reads to replica databases.
+
+Writes always go to the primary ('default') database. Reads go to one of
+the replicas listed in GRADEUTILS_REPLICATION, but only within requests
+handled by ReplicaRoutingMiddleware, and only until the request writes
+anything (or is not a GET or HEAD). From then on, and in the requests of
+the same client for STICKY_SECONDS after (tracked with a cookie), they go
+to the primary, so that a client always reads its own writes. Outside of
+requests, eg. in management commands, everything goes to the primary.
+
+A replica that cannot be connected to is left out for FAILOVER_SECONDS.
+When no replica is left, reads go to the primary.
+
+Reads whose results are cached (see core/cache.py) go to the primary, so
+that data read from a replica lagging behind is never cached under the
+version of a later write.
+"""
+import contextlib
+import logging
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+
+DEFAULTS = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': 5,
+    'STICKY_COOKIE': 'read_primary_until',
+    'FAILOVER_SECONDS': 30,
+}
+
+_request = threading.local()
+
+# Replicas found unavailable, and until when they are left out
+_down_until = {}
+
+
+def get_setting(name: str) -> Any:
+    return getattr(settings, 'GRADEUTILS_REPLICATION',
+                   {}).get(name, DEFAULTS[name])
+
+
+def reading_from_replicas() -> bool:
+    return (getattr(_request, 'replicas_allowed', False)
+            and not getattr(_request, 'pinned', False)
+            and not connections[PRIMARY].in_atomic_block)
+
+
+def pin_to_primary():
+    """Send the reads of the rest of the request to the primary."""
+    _request.pinned = True
+
+
+@contextlib.contextmanager
+def reading_from_primary():
+    """Send the reads of the block to the primary."""
+    pinned = getattr(_request, 'pinned', False)
+    _request.pinned = True
+    try:
+        yield
+    finally:
+        # Reads after a write in the block stay on the primary
+        _request.pinned = pinned or getattr(_request, 'wrote', False)
+
+
+def available(alias: str) -> bool:
+    """Whether a replica can be connected to, failing over if not."""
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError as error:
+        logger.warning('Replica %s is unavailable, failing over: %s',
+                       alias, error)
+        _down_until[alias] = time.monotonic() + get_setting(
+            'FAILOVER_SECONDS')
+        return False
+    _down_until.pop(alias, None)
+    return True
+
+
+def choose_replica() -> Optional[str]:
+    """An available replica, the same one for the whole request."""
+    replica = getattr(_request, 'replica', None)
+    if replica is not None and _down_until.get(replica, 0) <= time.monotonic():
+        return replica
+    replicas = list(get_setting('REPLICAS'))
+    random.shuffle(replicas)
+    _request.replica = next(filter(available, replicas), None)
+    return _request.replica
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replicas():
+            return choose_replica() or PRIMARY
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        if getattr(_request, 'replicas_allowed', False):
+            _request.wrote = True
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *get_setting('REPLICAS')}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary
+        if db in get_setting('REPLICAS'):
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Let the reads of safe requests go to the replicas, until they write."""
+
+    SAFE_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = get_setting('STICKY_COOKIE')
+        try:
+            sticky = float(request.COOKIES.get(cookie, 0)) > time.time()
+        except ValueError:
+            sticky = False
+        _request.replicas_allowed = True
+        _request.pinned = sticky or request.method not in self.SAFE_METHODS
+        _request.wrote = False
+        _request.replica = None
+        try:
+            response = self.get_response(request)
+            if _request.wrote and get_setting('REPLICAS'):
+                seconds = get_setting('STICKY_SECONDS')
+                response.set_cookie(cookie, str(time.time() + seconds),
+                                    max_age=seconds, httponly=True)
+        finally:
+            _request.__dict__.clear()
+        return response
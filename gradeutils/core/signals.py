@@ -0,0 +1,68 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics, cache, models
+
+
+@receiver(post_delete, sender=models.Course)
+def subtract_deleted_course(sender, instance, **kwargs):
+    """Take a deleted course out of the stored grade totals, and restore
+    any earlier take that it superseded."""
+    if models.grade_totals_deferred():
+        return
+    if models.recompute_queued():
+        models.RecomputeJob.objects.enqueue(models.Student.objects.filter(
+            trimester=instance.trimester_id).values_list('pk', flat=True))
+        return
+    previous = instance.stored_contribution()
+    if previous is None:
+        return
+    trimester_id, credits, quality_points, retaken = previous
+    models.adjust_grade_totals(trimester_id, -credits, -quality_points,
+                               student=not retaken)
+    if not retaken:
+        # No-op if the trimester was deleted along with the course
+        models.resolve_retakes(
+            models.Student.objects.filter(trimester=trimester_id))
+
+
+def invalidate_students(students: QuerySet):
+    """Invalidate the cached data and program ranks of the students."""
+    students = list(students.values_list('pk', 'slug'))
+    cache.bump_students(*(slug for _, slug in students))
+    analytics.update_ranks(pk for pk, _ in students)
+
+
+@receiver(models.grade_totals_updated, sender=models.Student)
+def invalidate_updated_students(sender, students, **kwargs):
+    invalidate_students(models.Student.objects.filter(pk__in=students))
+
+
+@receiver(post_save, sender=models.Student)
+@receiver(post_delete, sender=models.Student)
+def invalidate_student(sender, instance, signal, **kwargs):
+    cache.bump_students(instance.slug)
+    if signal is post_delete:
+        # Everyone ranked below the student moves up
+        analytics.mark_stale([instance.program])
+    else:
+        analytics.update_ranks([instance.pk])
+
+
+@receiver(post_save, sender=models.Trimester)
+@receiver(post_delete, sender=models.Trimester)
+def invalidate_trimester(sender, instance, **kwargs):
+    if models.grade_totals_deferred():
+        # Invalidated once when the deferral ends
+        return
+    invalidate_students(models.Student.objects.filter(pk=instance.student_id))
+
+
+@receiver(post_save, sender=models.Course)
+@receiver(post_delete, sender=models.Course)
+def invalidate_course(sender, instance, **kwargs):
+    if models.grade_totals_deferred():
+        return
+    invalidate_students(
+        models.Student.objects.filter(trimester=instance.trimester_id))
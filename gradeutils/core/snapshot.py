@@ -0,0 +1,339 @@
+"""Read-only binary snapshots of the gradebook, read through mmap.
+
+A snapshot holds every student, trimester and course in fixed-width
+records, in NumPy arrays laid end to end after a header:
+
+    header | slugs | students | ids | id_index | trimesters | courses
+
+Students are sorted by slug, and their trimesters and courses follow the
+same order, so each student record holds the offset and number of its
+trimesters, and each trimester record those of its courses. ids holds the
+student ids in order, and id_index the position of each one's record.
+
+Snapshot maps the file and views the arrays in place, so opening one reads
+nothing but the header, and lookups are binary searches that never touch
+the ORM. A snapshot is built to a temporary file that then replaces the
+previous one, and current() opens the new file when it sees the
+replacement; readers of the old one keep their mapping of it until they
+let go of it.
+
+The path of the snapshot is read from GRADEUTILS_SNAPSHOT.
+"""
+import mmap
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from typing import Any, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from gradeutils import grading
+
+from . import models
+
+DEFAULTS = {
+    'PATH': os.path.join(settings.BASE_DIR, 'snapshots',
+                         'gradebook.snapshot'),
+    # Seconds between checks for a new snapshot by current()
+    'CHECK_INTERVAL': 1,
+}
+
+# NumPy strips trailing NULs from bytes fields, so none are used
+MAGIC = b'GRADEBKS'
+VERSION = 1
+
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('students', '<u4'),
+    ('trimesters', '<u4'),
+    ('courses', '<u4'),
+    ('built', '<f8'),
+])
+SLUG = np.dtype('S13')
+STUDENT = np.dtype([
+    ('id', '<i8'),
+    ('nsuid', 'S7'),
+    ('program', 'S5'),
+    ('counted_credits', '<u4'),  # in tenths
+    ('quality_points', '<u8'),  # in thousandths
+    ('cgpa', '<u2'),  # in hundredths
+    ('first_trimester', '<u4'),
+    ('trimesters', '<u2'),
+])
+ID = np.dtype('<i8')
+INDEX = np.dtype('<u4')
+TRIMESTER = np.dtype([
+    ('code', '<u2'),
+    ('counted_credits', '<u4'),
+    ('quality_points', '<u8'),
+    ('gpa', '<u2'),
+    ('first_course', '<u4'),
+    ('courses', '<u2'),
+])
+COURSE = np.dtype([
+    ('code', 'S7'),
+    ('credits', '<u2'),  # in tenths
+    ('grade', 'S2'),
+    ('retaken', 'u1'),
+])
+
+
+class SnapshotError(Exception):
+    """A file that is not a snapshot of this version."""
+
+
+class BuildStats(NamedTuple):
+    students: int
+    trimesters: int
+    courses: int
+    size: int  # in bytes
+    elapsed: float  # in seconds
+
+
+def get_setting(name: str) -> Any:
+    return getattr(settings, 'GRADEUTILS_SNAPSHOT',
+                   {}).get(name, DEFAULTS[name])
+
+
+def _hundredths(value: Decimal) -> int:
+    return int(value.scaleb(2))
+
+
+def _offsets(owners: np.ndarray,
+             count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Offset of the first of the rows of each owner, and their number."""
+    counts = np.bincount(owners, minlength=count)
+    return np.cumsum(counts) - counts, counts
+
+
+def build(path: str = None) -> BuildStats:
+    """Write a snapshot of the gradebook, replacing the one at path."""
+    start = time.perf_counter()
+    path = path or get_setting('PATH')
+
+    # A single transaction, for the three reads to agree
+    with transaction.atomic():
+        student_rows = list(
+            models.Student.objects.order_by('slug').values_list(
+                'pk', 'slug', 'nsuid', 'program', 'counted_credits',
+                'quality_points', 'stored_cgpa'))
+        trimester_rows = list(
+            models.Trimester.objects
+            .order_by('student__slug', 'code')
+            .values_list('pk', 'student_id', 'code', 'counted_credits',
+                         'quality_points', 'stored_gpa'))
+        course_rows = list(
+            models.Course.objects
+            .order_by('trimester__student__slug', 'trimester__code', 'code')
+            .values_list('trimester_id', 'code', 'credits', 'grade',
+                         'retaken'))
+
+    slugs = np.array([row[1] for row in student_rows], dtype=SLUG)
+    students = np.zeros(len(student_rows), dtype=STUDENT)
+    for i, (pk, _, nsuid, program, credits, quality_points,
+            cgpa) in enumerate(student_rows):
+        students[i] = (pk, nsuid, program, credits, quality_points,
+                       _hundredths(cgpa), 0, 0)
+    student_index = {row[0]: i for i, row in enumerate(student_rows)}
+    id_index = np.argsort(students['id'], kind='stable').astype(INDEX)
+    ids = students['id'][id_index].astype(ID)
+
+    trimesters = np.zeros(len(trimester_rows), dtype=TRIMESTER)
+    for i, (_, _, code, credits, quality_points, gpa) in enumerate(
+            trimester_rows):
+        trimesters[i] = (code, credits, quality_points, _hundredths(gpa),
+                         0, 0)
+    students['first_trimester'], students['trimesters'] = _offsets(
+        np.array([student_index[row[1]] for row in trimester_rows],
+                 dtype=np.int64),
+        len(students))
+    trimester_index = {row[0]: i for i, row in enumerate(trimester_rows)}
+
+    courses = np.zeros(len(course_rows), dtype=COURSE)
+    for i, (_, code, credits, grade, retaken) in enumerate(course_rows):
+        courses[i] = (code, grading.scale_credits(credits), grade, retaken)
+    trimesters['first_course'], trimesters['courses'] = _offsets(
+        np.array([trimester_index[row[0]] for row in course_rows],
+                 dtype=np.int64),
+        len(trimesters))
+
+    header = np.zeros(1, dtype=HEADER)
+    header[0] = (MAGIC, VERSION, len(students), len(trimesters),
+                 len(courses), time.time())
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Unique to the build, for concurrent builds not to write to the same
+    # file
+    descriptor, temporary = tempfile.mkstemp(
+        prefix=f'{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as stream:
+            # mkstemp makes the file readable by its owner only
+            os.fchmod(stream.fileno(), 0o644)
+            for array in (header, slugs, students, ids, id_index, trimesters,
+                          courses):
+                stream.write(array.tobytes())
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return BuildStats(
+        students=len(students),
+        trimesters=len(trimesters),
+        courses=len(courses),
+        size=os.path.getsize(path),
+        elapsed=time.perf_counter() - start,
+    )
+
+
+class Snapshot:
+    """A snapshot file, mapped into memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as stream:
+            status = os.fstat(stream.fileno())
+            if status.st_size < HEADER.itemsize:
+                raise SnapshotError(f'{path} is not a gradebook snapshot')
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        # Identifies the file, to tell when it is replaced
+        self.key = (status.st_ino, status.st_mtime_ns, status.st_size)
+
+        header = np.frombuffer(self._map, dtype=HEADER, count=1)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise SnapshotError(f'{path} is not a version {VERSION} '
+                                f'gradebook snapshot')
+        self.built = float(header['built'])
+
+        offset = HEADER.itemsize
+        sections = []
+        for dtype, count in ((SLUG, header['students']),
+                             (STUDENT, header['students']),
+                             (ID, header['students']),
+                             (INDEX, header['students']),
+                             (TRIMESTER, header['trimesters']),
+                             (COURSE, header['courses'])):
+            sections.append(np.frombuffer(self._map, dtype=dtype,
+                                          count=int(count), offset=offset))
+            offset += dtype.itemsize * int(count)
+        (self.slugs, self.students, self.ids, self.id_index,
+         self.trimesters, self.courses) = sections
+
+    def __len__(self):
+        return len(self.students)
+
+    def __repr__(self):
+        return f'<Snapshot {self.path}: {len(self)} students>'
+
+    def find(self, slug: str) -> Optional[int]:
+        """Position of the record of the student with the slug, if any."""
+        key = slug.encode()
+        i = int(np.searchsorted(self.slugs, key))
+        if i < len(self.slugs) and self.slugs[i] == key:
+            return i
+        return None
+
+    def find_id(self, student_id: int) -> Optional[int]:
+        """Position of the record of the student with the id, if any."""
+        i = int(np.searchsorted(self.ids, student_id))
+        if i < len(self.ids) and self.ids[i] == student_id:
+            return int(self.id_index[i])
+        return None
+
+    def cgpa(self, slug: str) -> Optional[Decimal]:
+        """CGPA of the student with the slug, or None if there is none."""
+        i = self.find(slug)
+        if i is None:
+            return None
+        return grading.to_decimal(int(self.students[i]['cgpa']))
+
+    def summary(self, slug: str) -> Optional[dict]:
+        """Grade summary of the student with the slug, as given by the JSON
+        API, or None if there is none."""
+        i = self.find(slug)
+        return None if i is None else self._summary(i, slug)
+
+    def transcript(self, slug: str) -> Optional[dict]:
+        """Full transcript of the student with the slug, as given by the
+        JSON API, or None if there is none."""
+        i = self.find(slug)
+        if i is None:
+            return None
+        transcript = self._summary(i, slug)
+        first = int(self.students[i]['first_trimester'])
+        for trimester, summary in zip(
+                self.trimesters[first:first + len(transcript['trimesters'])],
+                transcript['trimesters']):
+            start = int(trimester['first_course'])
+            summary['courses'] = [
+                {
+                    'code': course['code'].decode(),
+                    'credits': grading.to_credits(int(course['credits'])),
+                    'grade': course['grade'].decode(),
+                    'retaken': bool(course['retaken']),
+                }
+                for course in self.courses[start:start
+                                           + int(trimester['courses'])]
+            ]
+        return transcript
+
+    def _summary(self, i: int, slug: str) -> dict:
+        student = self.students[i]
+        first = int(student['first_trimester'])
+        return {
+            'slug': slug,
+            'nsuid': student['nsuid'].decode(),
+            'program': student['program'].decode(),
+            'cgpa': grading.to_decimal(int(student['cgpa'])),
+            'credits': grading.to_credits(int(student['counted_credits'])),
+            'trimesters': [
+                {
+                    'code': int(trimester['code']),
+                    'gpa': grading.to_decimal(int(trimester['gpa'])),
+                    'credits': grading.to_credits(
+                        int(trimester['counted_credits'])),
+                }
+                for trimester in self.trimesters[
+                    first:first + int(student['trimesters'])]
+            ],
+        }
+
+
+_lock = threading.Lock()
+_current: Optional[Snapshot] = None
+_checked = 0.0
+
+
+def current() -> Optional[Snapshot]:
+    """The snapshot at the configured path, or None if there is none.
+
+    The file is checked for a replacement at most every CHECK_INTERVAL
+    seconds, and opened again if it was.
+    """
+    global _current, _checked
+    now = time.monotonic()
+    if _current is not None and now - _checked < get_setting(
+            'CHECK_INTERVAL'):
+        return _current
+    with _lock:
+        _checked = now
+        path = get_setting('PATH')
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            _current = None
+            return None
+        key = (status.st_ino, status.st_mtime_ns, status.st_size)
+        if _current is None or _current.key != key or _current.path != path:
+            # The previous mapping is released once nothing refers to it
+            _current = Snapshot(path)
+        return _current
@@ -0,0 +1,1202 @@
+import builtins
+import datetime as dt
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase)
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gradeutils import grading, planner
+
+from . import (analytics, cache, cohort, forms, jobs, models, queryplans,
+               routers, snapshot, transcripts)
+
+
+class StudentDetailTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = models.Student.objects.create(nsuid='1234567',
+                                                    program='CSE')
+        codes = [151, 152, 153, 161, 162, 163, 171, 172, 173, 181, 182, 183]
+        for i, code in enumerate(codes):
+            trimester = models.Trimester.objects.create(student=cls.student,
+                                                        code=code)
+            # CSE115 and MAT116 are retaken every trimester
+            for course in ('CSE115', 'MAT116', f'ENG{100 + i:03d}'):
+                models.Course.objects.create(
+                    trimester=trimester, code=course,
+                    credits=Decimal('3.0'), grade='B+')
+
+    def setUp(self):
+        caches[cache.get_setting('ALIAS')].clear()
+
+    def test_query_budget(self):
+        # The student, its trimesters and their courses, however many
+        # trimesters there are
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('student-detail', kwargs={'slug': self.student.slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['timeline']), 12)
+
+
+class CachedPageTests(TestCase):
+
+    def setUp(self):
+        caches[cache.get_setting('ALIAS')].clear()
+        models.Student.objects.create(nsuid='1234567', program='CSE')
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def test_messages_not_cached(self):
+        admin = Client()
+        admin.login(username='admin', password='admin')
+        admin.post(reverse('admin:core_student_changelist'), {
+            'action': 'recompute_grade_totals',
+            '_selected_action': models.Student.objects.values_list(
+                'pk', flat=True),
+        })
+        response = admin.get(reverse('student-list'))
+        self.assertContains(response, 'Grade totals recomputed')
+
+        response = self.client.get(reverse('student-list'))
+        self.assertNotContains(response, 'Grade totals recomputed')
+        self.assertEqual(response['X-Cache'], 'miss')
+        response = self.client.get(reverse('student-list'))
+        self.assertEqual(response['X-Cache'], 'hit')
+
+
+class StudentAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = models.Student.objects.create(nsuid='1234567',
+                                                    program='CSE')
+        cls.data = {
+            'nsuid': '1234567',
+            'program': 'CSE',
+            'trimesters-TOTAL_FORMS': 2,
+            'trimesters-INITIAL_FORMS': 2,
+        }
+        courses = {151: ('CSE115', 'MAT116', 'ENG102'),
+                   152: ('CSE115', 'MAT116')}
+        for i, (code, course_codes) in enumerate(courses.items()):
+            trimester = models.Trimester.objects.create(student=cls.student,
+                                                        code=code)
+            prefix = f'trimesters-{i}'
+            cls.data.update({
+                f'{prefix}-id': trimester.pk,
+                f'{prefix}-student': cls.student.pk,
+                f'{prefix}-code': code,
+                f'{prefix}-courses-TOTAL_FORMS': len(course_codes),
+                f'{prefix}-courses-INITIAL_FORMS': len(course_codes),
+            })
+            for j, course_code in enumerate(course_codes):
+                course = models.Course.objects.create(
+                    trimester=trimester, code=course_code,
+                    credits=Decimal('3.0'), grade='D')
+                cls.data.update({
+                    f'{prefix}-courses-{j}-id': course.pk,
+                    f'{prefix}-courses-{j}-trimester': trimester.pk,
+                    f'{prefix}-courses-{j}-code': course_code,
+                    f'{prefix}-courses-{j}-credits': '3.0',
+                    f'{prefix}-courses-{j}-grade': 'A',
+                })
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        caches[cache.get_setting('ALIAS')].clear()
+
+    def test_save_invalidates_once(self):
+        timeline = reverse('student-timeline',
+                           kwargs={'slug': self.student.slug})
+        self.assertEqual(self.client.get(timeline)['X-Cache'], 'miss')
+
+        admin = Client()
+        admin.login(username='admin', password='admin')
+        with CaptureQueriesContext(connection) as queries:
+            response = admin.post(
+                reverse('admin:core_student_change',
+                        args=[self.student.pk]),
+                self.data)
+        self.assertEqual(response.status_code, 302)
+        # Once, when their grade totals are brought up to date, rather than
+        # for every trimester and course
+        self.assertEqual(
+            sum(query['sql'].startswith(
+                'SELECT "core_student"."id", "core_student"."slug" FROM')
+                for query in queries.captured_queries),
+            1)
+
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.stored_cgpa, Decimal('4.00'))
+        self.assertEqual(self.client.get(timeline)['X-Cache'], 'miss')
+
+    def test_save_query_budget(self):
+        admin = Client()
+        admin.login(username='admin', password='admin')
+        url = reverse('admin:core_student_change', args=[self.student.pk])
+        # The trimesters and their courses are read once, not looked up
+        # again for every form validated and saved
+        with CaptureQueriesContext(connection) as queries:
+            response = admin.post(url, self.data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sum(query['sql'].startswith('SELECT "core_course"."id"')
+                for query in queries.captured_queries),
+            1)
+        self.assertLessEqual(len(queries.captured_queries), 45)
+
+
+class TrimesterEntryApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = models.Student.objects.create(nsuid='1234567',
+                                                    program='CSE')
+        models.Trimester.objects.create(student=cls.student, code=181)
+        cls.url = reverse('api-trimester-entry',
+                          kwargs={'slug': cls.student.slug})
+
+    def post(self, client, code):
+        return client.post(self.url, json.dumps({
+            'code': code,
+            'courses': [{'code': 'CSE115', 'credits': '3.0', 'grade': 'A'}],
+        }), content_type='application/json')
+
+    def test_csrf_checked(self):
+        response = self.post(Client(enforce_csrf_checks=True), 182)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.student.trimesters.count(), 1)
+
+    def test_duplicate_code(self):
+        # As if the trimester were entered by another request after the
+        # form checked for it
+        with mock.patch.object(forms.TrimesterEntryForm, 'clean_code',
+                               lambda form: form.cleaned_data['code']):
+            response = self.post(self.client, 181)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['trimester'],
+                         {'code': ['Trimester 181 is already entered']})
+        self.assertEqual(self.student.trimesters.count(), 1)
+        self.assertFalse(models.Course.objects.exists())
+
+
+class PlannerTests(SimpleTestCase):
+
+    def test_what_if(self):
+        plan = planner.plan([], [
+            planner.PlannedCourse('CSE115', 30, 'A'),
+            planner.PlannedCourse('MAT116', 30, 'B'),
+        ], None)
+        self.assertEqual(plan.combinations, [
+            planner.Combination((), Decimal('3.50'), Decimal('3.50'))])
+
+    def test_retake_replaces_earlier_take(self):
+        takes = [grading.Take(171, 'CSE115', 30, 'F'),
+                 grading.Take(171, 'MAT116', 30, 'A')]
+        plan = planner.plan(takes, [planner.PlannedCourse('CSE115', 30, 'A')],
+                            172)
+        self.assertEqual(plan.cgpa, Decimal('2.00'))
+        self.assertEqual(plan.combinations[0].gpa, Decimal('4.00'))
+        self.assertEqual(plan.combinations[0].cgpa, Decimal('4.00'))
+
+    def test_target_reachability(self):
+        takes = [grading.Take(171, 'CSE115', 30, 'F')]
+        courses = [planner.PlannedCourse('MAT116', 30)]
+        plan = planner.plan(takes, courses, 172, target='3.00')
+        self.assertFalse(plan.reachable)
+        self.assertEqual(plan.highest_cgpa, Decimal('2.00'))
+        self.assertEqual(plan.combinations, [])
+
+        plan = planner.plan(takes, courses, 172, target='1.50')
+        self.assertTrue(plan.reachable)
+        self.assertEqual([combination.grades
+                          for combination in plan.combinations], [('B',)])
+
+    def test_combinations_are_minimal(self):
+        takes = [grading.Take(171, 'CSE115', 30, 'C')]
+        courses = [planner.PlannedCourse('MAT116', 30),
+                   planner.PlannedCourse('ENG102', 30),
+                   planner.PlannedCourse('PHY107', 10)]
+        target = Decimal('3.00')
+
+        def cgpa(grades):
+            return planner.plan(takes, [
+                course._replace(grade=grade)
+                for course, grade in zip(courses, grades)
+            ], 172).combinations[0].cgpa
+
+        grades = [grade for grade, _ in planner.SCALE]
+        minimal = set()
+        for combination in itertools.product(grades, repeat=len(courses)):
+            lowered = [
+                combination[:i] + (grades[grades.index(grade) - 1],)
+                + combination[i + 1:]
+                for i, grade in enumerate(combination) if grade != grades[0]
+            ]
+            if cgpa(combination) >= target and all(
+                    cgpa(grades) < target for grades in lowered):
+                minimal.add(combination)
+
+        self.assertTrue(minimal)
+        plan = planner.plan(takes, courses, 172, target, limit=1000)
+        self.assertTrue(plan.complete)
+        self.assertEqual({combination.grades
+                          for combination in plan.combinations}, minimal)
+        for combination in plan.combinations:
+            self.assertEqual(combination.cgpa, cgpa(combination.grades))
+
+    def test_no_credits_to_plan(self):
+        with self.assertRaises(ValueError):
+            planner.plan([], [planner.PlannedCourse('MAT116', 0)], None,
+                         target='3.00')
+        plan = planner.plan([], [planner.PlannedCourse('MAT116', 0, 'A'),
+                                 planner.PlannedCourse('CSE115', 30, 'B')],
+                            None)
+        self.assertEqual(plan.combinations[0].cgpa, Decimal('3.00'))
+
+
+class StudentPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = models.Student.objects.create(nsuid='1234567',
+                                                    program='CSE')
+        trimester = models.Trimester.objects.create(student=cls.student,
+                                                    code=181)
+        models.Course.objects.create(trimester=trimester, code='CSE115',
+                                     credits=Decimal('3.0'), grade='F')
+
+    def post(self, courses, **body):
+        return self.client.post(
+            reverse('api-student-plan', kwargs={'slug': self.student.slug}),
+            json.dumps({'courses': courses, **body}),
+            content_type='application/json')
+
+    def test_plan(self):
+        response = self.post([{'code': 'CSE115', 'credits': 3}],
+                             target=3.5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['trimester'], 182)
+        self.assertEqual(response.json()['combinations'][0]['grades'],
+                         {'CSE115': 'A-'})
+
+    def test_invalid_credits(self):
+        for credits in ('inf', 'Infinity', '-inf', 'nan', 'three', '0.05',
+                        '10'):
+            with self.subTest(credits=credits):
+                response = self.post([{'code': 'MAT116',
+                                       'credits': credits}], target=3)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Invalid credits', response.json()['error'])
+
+    def test_no_credits_to_plan(self):
+        response = self.post([{'code': 'MAT116', 'credits': 0}], target=3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'],
+                         'MAT116 has no credits to plan a grade for')
+
+    def test_invalid_body(self):
+        for body in ('[]', '{"courses": [{"code": "MAT116"}]}',
+                     '{"courses": []}', 'not json'):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    reverse('api-student-plan',
+                            kwargs={'slug': self.student.slug}),
+                    body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_planner_page(self):
+        url = reverse('student-planner', kwargs={'slug': self.student.slug})
+        for courses in ('MAT116 inf', 'MAT116 0'):
+            with self.subTest(courses=courses):
+                response = self.client.get(url, {'courses': courses,
+                                                 'target': '3.5'})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['form'].errors)
+
+
+class ProgramRankTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for nsuid, grade in (('1111111', 'A'), ('2222222', 'B')):
+            student = models.Student.objects.create(nsuid=nsuid,
+                                                    program='CSE')
+            trimester = models.Trimester.objects.create(student=student,
+                                                        code=181)
+            models.Course.objects.create(trimester=trimester, code='CSE115',
+                                         credits=Decimal('3.0'), grade=grade)
+
+    def setUp(self):
+        caches[cache.get_setting('ALIAS')].clear()
+
+    def test_top_clamped(self):
+        for top, expected in (('-5', 1), ('0', 1), ('1', 1), ('1000', 2)):
+            with self.subTest(top=top):
+                response = self.client.get(
+                    reverse('api-program-distribution',
+                            kwargs={'program': 'CSE'}),
+                    {'top': top})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['top']), expected)
+
+                response = self.client.get(
+                    reverse('program-detail', kwargs={'program': 'CSE'}),
+                    {'top': top})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['top']), expected)
+
+
+class RankTests(TransactionTestCase):
+
+    def setUp(self):
+        self.students = {
+            nsuid: self.enter(nsuid, grade)
+            for nsuid, grade in (('1111111', 'A'), ('2222222', 'B'),
+                                 ('3333333', 'B'), ('4444444', 'C'),
+                                 ('5555555', 'F'))
+        }
+        analytics.refresh('CSE')
+        analytics.refresh('EEE')
+
+    @staticmethod
+    def enter(nsuid, grade, program='CSE'):
+        student = models.Student.objects.create(nsuid=nsuid, program=program)
+        trimester = models.Trimester.objects.create(student=student,
+                                                    code=181)
+        models.Course.objects.create(trimester=trimester, code='CSE115',
+                                     credits=Decimal('3.0'), grade=grade)
+        return student
+
+    @staticmethod
+    def ranks(program='CSE'):
+        return {
+            nsuid: (rank, percentile) for nsuid, rank, percentile in
+            models.StudentRank.objects.filter(program=program)
+            .values_list('student__nsuid', 'rank', 'percentile')
+        }
+
+    def assertRefreshed(self):
+        """Assert the ranks are those a refresh of every program gives."""
+        ranks = {program: self.ranks(program)
+                 for program in ('CSE', 'EEE')}
+        summaries = list(models.ProgramSummary.objects.order_by('program')
+                         .values_list('program', 'students', 'mean_cgpa',
+                                      'cgpa_total', 'stale'))
+        for program in ('CSE', 'EEE'):
+            analytics.refresh(program)
+        self.assertEqual(ranks, {program: self.ranks(program)
+                                 for program in ('CSE', 'EEE')})
+        self.assertEqual(summaries, list(
+            models.ProgramSummary.objects.order_by('program')
+            .values_list('program', 'students', 'mean_cgpa', 'cgpa_total',
+                         'stale')))
+
+    def test_ranks(self):
+        self.assertEqual(self.ranks(), {
+            '1111111': (1, Decimal('100.00')),
+            '2222222': (2, Decimal('50.00')),
+            '3333333': (2, Decimal('50.00')),
+            '4444444': (4, Decimal('25.00')),
+            '5555555': (5, Decimal('0.00')),
+        })
+        summary = analytics.summary('CSE')
+        self.assertEqual(summary.students, 5)
+        self.assertEqual(summary.mean_cgpa, Decimal('2.40'))
+
+    def test_grade_change(self):
+        course = models.Course.objects.get(
+            trimester__student=self.students['4444444'])
+        course.grade = 'A'
+        with CaptureQueriesContext(connection) as queries:
+            course.save()
+        # Moved among the others, rather than the program recomputed
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('DELETE')])
+        self.assertEqual(self.ranks(), {
+            '1111111': (1, Decimal('75.00')),
+            '2222222': (3, Decimal('25.00')),
+            '3333333': (3, Decimal('25.00')),
+            '4444444': (1, Decimal('75.00')),
+            '5555555': (5, Decimal('0.00')),
+        })
+        self.assertEqual(analytics.summary('CSE').mean_cgpa,
+                         Decimal('2.80'))
+        self.assertRefreshed()
+
+    def test_course_deleted(self):
+        models.Course.objects.get(
+            trimester__student=self.students['1111111']).delete()
+        self.assertNotIn('1111111', self.ranks())
+        self.assertFalse(analytics.summary('CSE').stale)
+        self.assertRefreshed()
+
+    def test_first_graded_course(self):
+        self.enter('6666666', 'B+')
+        self.assertEqual(self.ranks()['6666666'], (2, Decimal('80.00')))
+        self.assertRefreshed()
+
+    def test_program_change(self):
+        student = models.Student.objects.get(nsuid='2222222')
+        student.program = 'EEE'
+        student.save()
+        self.assertNotIn('2222222', self.ranks())
+        self.assertEqual(self.ranks('EEE'), {'2222222': (1, Decimal('0'))})
+        self.assertRefreshed()
+
+    def test_student_deleted(self):
+        self.students['1111111'].delete()
+        self.assertEqual(self.ranks()['2222222'], (1, Decimal('66.67')))
+        self.assertRefreshed()
+
+
+@override_settings(GRADEUTILS_INSTRUMENTATION={'SLOW_REQUEST_MS': 0})
+class InstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        student = models.Student.objects.create(nsuid='1234567',
+                                                program='CSE')
+        trimester = models.Trimester.objects.create(student=student,
+                                                    code=181)
+        models.Course.objects.create(trimester=trimester, code='CSE115',
+                                     credits=Decimal('3.0'), grade='A')
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def test_streaming_queries_recorded(self):
+        self.client.login(username='admin', password='admin')
+        with self.assertLogs('core.requests') as logs:
+            response = self.client.get(reverse('transcript-export'))
+            self.assertIn('queries before streaming',
+                          response['Server-Timing'])
+            # Logged once the stream is closed
+            self.assertFalse(logs.records)
+            with CaptureQueriesContext(connection) as queries:
+                content = b''.join(response.streaming_content)
+        self.assertIn(b'CSE115', content)
+        record = logs.records[-1].request_stats
+        self.assertTrue(record['streaming'])
+        self.assertGreaterEqual(record['queries'],
+                                len(queries.captured_queries))
+        self.assertTrue(queries.captured_queries)
+
+
+@override_settings(GRADEUTILS_REPLICATION={'REPLICAS': ['replica']})
+class ReplicaReadTests(TransactionTestCase):
+
+    def setUp(self):
+        caches[cache.get_setting('ALIAS')].clear()
+        self.student = models.Student.objects.create(nsuid='1234567',
+                                                     program='CSE')
+
+    def test_cache_filled_from_primary(self):
+        # No replica is available, so reads still work when routed to one
+        with mock.patch.object(routers, 'choose_replica',
+                               return_value=None) as choose_replica:
+            response = self.client.get(reverse('student-list'))
+            self.assertEqual(response['X-Cache'], 'miss')
+            choose_replica.assert_not_called()
+
+            # Not cached
+            self.client.get(reverse('student-planner',
+                                    kwargs={'slug': self.student.slug}))
+            choose_replica.assert_called()
+
+
+class QueryPlanTests(TestCase):
+
+    def test_no_full_scans(self):
+        versions = (cache.GLOBAL, cache.STUDENT_LIST,
+                    cache.student_version('0000000-cse'))
+        before = [cache.version(name) for name in versions]
+        plans = queryplans.hot_query_plans()
+        self.assertTrue(plans)
+        self.assertEqual([(plan.scenario, plan.sql, plan.full_scans)
+                          for plan in plans if plan.full_scans], [])
+        # The live cache is left alone
+        self.assertEqual([cache.version(name) for name in versions], before)
+
+
+class StudentApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.students = []
+        for nsuid in ('1111111', '2222222', '3333333'):
+            student = models.Student.objects.create(nsuid=nsuid,
+                                                    program='CSE')
+            for code, grade in ((181, 'B'), (182, 'A')):
+                trimester = models.Trimester.objects.create(student=student,
+                                                            code=code)
+                models.Course.objects.create(
+                    trimester=trimester, code='CSE115',
+                    credits=Decimal('3.0'), grade=grade)
+            cls.students.append(student)
+
+    def setUp(self):
+        caches[cache.get_setting('ALIAS')].clear()
+
+    def get_summaries(self, ids, **headers):
+        return self.client.get(reverse('api-student-summaries'),
+                               {'ids': ids}, **headers)
+
+    def post_summaries(self, body):
+        return self.client.post(reverse('api-student-summaries'), body,
+                                content_type='application/json')
+
+    def test_get(self):
+        first, second, _ = self.students
+        # The students and their trimesters
+        with self.assertNumQueries(2):
+            response = self.get_summaries(
+                f'{first.slug},{second.nsuid},{first.nsuid},9999999')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(sorted(summary['nsuid']
+                                for summary in body['students']),
+                         ['1111111', '2222222'])
+        self.assertEqual(body['missing'], ['9999999'])
+        summary = body['students'][0]
+        self.assertEqual(summary['cgpa'], '4.00')
+        self.assertEqual([trimester['code']
+                          for trimester in summary['trimesters']],
+                         [181, 182])
+
+    def test_post(self):
+        response = self.post_summaries(json.dumps(
+            {'students': [student.slug for student in self.students]}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['students']), 3)
+        self.assertEqual(response.json()['missing'], [])
+
+    @override_settings(GRADEUTILS_API_MAX_BATCH=2)
+    def test_batch_limit(self):
+        slugs = [student.slug for student in self.students]
+        self.assertEqual(self.get_summaries(','.join(slugs)).status_code,
+                         400)
+        self.assertEqual(self.post_summaries(json.dumps(
+            {'students': slugs})).status_code, 400)
+        # Repeats are only counted once
+        self.assertEqual(self.get_summaries(
+            ','.join(slugs[:2] + slugs[:2])).status_code, 200)
+        self.assertEqual(self.post_summaries(json.dumps(
+            {'students': slugs[:2]})).status_code, 200)
+
+    def test_invalid(self):
+        self.assertEqual(self.get_summaries('').status_code, 400)
+        self.assertEqual(self.get_summaries(' , ').status_code, 400)
+        for body in ('not json', '[]', '{}', '{"students": "1111111"}',
+                     '{"students": [1111111]}', '{"students": []}'):
+            with self.subTest(body=body):
+                response = self.post_summaries(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_etag(self):
+        response = self.get_summaries(self.students[0].slug)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.get_summaries(self.students[0].slug,
+                                          HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        course = models.Course.objects.filter(
+            trimester__student=self.students[0]).first()
+        course.grade = 'C'
+        course.save()
+        response = self.get_summaries(self.students[0].slug,
+                                      HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_transcript(self):
+        student = self.students[0]
+        url = reverse('api-student-transcript', kwargs={'slug': student.slug})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [[(course['code'], course['grade'], course['retaken'])
+              for course in trimester['courses']]
+             for trimester in response.json()['trimesters']],
+            [[('CSE115', 'B', True)], [('CSE115', 'A', False)]])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('api-student-transcript',
+                                           kwargs={'slug': '9999999-cse'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class TranscriptRoundTripTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        takes = {
+            ('1111111', 'CSE'): [
+                (181, 'CSE115', '3.0', 'F'),
+                (181, 'MAT116', '0.0', 'A'),
+                (182, 'CSE115', '3.0', 'B+'),
+                (182, 'ENG102', '3.0', 'W'),
+                (183, 'ENG102', '3.0', 'A-'),
+            ],
+            ('2222222', 'EEE'): [
+                (191, 'EEE141', '1.5', 'I'),
+                (191, 'PHY107', '4.0', 'C'),
+            ],
+        }
+        for (nsuid, program), courses in takes.items():
+            student = models.Student.objects.create(nsuid=nsuid,
+                                                    program=program)
+            for code, course, credits, grade in courses:
+                trimester, _ = models.Trimester.objects.get_or_create(
+                    student=student, code=code)
+                models.Course.objects.create(
+                    trimester=trimester, code=course,
+                    credits=Decimal(credits), grade=grade)
+
+    @staticmethod
+    def gradebook():
+        students = models.Student.objects.order_by('slug').values_list(
+            'slug', 'counted_credits', 'quality_points', 'stored_cgpa')
+        trimesters = models.Trimester.objects.order_by(
+            'student__slug', 'code').values_list(
+            'student__slug', 'code', 'counted_credits', 'stored_gpa')
+        courses = models.Course.objects.order_by(
+            'trimester__student__slug', 'trimester__code', 'code').values_list(
+            'trimester__student__slug', 'trimester__code', 'code', 'credits',
+            'grade', 'retaken')
+        return list(students), list(trimesters), list(courses)
+
+    def test_round_trip(self):
+        gradebook = self.gradebook()
+        for fmt in ('csv', 'json'):
+            for averages in ([], ['--averages']):
+                with self.subTest(fmt=fmt, averages=averages), \
+                        tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, f'transcripts.{fmt}')
+                    call_command('export_transcripts', '--format', fmt,
+                                 '--output', path, *averages)
+                    models.Student.objects.all().delete()
+                    call_command('import_transcripts', path,
+                                 stdout=io.StringIO())
+                    self.assertEqual(self.gradebook(), gradebook)
+
+                    # Importing it again changes nothing
+                    call_command('import_transcripts', path,
+                                 stdout=io.StringIO())
+                    self.assertEqual(self.gradebook(), gradebook)
+
+    def test_invalid_rows(self):
+        lines = [
+            '{"nsuid": "1111111", "program": "CSE", "trimester": 181, '
+            '"course": "CSE115", "credits": 3, "grade": "A"}',
+            '',
+            '{"nsuid": "1111111", "program"',
+            '["1111111", "CSE"]',
+            '{"nsuid": "1111111", "program": "CSE", "trimester": 181, '
+            '"course": "CSE115", "credits": 3, "grade": "E"}',
+        ]
+        parsed = list(transcripts.parse_rows(io.StringIO('\n'.join(lines)),
+                                             'json'))
+        self.assertEqual([number for number, _, _ in parsed], [1, 3, 4, 5])
+        (_, row, error), *invalid = parsed
+        self.assertIsNone(error)
+        self.assertEqual(row.grade, 'A')
+        self.assertEqual(
+            [(row, list(error.message_dict)) for _, row, error in invalid],
+            [(None, ['row']), (None, ['row']), (None, ['grade'])])
+
+
+@override_settings(GRADEUTILS_RECOMPUTE={'ASYNC': True, 'MAX_ATTEMPTS': 3,
+                                         'RETRY_DELAY': 10,
+                                         'LEASE_SECONDS': 300})
+class RecomputeJobTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.students = [
+            models.Student.objects.create(nsuid=nsuid, program='CSE')
+            for nsuid in ('1111111', '2222222')
+        ]
+        self.trimesters = [
+            models.Trimester.objects.create(student=student, code=181)
+            for student in self.students
+        ]
+
+    def at(self, seconds: int = 0):
+        """Run the block as if it were so many seconds from now."""
+        return mock.patch('django.utils.timezone.now', return_value=(
+            self.now + dt.timedelta(seconds=seconds)))
+
+    def job(self, student) -> models.RecomputeJob:
+        return models.RecomputeJob.objects.get(student=student)
+
+    def test_requests_coalesced(self):
+        student = self.students[0]
+        with self.at(0):
+            course = models.Course.objects.create(
+                trimester=self.trimesters[0], code='CSE115',
+                credits=Decimal('3.0'), grade='B')
+        with self.at(5):
+            for grade in ('A', 'F'):
+                course.grade = grade
+                course.save()
+        job = self.job(student)
+        self.assertEqual(job.requests, 3)
+        self.assertEqual(job.requested, self.now)
+        student.refresh_from_db()
+        self.assertEqual(student.counted_credits, 0)
+
+        with self.at(10):
+            self.assertEqual(jobs.metrics()['coalesced'], 2)
+            self.assertEqual(jobs.run_batch(), 1)
+        self.assertFalse(models.RecomputeJob.objects.exists())
+        student.refresh_from_db()
+        self.assertEqual(student.counted_credits, 30)
+        self.assertEqual(student.stored_cgpa, Decimal('0.00'))
+
+    def test_claim_leases(self):
+        first, second = self.students
+        with self.at(0):
+            models.RecomputeJob.objects.enqueue([first.pk])
+        with self.at(1):
+            models.RecomputeJob.objects.enqueue([second.pk])
+        with self.at(2):
+            self.assertEqual([job.pk for job in jobs.claim(1)], [first.pk])
+            self.assertEqual([job.pk for job in jobs.claim()], [second.pk])
+            self.assertEqual(jobs.claim(), [])
+        # The jobs of a worker that died are claimed again
+        with self.at(302):
+            self.assertEqual(len(jobs.claim()), 2)
+
+    def test_claim_race(self):
+        with self.at(0):
+            models.RecomputeJob.objects.enqueue(
+                student.pk for student in self.students)
+        leases = []
+
+        def read_then_leased_elsewhere(items):
+            # Another worker leases a job between the read of the due jobs
+            # and their lease
+            items = builtins.list(items)
+            if not leases:
+                leases.append(models.RecomputeJob.objects.filter(
+                    student=self.students[0]).update(
+                    available=self.now + dt.timedelta(seconds=1)))
+            return items
+
+        with self.at(0), mock.patch.object(
+                jobs, 'list', side_effect=read_then_leased_elsewhere,
+                create=True):
+            claimed = jobs.claim()
+        self.assertEqual([job.pk for job in claimed], [self.students[1].pk])
+
+    def test_requested_while_running(self):
+        student = self.students[0]
+        with self.at(0):
+            models.RecomputeJob.objects.enqueue([student.pk])
+            job, = jobs.claim()
+            models.RecomputeJob.objects.enqueue([student.pk])
+            jobs.recompute([job.pk])
+            jobs._complete(job)
+        # Run again for the request made in the meantime
+        self.assertEqual(self.job(student).requests, 2)
+        with self.at(1):
+            self.assertEqual(jobs.run_batch(), 1)
+        self.assertFalse(models.RecomputeJob.objects.exists())
+
+    def test_retry_backoff(self):
+        student = self.students[0]
+        with self.at(0):
+            models.RecomputeJob.objects.enqueue([student.pk])
+        elapsed = 0
+        with mock.patch.object(jobs, 'recompute',
+                               side_effect=RuntimeError('Lost')), \
+                self.assertLogs('core.jobs', 'WARNING') as logs:
+            for attempt, delay in enumerate((10, 20, 40), start=1):
+                with self.at(elapsed):
+                    self.assertEqual(jobs.run_batch(), 1)
+                    job = self.job(student)
+                    self.assertEqual(job.attempts, attempt)
+                    self.assertEqual(job.available, timezone.now()
+                                     + dt.timedelta(seconds=delay))
+                    self.assertIn('RuntimeError: Lost', job.last_error)
+                # Not due before the delay is over
+                with self.at(elapsed + delay - 1):
+                    self.assertEqual(jobs.claim(), [])
+                elapsed += delay
+        self.assertEqual(len(logs.output), 3)
+
+        # Out of attempts
+        with self.at(elapsed):
+            self.assertEqual(jobs.run_batch(), 0)
+            self.assertEqual(jobs.metrics()['failed'], 1)
+            self.assertEqual(jobs.retry_failed(), 1)
+            self.assertEqual(jobs.run_batch(), 1)
+        self.assertFalse(models.RecomputeJob.objects.exists())
+
+    def test_failure_isolated(self):
+        failing, passing = self.students
+        recompute = jobs.recompute
+
+        def fail_first(students):
+            students = list(students)
+            if failing.pk in students:
+                raise RuntimeError('Lost')
+            recompute(students)
+
+        with self.at(0):
+            models.RecomputeJob.objects.enqueue(
+                student.pk for student in self.students)
+        with self.at(1), self.assertLogs('core.jobs', 'WARNING'), \
+                mock.patch.object(jobs, 'recompute', side_effect=fail_first):
+            self.assertEqual(jobs.run_batch(), 2)
+        self.assertEqual(self.job(failing).attempts, 1)
+        self.assertFalse(models.RecomputeJob.objects.filter(
+            student=passing).exists())
+
+
+class SnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        takes = {
+            '1111111': [
+                (181, 'CSE115', '3.0', 'F'),
+                (181, 'MAT116', '0.0', 'A'),
+                (182, 'CSE115', '3.0', 'B+'),
+                (182, 'ENG102', '3.0', 'W'),
+                (183, 'ENG102', '3.0', 'A-'),
+            ],
+            '2222222': [
+                (191, 'EEE141', '1.5', 'I'),
+                (191, 'PHY107', '4.0', 'C'),
+            ],
+            '3333333': [],
+        }
+        for nsuid, courses in takes.items():
+            student = models.Student.objects.create(nsuid=nsuid,
+                                                    program='CSE')
+            for code, course, credits, grade in courses:
+                trimester, _ = models.Trimester.objects.get_or_create(
+                    student=student, code=code)
+                models.Course.objects.create(
+                    trimester=trimester, code=course,
+                    credits=Decimal(credits), grade=grade)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'gradebook.snapshot')
+        settings = override_settings(GRADEUTILS_SNAPSHOT={
+            'PATH': self.path, 'CHECK_INTERVAL': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        current = mock.patch.object(snapshot, '_current', None)
+        current.start()
+        self.addCleanup(current.stop)
+
+    def test_cgpa(self):
+        snapshot.build()
+        gradebook = snapshot.current()
+        for student in models.Student.objects.with_cgpa():
+            with self.subTest(student=student.slug):
+                self.assertEqual(gradebook.cgpa(student.slug), student.cgpa)
+                self.assertEqual(gradebook.find_id(student.pk),
+                                 gradebook.find(student.slug))
+        self.assertIsNone(gradebook.cgpa('9999999-cse'))
+
+    def test_transcript(self):
+        snapshot.build()
+        gradebook = snapshot.current()
+        for student in models.Student.objects.all():
+            with self.subTest(student=student.slug):
+                response = self.client.get(reverse(
+                    'api-student-transcript', kwargs={'slug': student.slug}))
+                self.assertEqual(
+                    json.loads(json.dumps(gradebook.transcript(student.slug),
+                                          cls=DjangoJSONEncoder)),
+                    response.json())
+
+    def test_replaced(self):
+        self.assertIsNone(snapshot.current())
+        snapshot.build()
+        old = snapshot.current()
+        self.assertIs(snapshot.current(), old)
+
+        course = models.Course.objects.get(code='PHY107')
+        course.grade = 'A'
+        course.save()
+        snapshot.build()
+        new = snapshot.current()
+        self.assertIsNot(new, old)
+        self.assertEqual(new.cgpa('2222222-cse'), Decimal('4.00'))
+        # Readers of the old snapshot keep reading it
+        self.assertEqual(old.cgpa('2222222-cse'), Decimal('2.00'))
+        # No temporary file is left behind
+        self.assertEqual(os.listdir(os.path.dirname(self.path)),
+                         ['gradebook.snapshot'])
+
+
+class CohortTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        takes = {
+            # Retaken twice, the last time after a W
+            '1111111': [
+                (181, 'CSE115', '3.0', 'F'),
+                (181, 'MAT116', '0.0', 'A'),
+                (182, 'CSE115', '3.0', 'W'),
+                (182, 'ENG102', '3.0', 'B+'),
+                (183, 'CSE115', '3.0', 'A-'),
+                (183, 'ENG102', '3.0', 'C'),
+            ],
+            # Nothing graded
+            '2222222': [
+                (191, 'EEE141', '1.5', 'I'),
+                (191, 'PHY107', '0.0', 'W'),
+            ],
+        }
+        # And some at random
+        rng = random.Random(7)
+        grades = list(grading.GRADE_POINTS)
+        for i in range(20):
+            codes = [171 + 10 * (t // 3) + t % 3
+                     for t in range(rng.randint(1, 6))]
+            takes[f'{3000000 + i}'] = [
+                (code, rng.choice(['CSE115', 'CSE173', 'MAT116', 'ENG102']),
+                 rng.choice(['0.0', '1.0', '1.5', '3.0', '4.0']),
+                 rng.choice(grades))
+                for code in codes for _ in range(rng.randint(1, 3))
+            ]
+        for nsuid, courses in takes.items():
+            student = models.Student.objects.create(nsuid=nsuid,
+                                                    program='CSE')
+            for code, course, credits, grade in courses:
+                trimester, _ = models.Trimester.objects.get_or_create(
+                    student=student, code=code)
+                models.Course.objects.update_or_create(
+                    trimester=trimester, code=course,
+                    defaults={'credits': Decimal(credits), 'grade': grade})
+
+    def test_parity(self):
+        result = cohort.compute(cohort.cohort_courses('CSE'))
+        students = models.Student.objects.with_cgpa()
+        self.assertEqual(len(result), len(students))
+        for student in students:
+            with self.subTest(student=student.nsuid):
+                self.assertEqual(result.student_cgpa(student.pk),
+                                 student.cgpa)
+                i = int(np.searchsorted(result.student_ids, student.pk))
+                self.assertEqual(int(result.counted_credits[i]),
+                                 student.counted_credits)
+
+        gpas = {
+            (trimester.student_id, trimester.code): trimester.gpa
+            for trimester in models.Trimester.objects.with_gpa()
+        }
+        cgpas = {
+            (student.pk, entry.trimester): entry.cgpa
+            for student in models.Student.objects.all()
+            for entry in student.timeline()
+        }
+        trimesters = zip(result.trimester_student_ids,
+                         result.trimester_codes, result.gpa,
+                         result.running_cgpa)
+        self.assertEqual(
+            {(int(student), int(code)): (grading.to_decimal(int(gpa)),
+                                         grading.to_decimal(int(cgpa)))
+             for student, code, gpa, cgpa in trimesters},
+            {key: (gpa, cgpas[key]) for key, gpa in gpas.items()})
+
+
+class GradeTotalsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = models.Student.objects.create(nsuid='1111111',
+                                                    program='CSE')
+        cls.other = models.Student.objects.create(nsuid='2222222',
+                                                  program='CSE')
+        cls.trimesters = {
+            code: models.Trimester.objects.create(student=cls.student,
+                                                  code=code)
+            for code in (181, 182, 183)
+        }
+        cls.other_trimester = models.Trimester.objects.create(
+            student=cls.other, code=181)
+        for code, course, credits, grade in (
+                (181, 'CSE115', '3.0', 'C'),
+                (181, 'MAT116', '3.0', 'B+'),
+                (181, 'ENG102', '0.0', 'A'),
+                (182, 'CSE173', '3.0', 'W'),
+                (182, 'PHY107', '4.0', 'A-'),
+                (183, 'CSE115', '3.0', 'A')):
+            models.Course.objects.create(
+                trimester=cls.trimesters[code], code=course,
+                credits=Decimal(credits), grade=grade)
+        models.Course.objects.create(
+            trimester=cls.other_trimester, code='EEE141',
+            credits=Decimal('3.0'), grade='B')
+
+    def course(self, trimester: int, code: str) -> models.Course:
+        return models.Course.objects.get(trimester=self.trimesters[trimester],
+                                         code=code)
+
+    def assertTotalsUpToDate(self):
+        # Nothing to rebuild, and the stored averages are those the ORM
+        # computes from the courses
+        self.assertEqual(models.rebuild_grade_totals(commit=False), [])
+        for student in models.Student.objects.with_cgpa():
+            self.assertEqual(student.stored_cgpa, student.cgpa)
+        for trimester in models.Trimester.objects.with_gpa():
+            self.assertEqual(trimester.stored_gpa, trimester.gpa)
+
+    def assertCGPA(self, student, cgpa: str):
+        student.refresh_from_db()
+        self.assertEqual(student.stored_cgpa, Decimal(cgpa))
+
+    def test_initial(self):
+        self.assertTotalsUpToDate()
+        # (3 * 3.3 + 4 * 3.7 + 3 * 4) / 10, the C retaken
+        self.assertCGPA(self.student, '3.67')
+
+    def test_grade_changed(self):
+        course = self.course(182, 'PHY107')
+        course.grade = 'F'
+        course.save()
+        self.assertTotalsUpToDate()
+        self.assertCGPA(self.student, '2.19')
+
+        # To and from an ungraded grade
+        course.grade = 'W'
+        course.save()
+        self.assertTotalsUpToDate()
+        self.assertCGPA(self.student, '3.65')
+        course.grade = 'A'
+        course.save()
+        self.assertTotalsUpToDate()
+
+    def test_credits_changed(self):
+        course = self.course(181, 'ENG102')
+        course.credits = Decimal('1.5')
+        course.save()
+        self.assertTotalsUpToDate()
+        self.assertCGPA(self.student, '3.71')
+
+    def test_trimester_changed(self):
+        course = self.course(181, 'MAT116')
+        course.trimester = self.trimesters[182]
+        course.save()
+        self.assertTotalsUpToDate()
+
+        # To another student's trimester
+        course.trimester = self.other_trimester
+        course.save()
+        self.assertTotalsUpToDate()
+        self.assertCGPA(self.student, '3.83')
+        self.assertCGPA(self.other, '3.15')
+
+    def test_deleted(self):
+        self.course(182, 'PHY107').delete()
+        self.assertTotalsUpToDate()
+        self.assertCGPA(self.student, '3.65')
+
+        models.Trimester.objects.get(pk=self.trimesters[181].pk).delete()
+        self.assertTotalsUpToDate()
+        self.assertCGPA(self.student, '4.00')
+
+    def test_stale_instance_saved(self):
+        # Saved from an instance loaded before another write to the course
+        stale = self.course(181, 'MAT116')
+        course = self.course(181, 'MAT116')
+        course.grade = 'D'
+        course.save()
+        stale.credits = Decimal('4.0')
+        stale.save()
+        self.assertTotalsUpToDate()
+
+    def assertRetaken(self, *courses):
+        """Only the given courses (trimester, code) are retaken, and none of
+        the retaken flags is out of date."""
+        self.assertEqual(models.resolve_retakes(adjust_totals=False), 0)
+        self.assertEqual(
+            set(models.Course.objects.filter(
+                trimester__student=self.student, retaken=True)
+                .values_list('trimester__code', 'code')),
+            set(courses))
+
+    def test_retake_added(self):
+        with CaptureQueriesContext(connection) as queries:
+            models.Course.objects.create(
+                trimester=self.trimesters[182], code='CSE115',
+                credits=Decimal('3.0'), grade='B')
+        # A single UPDATE of the flags, whatever the number of takes
+        self.assertEqual(
+            sum(query['sql'].startswith('UPDATE "core_course" SET "retaken"')
+                for query in queries.captured_queries),
+            1)
+        self.assertRetaken((181, 'CSE115'), (182, 'CSE115'))
+        self.assertTotalsUpToDate()
+
+    def test_later_take_deleted(self):
+        self.course(183, 'CSE115').delete()
+        self.assertRetaken()
+        self.assertTotalsUpToDate()
+        # The C counts again
+        self.assertCGPA(self.student, '3.07')
+
+    def test_course_code_changed(self):
+        course = self.course(183, 'CSE115')
+        course.code = 'CSE173'
+        course.save()
+        self.assertRetaken((182, 'CSE173'))
+        self.assertTotalsUpToDate()
+
+    def test_take_moved_earlier(self):
+        course = self.course(183, 'CSE115')
+        course.trimester = models.Trimester.objects.create(
+            student=self.student, code=173)
+        course.save()
+        self.assertRetaken((173, 'CSE115'))
+        self.assertTotalsUpToDate()
+
+    def test_retaken_by_another_student(self):
+        models.Course.objects.create(
+            trimester=self.other_trimester, code='MAT116',
+            credits=Decimal('3.0'), grade='A')
+        models.Course.objects.create(
+            trimester=models.Trimester.objects.create(student=self.other,
+                                                      code=191),
+            code='CSE115', credits=Decimal('3.0'), grade='A')
+        self.assertRetaken((181, 'CSE115'))
+        self.assertTotalsUpToDate()
+
+    def test_trimester_code_changed(self):
+        trimester = models.Trimester.objects.get(pk=self.trimesters[183].pk)
+        trimester.code = 173
+        trimester.save()
+        self.assertRetaken((173, 'CSE115'))
+        self.assertTotalsUpToDate()
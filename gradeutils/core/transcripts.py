@@ -0,0 +1,330 @@
+"""Reading, validating and bulk-writing transcript rows.
+
+A transcript row holds one course taken by a student, with the columns
+listed in FIELDS. Rows are read from CSV files with a header, or from JSON
+files holding either an array of objects or one object per line.
+
+Transcripts are exported in the same formats (JSON as one object per line),
+so an export can be imported back as it is.
+"""
+import csv
+import itertools
+import json
+from collections import defaultdict
+from decimal import Decimal
+from typing import (IO, Any, Dict, Iterator, List, NamedTuple, Optional,
+                    Tuple)
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import QuerySet
+
+from gradeutils import grading
+
+from . import analytics, cache, models
+
+FIELDS = ('nsuid', 'program', 'trimester', 'course', 'credits', 'grade')
+
+# Extra columns of exports with averages
+AVERAGE_FIELDS = ('gpa', 'cgpa')
+
+FORMATS = ('csv', 'json')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/x-ndjson',
+}
+
+
+class TranscriptRow(NamedTuple):
+    """A validated transcript row."""
+
+    nsuid: str
+    program: str
+    trimester: int
+    course: str
+    credits: Decimal
+    grade: str
+
+    @property
+    def student_key(self) -> Tuple[str, str]:
+        return self.nsuid, self.program
+
+
+def read_rows(stream: IO[str], fmt: str) -> Iterator[
+        Tuple[int, Any, Optional[ValidationError]]]:
+    """Yield (line or item number, raw row, error) triples from a transcript
+    file.
+
+    The error is None, unless the row could not be read at all, as with a
+    line of one-object-per-line JSON that is not valid JSON. The raw row is
+    then None, and the error reports it like any other invalid row.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'json':
+        skipped, head = 0, stream.readline()
+        while head and not head.strip():
+            skipped, head = skipped + 1, stream.readline()
+        if head.lstrip().startswith('['):
+            # A JSON array has to be loaded as a whole
+            items = json.loads(head + stream.read())
+            for number, item in enumerate(items, start=1):
+                yield number, item, None
+        else:
+            lines = itertools.chain([head], stream)
+            for number, line in enumerate(lines, start=skipped + 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, json.loads(line), None
+                except ValueError as error:
+                    yield number, None, ValidationError(
+                        {'row': [f'Invalid JSON: {error}']})
+    else:
+        raise ValueError(f'Unknown transcript format: {fmt}')
+
+
+def parse_row(raw: dict) -> TranscriptRow:
+    """Validate a raw row with the model field validators.
+
+    Raises ValidationError, with messages keyed by column, if the row is
+    invalid.
+    """
+    if not isinstance(raw, dict):
+        raise ValidationError(
+            {'row': [f'Expected an object, not {type(raw).__name__}']})
+    fields = {
+        'nsuid': models.Student._meta.get_field('nsuid'),
+        'program': models.Student._meta.get_field('program'),
+        'trimester': models.Trimester._meta.get_field('code'),
+        'course': models.Course._meta.get_field('code'),
+        'credits': models.Course._meta.get_field('credits'),
+        'grade': models.Course._meta.get_field('grade'),
+    }
+    values, errors = {}, {}
+    for column, field in fields.items():
+        value = raw.get(column)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            errors[column] = ['This field is required.']
+            continue
+        try:
+            values[column] = field.clean(
+                value if column != 'credits' else str(value), None)
+        except ValidationError as error:
+            errors[column] = error.messages
+    if errors:
+        raise ValidationError(errors)
+    return TranscriptRow(**values)
+
+
+def parse_rows(stream: IO[str], fmt: str) -> Iterator[
+        Tuple[int, Optional[TranscriptRow], Optional[ValidationError]]]:
+    """Yield (line or item number, row, error) triples from a transcript
+    file: either the validated row, or the error making it invalid."""
+    for number, raw, error in read_rows(stream, fmt):
+        if error is None:
+            try:
+                row = parse_row(raw)
+            except ValidationError as invalid:
+                error = invalid
+            else:
+                yield number, row, None
+                continue
+        yield number, None, error
+
+
+def format_error(error: ValidationError) -> str:
+    """One-line description of a row's validation errors."""
+    return '; '.join(
+        f'{column}: {" ".join(messages)}'
+        for column, messages in error.message_dict.items()
+    )
+
+
+class TranscriptImporter:
+    """Write validated rows to the database in batches.
+
+    Rows are buffered per student and written when the buffer holds
+    batch_size rows, in one transaction per student. Re-importing a row
+    updates the credits and grade of the existing course. The programs of
+    the students written are marked stale but not refreshed, which is left
+    to the end of the import (see analytics.refresh_stale).
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self.pending: Dict[Tuple[str, str], Dict[Tuple[int, str],
+                                                 TranscriptRow]] = {}
+        self.pending_count = 0
+        self.stats = defaultdict(int)
+
+    def add(self, row: TranscriptRow):
+        courses = self.pending.setdefault(row.student_key, {})
+        if (row.trimester, row.course) not in courses:
+            self.pending_count += 1
+        courses[row.trimester, row.course] = row
+        self.stats['rows'] += 1
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows."""
+        if not self.pending:
+            return
+        students = [
+            models.Student(
+                nsuid=nsuid,
+                program=program,
+                slug=models.Student.make_slug(nsuid, program),
+            )
+            for nsuid, program in self.pending
+        ]
+        models.Student.objects.bulk_create(students, ignore_conflicts=True)
+        student_ids = dict(
+            models.Student.objects
+            .filter(slug__in=[student.slug for student in students])
+            .values_list('slug', 'pk')
+        )
+        for student in students:
+            self.write_student(
+                student_ids[student.slug],
+                list(self.pending[student.nsuid, student.program].values()),
+            )
+        cache.bump_students(*student_ids)
+        analytics.mark_stale({student.program for student in students},
+                             refresh=False)
+        self.pending = {}
+        self.pending_count = 0
+
+    @transaction.atomic
+    def write_student(self, student_id: int, rows: List[TranscriptRow]):
+        """Write the rows of a single student and resolve their retakes."""
+        # The order is set below, but must not be null for the insert not to
+        # be ignored
+        models.Trimester.objects.bulk_create(
+            [models.Trimester(student_id=student_id, code=code, _order=0)
+             for code in {row.trimester for row in rows}],
+            ignore_conflicts=True,
+        )
+        trimesters = models.reorder_trimesters(student_id)
+        trimester_ids = {trimester.code: trimester.pk
+                         for trimester in trimesters}
+
+        existing = {
+            (course.trimester_id, course.code): course
+            for course in models.Course.objects.filter(
+                trimester__student_id=student_id,
+                trimester__code__in={row.trimester for row in rows},
+            )
+        }
+        created, updated = [], []
+        for row in rows:
+            trimester_id = trimester_ids[row.trimester]
+            course = existing.get((trimester_id, row.course))
+            if course is None:
+                created.append(models.Course(
+                    trimester_id=trimester_id,
+                    code=row.course,
+                    credits=row.credits,
+                    grade=row.grade,
+                ))
+            elif (course.credits, course.grade) != (row.credits, row.grade):
+                course.credits, course.grade = row.credits, row.grade
+                updated.append(course)
+        models.Course.objects.bulk_create(created)
+        models.Course.objects.bulk_update(updated, ['credits', 'grade'])
+
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(updated)
+        self.stats['unchanged'] += len(rows) - len(created) - len(updated)
+        if created or updated:
+            models.resolve_retakes([student_id], adjust_totals=False)
+            models.rebuild_grade_totals(
+                models.Student.objects.filter(pk=student_id))
+
+
+def export_fields(averages: bool = False) -> Tuple[str, ...]:
+    """Columns of an export, with or without averages."""
+    return FIELDS + AVERAGE_FIELDS if averages else FIELDS
+
+
+def export_rows(courses: QuerySet = None, averages: bool = False,
+                chunk_size: int = 2000) -> Iterator[dict]:
+    """Yield the transcript rows of the courses, ordered by student slug,
+    trimester and course code.
+
+    Courses are fetched chunk_size at a time, so memory use does not grow
+    with the number of courses. With averages, each row also has the GPA of
+    its trimester and the CGPA as of the end of it; these are computed from
+    the courses of one student at a time as they go by.
+    """
+    if courses is None:
+        courses = models.Course.objects.all()
+    courses = (
+        courses
+        .select_related('trimester__student')
+        .order_by('trimester__student__slug', 'trimester__code', 'code')
+        .iterator(chunk_size=chunk_size)
+    )
+    if not averages:
+        for course in courses:
+            yield _export_row(course)
+        return
+
+    for _, student_courses in itertools.groupby(
+            courses, key=lambda course: course.trimester.student_id):
+        student_courses = list(student_courses)
+        entries = {
+            entry.trimester: entry
+            for entry in grading.timeline(
+                grading.Take(course.trimester.code, course.code,
+                             grading.scale_credits(course.credits),
+                             course.grade)
+                for course in student_courses
+            )
+        }
+        for course in student_courses:
+            row = _export_row(course)
+            entry = entries[course.trimester.code]
+            row['gpa'], row['cgpa'] = entry.gpa, entry.cgpa
+            yield row
+
+
+def _export_row(course: models.Course) -> dict:
+    return {
+        'nsuid': course.trimester.student.nsuid,
+        'program': course.trimester.student.program,
+        'trimester': course.trimester.code,
+        'course': course.code,
+        'credits': course.credits,
+        'grade': course.grade,
+    }
+
+
+class _Echo:
+    """File-like object returning what is written to it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def format_rows(rows: Iterator[dict], fmt: str,
+                fields: Tuple[str, ...] = FIELDS) -> Iterator[str]:
+    """Yield the lines of a transcript file holding the rows."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([row[field] for field in fields])
+    elif fmt == 'json':
+        for row in rows:
+            yield json.dumps({field: row[field] for field in fields},
+                             cls=DjangoJSONEncoder) + '\n'
+    else:
+        raise ValueError(f'Unknown transcript format: {fmt}')
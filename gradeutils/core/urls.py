@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path(
@@ -8,6 +8,16 @@ urlpatterns = [
         views.Index.as_view(),
         name='index',
     ),
+    path(
+        'cache-stats/',
+        views.cache_stats,
+        name='cache-stats',
+    ),
+    path(
+        'export/',
+        views.export_transcripts,
+        name='transcript-export',
+    ),
     path(
         'students/',
         views.StudentList.as_view(),
@@ -23,9 +33,64 @@ urlpatterns = [
         views.StudentDetail.as_view(),
         name='student-detail',
     ),
+    path(
+        'students/<slug:slug>/timeline/',
+        views.StudentTimeline.as_view(),
+        name='student-timeline',
+    ),
+    path(
+        'students/<slug:slug>/planner/',
+        views.StudentPlanner.as_view(),
+        name='student-planner',
+    ),
     path(
         'students/<slug:slug>/new-trimester/',
         views.TrimesterCreate.as_view(),
         name='trimester-create',
     ),
+    path(
+        'students/<slug:slug>/enter-trimester/',
+        views.TrimesterEntry.as_view(),
+        name='trimester-entry',
+    ),
+    path(
+        'programs/',
+        views.ProgramList.as_view(),
+        name='program-list',
+    ),
+    path(
+        'programs/<str:program>/',
+        views.ProgramDetail.as_view(),
+        name='program-detail',
+    ),
+    path(
+        'api/students/',
+        api.StudentSummaries.as_view(),
+        name='api-student-summaries',
+    ),
+    path(
+        'api/students/<slug:slug>/transcript/',
+        api.StudentTranscript.as_view(),
+        name='api-student-transcript',
+    ),
+    path(
+        'api/students/<slug:slug>/rank/',
+        api.StudentRankDetail.as_view(),
+        name='api-student-rank',
+    ),
+    path(
+        'api/students/<slug:slug>/plan/',
+        api.StudentPlan.as_view(),
+        name='api-student-plan',
+    ),
+    path(
+        'api/students/<slug:slug>/trimesters/',
+        api.TrimesterEntry.as_view(),
+        name='api-trimester-entry',
+    ),
+    path(
+        'api/programs/<str:program>/',
+        api.ProgramDistribution.as_view(),
+        name='api-program-distribution',
+    ),
 ]
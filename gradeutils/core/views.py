@@ -1,9 +1,15 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+
 from django import http
-from django.db.models import Max
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, Q
 from django.urls import reverse, reverse_lazy
 from django.views import generic
 
-from . import forms, models
+from . import analytics, cache, forms, models, transcripts
 
 
 class Index(generic.RedirectView):
@@ -12,11 +18,70 @@ class Index(generic.RedirectView):
     pattern_name = 'student-list'
 
 
-class StudentList(generic.ListView):
-    """Render a list of Student references."""
+class StudentList(cache.CachedResponseMixin, generic.ListView):
+    """Render a list of Student references, a page at a time.
+
+    Pages are sought by the sort key of the last student of the previous
+    page (the `after` parameter) instead of by offset, so every page costs
+    the same however far into the list it is.
+    """
 
     model = models.Student
     template_name = 'core/student_list.html'
+    context_object_name = 'student_list'
+    page_size = 50
+
+    def cache_key(self):
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return cache.versioned_key(f'student-list:{path}', cache.STUDENT_LIST)
+
+    def get_queryset(self):
+        self.form = forms.StudentFilterForm(self.request.GET)
+        options = self.form.cleaned_data if self.form.is_valid() else {}
+        self.sort = options.get('sort') or 'nsuid'
+
+        students = super().get_queryset()
+        if options.get('q'):
+            students = students.with_nsuid_prefix(options['q'])
+        if options.get('program'):
+            students = students.filter(program=options['program'])
+
+        after = self.request.GET.get('after')
+        if self.sort == 'cgpa':
+            students = students.order_by('-stored_cgpa', 'slug')
+            cgpa, _, slug = (after or '').partition('_')
+            try:
+                cgpa = Decimal(cgpa)
+            except InvalidOperation:
+                pass
+            else:
+                students = students.filter(
+                    Q(stored_cgpa__lt=cgpa) | Q(slug__gt=slug),
+                    stored_cgpa__lte=cgpa,
+                )
+        else:
+            # Slugs start with the NSU ID, so this is the NSU ID order
+            students = students.order_by('slug')
+            if after:
+                students = students.filter(slug__gt=after)
+        return students
+
+    def get_context_data(self, **kwargs):
+        students = list(self.object_list[:self.page_size + 1])
+        page = students[:self.page_size]
+        context = super().get_context_data(object_list=page, **kwargs)
+        context['filter_form'] = self.form
+        if len(students) > self.page_size:
+            last = page[-1]
+            params = self.request.GET.copy()
+            params['after'] = (f'{last.stored_cgpa}_{last.slug}'
+                               if self.sort == 'cgpa' else last.slug)
+            context['next_page_query'] = params.urlencode()
+        if 'after' in self.request.GET:
+            params = self.request.GET.copy()
+            del params['after']
+            context['first_page_query'] = params.urlencode()
+        return context
 
 
 class StudentCreate(generic.CreateView):
@@ -34,29 +99,149 @@ class StudentDetail(generic.DetailView):
     model = models.Student
     template_name = 'core/student_detail.html'
 
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related(
+            Prefetch(
+                'trimesters',
+                queryset=models.Trimester.objects.order_by('code'),
+            ),
+            'trimesters__courses',
+        )
+
+    def get_object(self, queryset=None):
+        # The student's computed data is cached, but not the rendered page,
+        # which holds a per-user CSRF token
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        self.summary = cache.get_or_set(
+            cache.versioned_key(f'student-detail:{slug}',
+                                cache.student_version(slug)),
+            lambda: self.summarize(super(StudentDetail, self).get_object(
+                queryset)),
+        )
+        return self.summary['student']
+
+    @staticmethod
+    def summarize(student: models.Student) -> dict:
+        trimesters = list(student.trimesters.all())
+        summary = {
+            'next_trimester_code': (
+                models.Trimester.next_code(trimesters[-1].code)
+                if trimesters else None
+            ),
+            'timeline': student.timeline(),
+        }
+        # Prefetched rows are not needed once summarized
+        student._prefetched_objects_cache = {}
+        summary['student'] = student
+        return summary
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        student = self.get_object()
-        last_trimester_code = (
-            student.trimesters
-            .aggregate(last_trimester_code=Max('code'))
-            .get('last_trimester_code', None)
-        )
-        if last_trimester_code:
-            next_trimester_code = (
-                last_trimester_code + 1
-                if last_trimester_code % 10 < 3
-                else (last_trimester_code // 10 + 1) * 10 + 1
-            )
-        else:
-            next_trimester_code = None
-        context['next_trimester_code'] = next_trimester_code
+        student = self.object
+        context['next_trimester_code'] = self.summary['next_trimester_code']
+        context['timeline'] = self.summary['timeline']
         data = {'student': student}
         trimester_form = forms.TrimesterCreateForm(initial=data)
         context['trimester_form'] = trimester_form
         return context
 
 
+class StudentPlanner(generic.DetailView):
+    """Render a form planning a Student's next trimester, and the grades
+    needed to reach the target CGPA given."""
+
+    model = models.Student
+    template_name = 'core/student_planner.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = forms.PlannerForm(self.request.GET or None)
+        context['form'] = form
+        if form.is_valid():
+            courses = form.cleaned_data['courses']
+            try:
+                context['plan'] = self.object.plan(
+                    courses, form.cleaned_data['target'])
+            except ValueError as error:
+                form.add_error('courses', str(error))
+            else:
+                context['open_courses'] = [
+                    course.code for course in courses if course.grade is None]
+        return context
+
+
+class TrimesterEntry(generic.detail.SingleObjectMixin, generic.TemplateView):
+    """Render and handle a form entering a whole trimester of a Student
+    at once, all its courses included."""
+
+    model = models.Student
+    template_name = 'core/trimester_entry.html'
+
+    def get(self, request, **kwargs):
+        self.object = self.get_object()
+        trimesters = self.object.trimesters.order_by('-code').values_list(
+            'code', flat=True)[:1]
+        return self.render_to_response(self.get_context_data(
+            trimester_form=forms.TrimesterEntryForm(
+                student=self.object,
+                initial={'code': models.Trimester.next_code(trimesters[0])
+                         if trimesters else None},
+            ),
+            course_formset=forms.CourseEntryFormSet(),
+        ))
+
+    def post(self, request, **kwargs):
+        self.object = student = self.get_object()
+        trimester_form = forms.TrimesterEntryForm(request.POST,
+                                                  student=student)
+        course_formset = forms.CourseEntryFormSet(request.POST)
+        if not (trimester_form.is_valid() and course_formset.is_valid()):
+            return self.render_to_response(self.get_context_data(
+                trimester_form=trimester_form,
+                course_formset=course_formset,
+            ))
+        try:
+            trimester = models.enter_trimester(
+                student, trimester_form.cleaned_data['code'],
+                course_formset.courses)
+        except ValidationError as error:
+            trimester_form.add_error(None, error)
+            return self.render_to_response(self.get_context_data(
+                trimester_form=trimester_form,
+                course_formset=course_formset,
+            ), status=400)
+        timeline = student.timeline()
+        entry = next(entry for entry in timeline
+                     if entry.trimester == trimester.code)
+        messages.success(
+            request,
+            f'Trimester {trimester.code} entered: GPA {entry.gpa}, '
+            f'CGPA {timeline[-1].cgpa}',
+        )
+        return http.HttpResponseRedirect(student.get_absolute_url())
+
+
+class StudentTimeline(cache.CachedResponseMixin,
+                      generic.detail.SingleObjectMixin, generic.View):
+    """Return the term-by-term progression of a Student as JSON."""
+
+    model = models.Student
+
+    def cache_key(self):
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        return cache.versioned_key(f'student-timeline:{slug}',
+                                   cache.student_version(slug))
+
+    def get(self, request, **kwargs):
+        student = self.get_object()
+        return http.JsonResponse({
+            'student': student.slug,
+            'timeline': [
+                entry._asdict() for entry in student.timeline()
+            ],
+        })
+
+
 class TrimesterCreate(generic.View):
     """Handle POST requests for trimester creation."""
 
@@ -85,3 +270,83 @@ class TrimesterCreate(generic.View):
 
     def put(self, *args, **kwargs):
         self.post(*args, **kwargs)
+
+
+@staff_member_required
+def cache_stats(request):
+    """Return the hit and miss counts of the cache as JSON."""
+    return http.JsonResponse(cache.stats())
+
+
+@staff_member_required
+def export_transcripts(request):
+    """Stream every transcript row, optionally of a single program only.
+
+    The `format` parameter is csv (the default) or json, and `averages`
+    adds GPA and CGPA columns when set.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in transcripts.FORMATS:
+        return http.HttpResponseBadRequest(f'Unknown format: {fmt}')
+    averages = bool(request.GET.get('averages'))
+    courses = models.Course.objects.all()
+    if request.GET.get('program'):
+        courses = courses.filter(
+            trimester__student__program=request.GET['program'])
+
+    response = http.StreamingHttpResponse(
+        transcripts.format_rows(
+            transcripts.export_rows(courses, averages=averages),
+            fmt,
+            transcripts.export_fields(averages),
+        ),
+        content_type=transcripts.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="transcripts.{fmt}"')
+    return response
+
+
+class ProgramList(generic.TemplateView):
+    """Render the CGPA summaries of all programs."""
+
+    template_name = 'core/program_list.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        analytics.refresh_missing()
+        context['summaries'] = models.ProgramSummary.objects.order_by(
+            'program')
+        return context
+
+
+class ProgramDetail(cache.CachedResponseMixin, generic.TemplateView):
+    """Render the CGPA distribution and top students of a program."""
+
+    template_name = 'core/program_detail.html'
+    top_size = 10
+    max_top_size = 100
+
+    def cache_key(self):
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return cache.versioned_key(f'program-detail:{path}',
+                                   cache.STUDENT_LIST)
+
+    def get_context_data(self, program, **kwargs):
+        if program not in dict(models.Student.PROGRAM_CHOICES):
+            raise http.Http404(f'No program {program}')
+        try:
+            n = max(1, min(int(self.request.GET.get('top', self.top_size)),
+                           self.max_top_size))
+        except ValueError:
+            n = self.top_size
+        context = super().get_context_data(**kwargs)
+        context['summary'] = analytics.summary(program)
+        context['histogram'] = histogram = analytics.histogram(program)
+        most = max(bucket.students for bucket in histogram)
+        context['bars'] = [
+            (bucket, 100 * bucket.students // most if most else 0)
+            for bucket in histogram
+        ]
+        context['top'] = analytics.top(program, n)
+        return context
@@ -0,0 +1,210 @@
+"""Grade point computations, independent of Django.
+
+Grade points are held as integer hundredths and credits as integer tenths,
+so quality points (credits times grade point) are integer thousandths and
+all sums are exact. Averages are rounded half to even to hundredths, which
+is what quantizing the equivalent Decimal division to two places gives.
+
+This module can be imported and used without setting up Django.
+"""
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+Number = Union[int, float, Decimal, str]
+
+# Grade points in hundredths, or None for grades left out of averages
+GRADE_POINTS: Dict[str, Optional[int]] = {
+    'A': 400,
+    'A-': 370,
+    'B+': 330,
+    'B': 300,
+    'B-': 270,
+    'C+': 230,
+    'C': 200,
+    'C-': 170,
+    'D+': 130,
+    'D': 100,
+    'F': 0,
+    'W': None,
+    'I': None,
+}
+
+UNGRADED = tuple(grade for grade, point in GRADE_POINTS.items()
+                 if point is None)
+
+
+class Take(NamedTuple):
+    """A course taken in a trimester, with its credits in tenths."""
+
+    trimester: int
+    code: str
+    credits: int
+    grade: str
+
+
+def grade_point(grade: str) -> Optional[int]:
+    """Grade point of a grade in hundredths, or None if it has none."""
+    return GRADE_POINTS.get(grade)
+
+
+def scale_credits(credits: Number) -> int:
+    """Credits in tenths."""
+    value = Decimal(str(credits) if isinstance(credits, float) else credits)
+    if not value.is_finite():
+        raise ValueError(f'Credits must be a finite number: {credits}')
+    tenths = value.scaleb(1)
+    if tenths != tenths.to_integral_value():
+        raise ValueError(f'Credits must be a multiple of 0.1: {credits}')
+    return int(tenths)
+
+
+def passed(grade: str) -> bool:
+    """Whether credits are earned with the grade."""
+    return bool(grade_point(grade))
+
+
+def counted_totals(credits: int, grade: str) -> Tuple[int, int]:
+    """Credits (tenths) and quality points (thousandths) that a course with
+    the given credits (tenths) and grade adds to an average."""
+    point = grade_point(grade)
+    if point is None:
+        return 0, 0
+    return credits, credits * point
+
+
+def average_hundredths(quality_points: int, credits: int) -> int:
+    """Average in hundredths of the given totals, rounded half to even."""
+    if not credits:
+        return 0
+    quotient, remainder = divmod(quality_points, credits)
+    if (remainder * 2 > credits
+            or remainder * 2 == credits and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def to_decimal(hundredths: int) -> Decimal:
+    """Decimal form, to two places, of a value in hundredths."""
+    return Decimal(hundredths).scaleb(-2)
+
+
+def average(quality_points: int, credits: int) -> Decimal:
+    """Average of the given totals as a Decimal to two places."""
+    return to_decimal(average_hundredths(quality_points, credits))
+
+
+class Totals:
+    """Running credit and quality point totals of an average."""
+
+    __slots__ = ('credits', 'quality_points')
+
+    def __init__(self, credits: int = 0, quality_points: int = 0):
+        self.credits = credits
+        self.quality_points = quality_points
+
+    def __repr__(self):
+        return f'Totals({self.credits}, {self.quality_points})'
+
+    def add(self, credits: int, grade: str, sign: int = 1):
+        """Count (or with a sign of -1, uncount) a course."""
+        counted_credits, quality_points = counted_totals(credits, grade)
+        self.credits += sign * counted_credits
+        self.quality_points += sign * quality_points
+
+    @property
+    def average_hundredths(self) -> int:
+        return average_hundredths(self.quality_points, self.credits)
+
+    @property
+    def average(self) -> Decimal:
+        return average(self.quality_points, self.credits)
+
+
+def resolve_retakes(takes: Iterable[Take]) -> List[bool]:
+    """Retaken flags of a student's takes, in the order given.
+
+    A take is retaken if the same course was taken in a later trimester.
+    """
+    takes = list(takes)
+    last_taken = {}
+    for take in takes:
+        last_taken[take.code] = max(last_taken.get(take.code, take.trimester),
+                                    take.trimester)
+    return [take.trimester < last_taken[take.code] for take in takes]
+
+
+def grade_point_average(takes: Iterable[Take]) -> Decimal:
+    """GPA of the takes of a trimester."""
+    totals = Totals()
+    for take in takes:
+        totals.add(take.credits, take.grade)
+    return totals.average
+
+
+class TimelineEntry(NamedTuple):
+    """Averages and credits of a student as of the end of a trimester."""
+
+    trimester: int
+    gpa: Decimal
+    cgpa: Decimal
+    attempted_credits: Decimal
+    earned_credits: Decimal
+    total_earned_credits: Decimal
+    retakes: Tuple[str, ...]  # Codes of courses taken again this trimester
+
+
+def to_credits(tenths: int) -> Decimal:
+    """Decimal form, to one place, of credits in tenths."""
+    return Decimal(tenths).scaleb(-1)
+
+
+def timeline(takes: Iterable[Take],
+             trimesters: Iterable[int] = ()) -> List[TimelineEntry]:
+    """Term-by-term progression of a student, in a single scan.
+
+    Trimesters listed in trimesters get an entry even if they have no takes.
+    A retake replaces the earlier take of the course in the CGPA and in the
+    total earned credits from its trimester on.
+    """
+    by_trimester: Dict[int, List[Take]] = {code: [] for code in trimesters}
+    for take in takes:
+        by_trimester.setdefault(take.trimester, []).append(take)
+
+    entries = []
+    cumulative, total_earned = Totals(), 0
+    latest: Dict[str, Take] = {}  # Latest take of each course so far
+    for code in sorted(by_trimester):
+        totals, attempted, earned, retakes = Totals(), 0, 0, []
+        for take in by_trimester[code]:
+            totals.add(take.credits, take.grade)
+            attempted += take.credits
+            earned += take.credits if passed(take.grade) else 0
+            previous = latest.get(take.code)
+            if previous is not None:
+                retakes.append(take.code)
+                cumulative.add(previous.credits, previous.grade, sign=-1)
+                total_earned -= (previous.credits if passed(previous.grade)
+                                 else 0)
+            cumulative.add(take.credits, take.grade)
+            total_earned += take.credits if passed(take.grade) else 0
+            latest[take.code] = take
+        entries.append(TimelineEntry(
+            trimester=code,
+            gpa=totals.average,
+            cgpa=cumulative.average,
+            attempted_credits=to_credits(attempted),
+            earned_credits=to_credits(earned),
+            total_earned_credits=to_credits(total_earned),
+            retakes=tuple(retakes),
+        ))
+    return entries
+
+
+def cumulative_grade_point_average(takes: Iterable[Take]) -> Decimal:
+    """CGPA of all takes of a student, leaving out retaken ones."""
+    takes = list(takes)
+    totals = Totals()
+    for take, retaken in zip(takes, resolve_retakes(takes)):
+        if not retaken:
+            totals.add(take.credits, take.grade)
+    return totals.average
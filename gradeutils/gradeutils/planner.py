@@ -0,0 +1,242 @@
+"""What-if and target CGPA planning, independent of Django.
+
+A plan adds courses to a student's transcript in a coming trimester, some
+with a grade and some without. The grades of the others are searched for:
+the combinations found are the minimal ones reaching the target CGPA, ie.
+those where lowering any one grade a step would fall short of it. Planned
+courses taken before are retakes, and replace the earlier takes in the
+CGPA as in gradeutils.grading.
+
+All sums use the integer scaling of gradeutils.grading. The CGPA after the
+plan only depends on the grades through the quality points of the courses
+without one, since every graded course counts its credits whatever the
+grade, so the search is over those quality points, memoized on the course
+and the points still needed. Realistic course loads are planned in a few
+milliseconds.
+"""
+import itertools
+from decimal import Decimal
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from . import grading
+
+# Grades carrying a grade point, from the lowest
+SCALE: Tuple[Tuple[str, int], ...] = tuple(sorted(
+    ((grade, point) for grade, point in grading.GRADE_POINTS.items()
+     if point is not None),
+    key=lambda item: item[1],
+))
+
+
+class PlannedCourse(NamedTuple):
+    """A course planned for the coming trimester, with its credits in
+    tenths, and its grade or None if it is to be searched for."""
+
+    code: str
+    credits: int
+    grade: Optional[str] = None
+
+
+class Combination(NamedTuple):
+    """Grades of the planned courses without one, in order, and the
+    averages they give."""
+
+    grades: Tuple[str, ...]
+    gpa: Decimal
+    cgpa: Decimal
+
+
+class Plan(NamedTuple):
+    trimester: Optional[int]
+    cgpa: Decimal  # Before the plan
+    lowest_cgpa: Decimal  # With the lowest grade in every open course
+    highest_cgpa: Decimal  # With the highest grade in every open course
+    target: Optional[Decimal]
+    combinations: List[Combination]
+    # False if there were more combinations than the limit
+    complete: bool = True
+
+    @property
+    def reachable(self) -> bool:
+        return self.target is None or self.highest_cgpa >= self.target
+
+
+def _hundredths(value: grading.Number) -> int:
+    return int((Decimal(str(value) if isinstance(value, float) else value)
+                * 100).to_integral_value())
+
+
+def _minimal_combinations(credits: Sequence[int], needed: int,
+                          limit: int) -> Tuple[List[Tuple[int, ...]], int]:
+    """Minimal combinations of SCALE indices for courses of the given
+    credits whose quality points add up to at least needed.
+
+    Returns up to limit of them, the fewest points first, and how many
+    there are in all. A combination is minimal if lowering any grade a step
+    takes off more points than its surplus over needed, so combinations are
+    counted and listed one total at a time, the surplus telling which grades
+    each course may have.
+    """
+    count = len(credits)
+
+    def allowed(i: int, surplus: int) -> List[Tuple[int, int]]:
+        """Indices and quality points of the grades course i may have."""
+        return [
+            (grade, credits[i] * point)
+            for grade, (_, point) in enumerate(SCALE)
+            if not grade or credits[i] * (point - SCALE[grade - 1][1])
+            > surplus
+        ]
+
+    @lru_cache(maxsize=None)
+    def ways(i: int, remaining: int, surplus: int) -> int:
+        # Number of combinations of the courses from i on adding up to
+        # exactly remaining
+        if i == count:
+            return int(remaining == 0)
+        return sum(ways(i + 1, remaining - points, surplus)
+                   for _, points in allowed(i, surplus)
+                   if points <= remaining)
+
+    def combinations(i: int, remaining: int, surplus: int):
+        if i == count:
+            yield ()
+            return
+        # The grades closest to an even spread of the points first
+        even = remaining / (sum(credits[i:]) or 1)
+        for grade, points in sorted(
+                allowed(i, surplus),
+                key=lambda item: abs(item[1] / credits[i] - even)):
+            if points <= remaining and ways(i + 1, remaining - points,
+                                            surplus):
+                for grades in combinations(i + 1, remaining - points,
+                                           surplus):
+                    yield (grade,) + grades
+
+    totals = {0}
+    for course_credits in credits:
+        totals = {total + course_credits * point
+                  for total in totals for _, point in SCALE}
+    # No grade above the lowest is allowed from this surplus on
+    largest_step = max(
+        (course_credits * (point - SCALE[grade - 1][1])
+         for course_credits in credits
+         for grade, (_, point) in enumerate(SCALE) if grade),
+        default=0,
+    )
+    found, total_count = [], 0
+    for total in sorted(totals):
+        surplus = total - needed
+        if surplus < 0:
+            continue
+        if surplus >= largest_step and total:
+            break
+        number = ways(0, total, surplus)
+        total_count += number
+        if number and len(found) < limit:
+            found.extend(itertools.islice(
+                combinations(0, total, surplus), limit - len(found)))
+    return found, total_count
+
+
+def plan(takes: Iterable[grading.Take], courses: Iterable[PlannedCourse],
+         trimester: Optional[int], target: grading.Number = None,
+         limit: int = 10) -> Plan:
+    """Plan the courses for the trimester after the takes (None for a
+    student yet to take any).
+
+    With a target, the combinations of grades of the courses without one
+    reaching it are listed, the fewest quality points first, up to limit of
+    them. If every course has a grade, the single combination is the
+    outcome of the plan (if it reaches the target).
+    """
+    takes = list(takes)
+    courses = list(courses)
+    codes = [course.code for course in courses]
+    if len(set(codes)) != len(codes):
+        raise ValueError('A course is planned more than once')
+    if trimester is None and takes:
+        raise ValueError('The trimester after the transcript is needed')
+    if any(take.trimester >= trimester for take in takes):
+        raise ValueError(f'Trimester {trimester} is not after the transcript')
+    for course in courses:
+        if course.grade is not None and course.grade not in (
+                grading.GRADE_POINTS):
+            raise ValueError(f'Invalid grade: {course.grade}')
+        if course.grade is None and not course.credits:
+            # No grade of it would change the CGPA
+            raise ValueError(f'{course.code} has no credits to plan a '
+                             f'grade for')
+
+    before = grading.Totals()
+    for take, retaken in zip(takes, grading.resolve_retakes(takes)):
+        if not retaken:
+            before.add(take.credits, take.grade)
+
+    planned = [grading.Take(trimester or 0, course.code, course.credits,
+                            course.grade or SCALE[0][0])
+               for course in courses]
+    # Totals of the courses that keep counting, and of the planned ones with
+    # a grade
+    fixed, trimester_fixed = grading.Totals(), grading.Totals()
+    retaken = grading.resolve_retakes(takes + planned)
+    for take, is_retaken in zip(takes, retaken):
+        if not is_retaken:
+            fixed.add(take.credits, take.grade)
+    for course in courses:
+        if course.grade is not None:
+            fixed.add(course.credits, course.grade)
+            trimester_fixed.add(course.credits, course.grade)
+    open_credits = [course.credits for course in courses
+                    if course.grade is None]
+    credits = fixed.credits + sum(open_credits)
+    trimester_credits = trimester_fixed.credits + sum(open_credits)
+
+    def combination(grades: Tuple[int, ...]) -> Combination:
+        points = sum(credit * SCALE[grade][1]
+                     for credit, grade in zip(open_credits, grades))
+        return Combination(
+            grades=tuple(SCALE[grade][0] for grade in grades),
+            gpa=grading.average(trimester_fixed.quality_points + points,
+                                trimester_credits),
+            cgpa=grading.average(fixed.quality_points + points, credits),
+        )
+
+    highest = sum(open_credits) * SCALE[-1][1]
+    result = Plan(
+        trimester=trimester,
+        cgpa=before.average,
+        lowest_cgpa=grading.average(fixed.quality_points, credits),
+        highest_cgpa=grading.average(fixed.quality_points + highest,
+                                     credits),
+        target=None if target is None else grading.to_decimal(
+            _hundredths(target)),
+        combinations=[],
+    )
+    if not open_credits:
+        # A what-if: the outcome of the grades given
+        outcome = combination(())
+        reached = target is None or outcome.cgpa >= result.target
+        return result._replace(combinations=[outcome] if reached else [])
+    if target is None or not result.reachable:
+        return result
+
+    # Fewest quality points of the open courses reaching the target; the
+    # rounded average only grows with them
+    target_hundredths = _hundredths(target)
+    low, high = 0, highest
+    while low < high:
+        middle = (low + high) // 2
+        if grading.average_hundredths(fixed.quality_points + middle,
+                                      credits) >= target_hundredths:
+            high = middle
+        else:
+            low = middle + 1
+
+    found, total_count = _minimal_combinations(tuple(open_credits), low,
+                                               limit)
+    return result._replace(
+        combinations=[combination(grades) for grades in found],
+        complete=total_count <= limit,
+    )
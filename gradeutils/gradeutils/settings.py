@@ -1,5 +1,7 @@
 import os
 
+from . import sqlite
+
 # Django's standard settings --------------------------------------------------
 
 ALLOWED_HOSTS = []
@@ -32,6 +34,21 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = [
+    'core.routers.ReplicaRouter',
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gradeutils',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+}
+
 DEBUG = True
 
 INSTALLED_APPS = [
@@ -52,6 +69,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it times the whole request
+    'core.middleware.RequestInstrumentationMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +123,75 @@ USE_I18N = True
 USE_L10N = True
 USE_TZ = True
 
+# Tuning of the SQLite database (see gradeutils/sqlite.py); 'production'
+# enables WAL mode and persistent connections
+GRADEUTILS_SQLITE_PROFILE = 'development'
+
+# Read replicas (see core/routers.py). For SQLite file copies standing in
+# for replicas, see sqlite.file_replicas
+GRADEUTILS_REPLICATION = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': 5,
+    'FAILOVER_SECONDS': 30,
+}
+
+# Caching of student pages (see core/cache.py)
+GRADEUTILS_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+# Most students that can be requested at once from the JSON API
+GRADEUTILS_API_MAX_BATCH = 100
+
+# Request timing and SQL instrumentation (see core/middleware.py)
+GRADEUTILS_INSTRUMENTATION = {
+    'SLOW_REQUEST_MS': 500,
+    'DUPLICATE_QUERY_THRESHOLD': 5,
+    # Profiles are saved to PROFILE_DIR for requests with an X-Profile
+    # header or a profile query parameter
+    'PROFILE': DEBUG,
+    'PROFILE_DIR': os.path.join(BASE_DIR, 'profiles'),
+}
+
+# Background recomputes of derived grade data (see core/jobs.py). With
+# ASYNC, course changes are queued for the recompute_worker command instead
+# of being applied to the stored totals right away
+GRADEUTILS_RECOMPUTE = {
+    'ASYNC': False,
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+}
+
+# Binary snapshot of the gradebook for read-only lookups (see
+# core/snapshot.py), written by manage.py build_snapshot
+GRADEUTILS_SNAPSHOT = {
+    'PATH': os.path.join(BASE_DIR, 'snapshots', 'gradebook.snapshot'),
+    'CHECK_INTERVAL': 1,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'core.jobs': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # 3rd party settings ----------------------------------------------------------
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
@@ -114,3 +203,10 @@ try:
     from .local_settings import *
 except ImportError:
     pass
+
+# Persistent SQLite connections as in the profile, unless set above or in
+# local_settings.py
+for _database in DATABASES.values():
+    if _database['ENGINE'] == 'django.db.backends.sqlite3':
+        _database.setdefault('CONN_MAX_AGE',
+                             sqlite.conn_max_age(GRADEUTILS_SQLITE_PROFILE))
@@ -0,0 +1,138 @@
+"""Tuning profiles of SQLite databases.
+
+A profile sets the PRAGMAs run on every new SQLite connection, and the
+CONN_MAX_AGE of the databases that do not set their own. The profile is
+chosen with the GRADEUTILS_SQLITE_PROFILE setting, by name or as a dict of
+the same form, eg. in local_settings.py:
+
+    GRADEUTILS_SQLITE_PROFILE = 'production'
+
+It also sets up copies of an SQLite database as read-only stand-ins for
+replicas (see core/routers.py), refreshed with manage.py sync_replicas.
+"""
+import os
+import sqlite3
+import tempfile
+from typing import Dict, Union
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+PROFILES = {
+    # SQLite's own defaults
+    'development': {
+        'PRAGMAS': {
+            'journal_mode': 'delete',
+        },
+        'CONN_MAX_AGE': 0,
+    },
+    # Readers are not blocked by writers in WAL mode, and with synchronous
+    # NORMAL commits are durable once checkpointed, which WAL keeps safe
+    'production': {
+        'PRAGMAS': {
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'cache_size': -64000,  # KiB, when negative
+            'mmap_size': 268435456,
+            'busy_timeout': 5000,  # ms
+        },
+        'CONN_MAX_AGE': 600,
+    },
+}
+
+PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+           'busy_timeout', 'temp_store')
+
+
+def get_profile(profile: Union[str, dict] = None) -> dict:
+    """A profile by name, or the one of the settings."""
+    if profile is None:
+        profile = getattr(settings, 'GRADEUTILS_SQLITE_PROFILE',
+                          'development')
+    if isinstance(profile, str):
+        return PROFILES[profile]
+    return profile
+
+
+def conn_max_age(profile: Union[str, dict] = None) -> int:
+    return get_profile(profile).get('CONN_MAX_AGE', 0)
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Run the PRAGMAs of the profile on a new SQLite connection.
+
+    Connected to the connection_created signal.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_profile().get('PRAGMAS', {})
+    read_only = is_read_only(connection.settings_dict)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name not in PRAGMAS:
+                raise ValueError(f'Unsupported SQLite PRAGMA: {name}')
+            if name == 'journal_mode' and read_only:
+                # Needs to write to the database file
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def database_path(database: dict) -> str:
+    """Path of the file of an SQLite database, given its settings."""
+    name = str(database['NAME'])
+    return urlsplit(name).path if name.startswith('file:') else name
+
+
+def is_read_only(database: dict) -> bool:
+    return 'mode=ro' in urlsplit(str(database['NAME'])).query
+
+
+def file_replicas(primary: dict, count: int = 1,
+                  directory: str = None) -> Dict[str, dict]:
+    """Settings of read-only file copies of an SQLite database, standing in
+    for replicas, eg. in local_settings.py:
+
+        REPLICAS = sqlite.file_replicas(DATABASES['default'], 2)
+        DATABASES.update(REPLICAS)
+        GRADEUTILS_REPLICATION = {'REPLICAS': list(REPLICAS)}
+
+    The copies are named after the primary's file, in the same directory
+    unless another one is given.
+    """
+    path = database_path(primary)
+    directory = directory or os.path.dirname(path)
+    root, extension = os.path.splitext(os.path.basename(path))
+    replicas = {}
+    for number in range(1, count + 1):
+        copy = os.path.join(directory, f'{root}-replica{number}{extension}')
+        replicas[f'replica{number}'] = {
+            **primary,
+            'NAME': f'file:{copy}?mode=ro',
+            'OPTIONS': {**primary.get('OPTIONS', {}), 'uri': True},
+            'TEST': {'MIRROR': 'default'},
+        }
+    return replicas
+
+
+def copy_database(source: str, target: str):
+    """Copy a live SQLite database file, replacing the target atomically.
+
+    The copy is made with SQLite's backup API, so it is consistent even
+    while the source is written to, and is left in rollback journal mode so
+    that it can be opened read-only.
+    """
+    handle, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(target)), suffix='.tmp')
+    os.close(handle)
+    try:
+        origin, copy = sqlite3.connect(source), sqlite3.connect(temporary)
+        try:
+            origin.backup(copy)
+            copy.execute('PRAGMA journal_mode = delete')
+        finally:
+            origin.close()
+            copy.close()
+        os.replace(temporary, target)
+    except BaseException:
+        os.remove(temporary)
+        raise